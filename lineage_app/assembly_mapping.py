@@ -0,0 +1,317 @@
+""" Precompiled assembly mapping data for remapping SNPs between builds.
+
+Assembly mapping data from `lineage` is converted once (see the ``build_assembly_mapping``
+management command) to uncompressed NumPy arrays per chromosome so that remaps can memory map
+the mappings instead of downloading and parsing JSON for every remap.
+"""
+
+import logging
+import os
+import shutil
+
+from django.conf import settings
+from lineage import Lineage
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# assembly mappings used to merge SNPs (to GRCh37) and to generate other builds (from GRCh37)
+ASSEMBLY_MAPPINGS = [
+    ("NCBI36", "GRCh37"),
+    ("GRCh38", "GRCh37"),
+    ("GRCh37", "NCBI36"),
+    ("GRCh37", "GRCh38"),
+]
+
+MAPPING_DTYPE = np.dtype(
+    [
+        ("orig_start", np.int64),
+        ("orig_end", np.int64),
+        ("mapped_start", np.int64),
+        ("mapped_end", np.int64),
+        ("strand", np.int8),
+    ]
+)
+
+COMPLEMENT = str.maketrans("ACGT", "TGCA")
+
+
+def get_assembly(build):
+    """ Get the name of an assembly.
+
+    Parameters
+    ----------
+    build : {'NCBI36', 'GRCh37', 'GRCh38', 36, 37, 38}
+
+    Returns
+    -------
+    str
+        assembly name if valid, else None
+    """
+    if build in ["NCBI36", 36]:
+        return "NCBI36"
+    elif build in ["GRCh37", "GRCh38", 37, 38]:
+        return "GRCh" + str(build)[-2:]
+    else:
+        return None
+
+
+def get_assembly_mapping_path(source_assembly, target_assembly, mapping_dir=None):
+    if mapping_dir is None:
+        mapping_dir = settings.ASSEMBLY_MAPPING_DIR
+
+    return os.path.join(mapping_dir, source_assembly + "_" + target_assembly)
+
+
+def save_assembly_mapping(assembly_mapping_data, path):
+    """ Save assembly mapping data as arrays of mappings per chromosome.
+
+    Mappings that `lineage` would skip (i.e., between chromosomes or between regions of
+    different lengths) are dropped; the order of the remaining mappings is preserved.
+
+    Parameters
+    ----------
+    assembly_mapping_data : dict
+        assembly mapping data returned by `Resources.get_assembly_mapping_data`
+    path : str
+        path to assembly mapping directory
+    """
+    temp = path + ".tmp"
+    shutil.rmtree(temp, ignore_errors=True)
+    os.makedirs(temp)
+
+    for chrom, mappings in assembly_mapping_data.items():
+        rows = []
+        for mapping in mappings["mappings"]:
+            orig = mapping["original"]
+            mapped = mapping["mapped"]
+
+            if orig["seq_region_name"] != mapped["seq_region_name"]:
+                continue
+
+            if orig["end"] - orig["start"] != mapped["end"] - mapped["start"]:
+                continue
+
+            rows.append(
+                (
+                    orig["start"],
+                    orig["end"],
+                    mapped["start"],
+                    mapped["end"],
+                    mapped["strand"],
+                )
+            )
+
+        np.save(os.path.join(temp, chrom + ".npy"), np.array(rows, dtype=MAPPING_DTYPE))
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.rename(temp, path)
+
+
+def load_assembly_mapping(source_assembly, target_assembly, mapping_dir=None):
+    """ Load assembly mapping data saved with `save_assembly_mapping`.
+
+    Parameters
+    ----------
+    source_assembly : {'NCBI36', 'GRCh37', 'GRCh38'}
+    target_assembly : {'NCBI36', 'GRCh37', 'GRCh38'}
+    mapping_dir : str
+        path to directory of assembly mappings; defaults to `ASSEMBLY_MAPPING_DIR`
+
+    Returns
+    -------
+    dict
+        chromosome to memory-mapped mappings if the assembly mapping exists, else None
+    """
+    path = get_assembly_mapping_path(source_assembly, target_assembly, mapping_dir)
+    if not os.path.isdir(path):
+        return None
+
+    return {
+        os.path.splitext(filename)[0]: np.load(
+            os.path.join(path, filename), mmap_mode="r"
+        )
+        for filename in os.listdir(path)
+        if filename.endswith(".npy")
+    }
+
+
+def remap_positions(pos, mappings):
+    """ Remap the positions of SNPs on a chromosome.
+
+    This is equivalent to `Lineage._remapper`: each SNP is remapped by the first mapping (in
+    order) that contains it, and mappings outside of the range of SNP positions are ignored.
+
+    Parameters
+    ----------
+    pos : numpy.ndarray
+        positions of SNPs
+    mappings : numpy.ndarray
+        mappings for the chromosome (see `MAPPING_DTYPE`)
+
+    Returns
+    -------
+    pos : numpy.ndarray
+        remapped positions
+    minus_strand : numpy.ndarray
+        bool array where SNPs were remapped to the minus strand
+    """
+    remapped_pos = pos.copy()
+    minus_strand = np.zeros(len(pos), dtype=bool)
+
+    if len(pos) == 0:
+        return remapped_pos, minus_strand
+
+    mappings = mappings[
+        (mappings["orig_end"] > pos.min()) & (mappings["orig_start"] < pos.max())
+    ]
+
+    orig_start = mappings["orig_start"]
+    orig_end = mappings["orig_end"]
+
+    if np.all(orig_start[1:] > orig_end[:-1]):
+        # mappings are sorted and disjoint, so each SNP is contained in at most one mapping
+        ix = np.searchsorted(orig_start, pos, side="right") - 1
+        in_mapping = ix >= 0
+        in_mapping[in_mapping] = pos[in_mapping] <= orig_end[ix[in_mapping]]
+        snp_ix = np.flatnonzero(in_mapping)
+        mapping_ix = ix[in_mapping]
+    else:
+        remapped = np.zeros(len(pos), dtype=bool)
+        snp_ixs = []
+        mapping_ixs = []
+        for i in range(len(mappings)):
+            contained = np.flatnonzero(
+                ~remapped & (pos >= orig_start[i]) & (pos <= orig_end[i])
+            )
+            remapped[contained] = True
+            snp_ixs.append(contained)
+            mapping_ixs.append(np.full(len(contained), i))
+        snp_ix = np.concatenate(snp_ixs) if snp_ixs else np.zeros(0, dtype=np.intp)
+        mapping_ix = (
+            np.concatenate(mapping_ixs) if mapping_ixs else np.zeros(0, dtype=np.intp)
+        )
+
+    m = mappings[mapping_ix]
+    minus = m["strand"] == -1
+
+    # flip since we're mapping to minus strand
+    remapped_pos[snp_ix[minus]] = m["mapped_end"][minus] - (
+        pos[snp_ix[minus]] - m["orig_start"][minus]
+    )
+    # mapping is on same (plus) strand, so just remap based on offset
+    remapped_pos[snp_ix[~minus]] = pos[snp_ix[~minus]] + (
+        m["mapped_start"][~minus] - m["orig_start"][~minus]
+    )
+    minus_strand[snp_ix[minus]] = True
+
+    return remapped_pos, minus_strand
+
+
+def remap_snps(individual, target_assembly, complement_bases=True, mapping_dir=None):
+    """ Remap the SNP coordinates of an individual from one assembly to another.
+
+    Drop-in replacement for `Lineage.remap_snps`; see that method for details. If the
+    precompiled assembly mapping hasn't been built, `lineage` is used to remap the SNPs.
+
+    Parameters
+    ----------
+    individual : Individual
+    target_assembly : {'NCBI36', 'GRCh37', 'GRCh38', 36, 37, 38}
+        assembly to remap to
+    complement_bases : bool
+        complement bases when remapping SNPs to the minus strand
+    mapping_dir : str
+        path to directory of assembly mappings; defaults to `ASSEMBLY_MAPPING_DIR`
+
+    Returns
+    -------
+    chromosomes_remapped : list of str
+        chromosomes remapped; empty if None
+    chromosomes_not_remapped : list of str
+        chromosomes not remapped; empty if None
+    """
+    chromosomes_remapped = []
+    chromosomes_not_remapped = []
+
+    snps = individual.snps
+
+    if snps is None:
+        return chromosomes_remapped, chromosomes_not_remapped
+
+    codes, chromosomes = pd.factorize(snps["chrom"])
+    chromosomes_not_remapped = list(chromosomes)
+
+    source_assembly = get_assembly(individual.build)
+    target_assembly = get_assembly(target_assembly)
+
+    if target_assembly is None or source_assembly == target_assembly:
+        return chromosomes_remapped, chromosomes_not_remapped
+
+    assembly_mapping = load_assembly_mapping(
+        source_assembly, target_assembly, mapping_dir
+    )
+
+    if assembly_mapping is None:
+        logger.warning(
+            "Assembly mapping {}_{} not built; remapping with lineage".format(
+                source_assembly, target_assembly
+            )
+        )
+        l = Lineage(resources_dir=settings.LINEAGE_RESOURCES_DIR, parallelize=False)
+        return l.remap_snps(individual, target_assembly, complement_bases)
+
+    pos = snps["pos"].values.astype(np.int64)
+    minus_strand = np.zeros(len(snps), dtype=bool)
+    keep = np.ones(len(snps), dtype=bool)
+
+    for code, chrom in enumerate(chromosomes):
+        ix = np.flatnonzero(codes == code)
+
+        if chrom in assembly_mapping:
+            chromosomes_remapped.append(chrom)
+            chromosomes_not_remapped.remove(chrom)
+            pos[ix], minus_strand[ix] = remap_positions(
+                pos[ix], assembly_mapping[chrom]
+            )
+        else:
+            logger.info(
+                "Chromosome {} not remapped; "
+                "removing chromosome from SNPs for consistency".format(chrom)
+            )
+            keep[ix] = False
+
+    genotype = snps["genotype"].values.copy()
+    if complement_bases:
+        genotype[minus_strand] = (
+            pd.Series(genotype[minus_strand], dtype=object)
+            .str.translate(COMPLEMENT)
+            .values
+        )
+
+    snps = snps.assign(pos=pos, genotype=genotype).loc[keep]
+
+    individual._set_snps(snps, int(target_assembly[-2:]))
+
+    return chromosomes_remapped, chromosomes_not_remapped
+
+
+def remap_snps_to_GRCh37(individuals, mapping_dir=None):
+    """ Remap individuals to GRCh37 if necessary.
+
+    Drop-in replacement for `Lineage._remap_snps_to_GRCh37`.
+
+    Parameters
+    ----------
+    individuals : list of Individual
+        individuals to remap; None is ignored
+    mapping_dir : str
+        path to directory of assembly mappings; defaults to `ASSEMBLY_MAPPING_DIR`
+    """
+    for ind in individuals:
+        if ind is None:
+            continue
+
+        remap_snps(ind, 37, mapping_dir=mapping_dir)
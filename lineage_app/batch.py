@@ -0,0 +1,90 @@
+""" Shared DNA of many pairs of individuals in one task.
+
+The genotypes of each individual are loaded once (sliced from the user's cohort where it's
+current), then pairs are spread across a pool of worker processes. Workers are forked after the
+genotypes are loaded, so they share the genotypes instead of each loading them again.
+"""
+
+import logging
+
+from billiard import Pool
+from django.conf import settings
+from django.db import connections
+
+from .cohort import load_cohort
+from .models import SharedDnaGenes
+from .workspace import workspace
+
+logger = logging.getLogger(__name__)
+
+# `Snps` ID to packed genotypes of the batch in progress; inherited by forked workers
+_genotypes = {}
+
+
+def _find_shared_dna_genes(shared_dna_genes_id):
+    try:
+        shared_dna_genes = SharedDnaGenes.objects.get(id=shared_dna_genes_id)
+    except SharedDnaGenes.DoesNotExist:
+        # deleted while the batch was in progress
+        return
+
+    try:
+        shared_dna_genes.find_shared_dna_genes(genotypes=_genotypes)
+    except Exception as err:
+        # the other pairs of the batch are still compared; this pair can be submitted again
+        logger.error(err)
+        shared_dna_genes.delete()
+
+
+def find_all_shared_dna_genes(shared_dna_genes_all, progress_recorder=None):
+    """ Find the shared DNA and genes of many pairs of individuals.
+
+    Parameters
+    ----------
+    shared_dna_genes_all : list of SharedDnaGenes
+        pairs of individuals to compare
+    progress_recorder : ProgressRecorder
+    """
+    ids = [shared_dna_genes.id for shared_dna_genes in shared_dna_genes_all]
+
+    individuals = {}
+    for shared_dna_genes in shared_dna_genes_all:
+        for individual in [shared_dna_genes.individual1, shared_dna_genes.individual2]:
+            individuals[individual.pk] = individual
+
+    cohorts = {}
+
+    try:
+        with workspace() as tmpdir:
+            for individual in individuals.values():
+                snps = individual.get_canonical_snps()
+                if snps and snps.id not in _genotypes:
+                    if individual.user_id not in cohorts:
+                        cohorts[individual.user_id] = load_cohort(individual.user.uuid)
+
+                    try:
+                        _genotypes[snps.id] = snps.get_packed_genotypes(
+                            tmpdir, cohorts[individual.user_id]
+                        )
+                    except Exception as err:
+                        # pairs of this individual load its genotypes, and fail, alone
+                        logger.error(err)
+
+        processes = min(settings.SHARED_DNA_PROCESSES, len(ids))
+        if processes > 1:
+            # workers can't share the database connections of this process
+            connections.close_all()
+
+            # billiard (unlike multiprocessing) can start a pool from a Celery worker
+            with Pool(processes) as p:
+                results = p.imap_unordered(_find_shared_dna_genes, ids)
+                for i, _ in enumerate(results, 1):
+                    if progress_recorder:
+                        progress_recorder.set_progress(i, len(ids))
+        else:
+            for i, shared_dna_genes_id in enumerate(ids, 1):
+                _find_shared_dna_genes(shared_dna_genes_id)
+                if progress_recorder:
+                    progress_recorder.set_progress(i, len(ids))
+    finally:
+        _genotypes.clear()
@@ -0,0 +1,189 @@
+""" SNPs remapped to other builds on demand.
+
+Merged SNPs are only stored in GRCh37. SNPs in another build are made when they're first needed
+(e.g., downloaded or uploaded to Open Humans) and kept in a cache under `REMAP_CACHE_DIR`, keyed
+by the SHA-256 of the source SNPs file and the target build. The cache is bounded to
+`REMAP_CACHE_SIZE` bytes by evicting the least recently used files.
+"""
+
+import os
+
+from billiard import Pool
+from django.conf import settings
+from lineage import Lineage
+
+from .assembly_mapping import remap_snps
+from .genotypes import create_individual
+from .workspace import publish, workspace
+
+ASSEMBLIES = {36: "NCBI36", 37: "GRCh37", 38: "GRCh38"}
+
+# builds that merged SNPs are remapped to on demand
+REMAPPED_BUILDS = [36, 38]
+
+
+def get_cache_path(sha256, build):
+    return os.path.join(
+        settings.REMAP_CACHE_DIR,
+        sha256[:2],
+        "{}_{}.csv".format(sha256, ASSEMBLIES[build]),
+    )
+
+
+def remap_genotypes(task):
+    """ Remap canonical genotypes to another build.
+
+    This is a module-level function so that builds can be remapped in worker processes.
+
+    Parameters
+    ----------
+    task : dict
+        target `build`, `genotypes_path` of the canonical genotypes to remap, and
+        `output_dir` for the remapped SNPs
+
+    Returns
+    -------
+    build : int
+        target build of `task`
+    file : str
+        path to remapped SNPs file if SNPs were saved, else empty str
+    """
+    l = Lineage(output_dir=task["output_dir"], parallelize=False)
+
+    ind = create_individual(
+        l, "lineage_" + ASSEMBLIES[task["build"]], task["genotypes_path"]
+    )
+    remap_snps(ind, task["build"])
+
+    return task["build"], ind.save_snps()
+
+
+def get_cached_remapped_snps(sha256, build):
+    """ Get SNPs remapped to another build if they're cached.
+
+    Parameters
+    ----------
+    sha256 : str
+        SHA-256 of the source SNPs file
+    build : int
+        build remapped to
+
+    Returns
+    -------
+    str
+        path to remapped SNPs file in the cache if cached, else None
+    """
+    path = get_cache_path(sha256, build)
+    try:
+        # mark as recently used
+        os.utime(path)
+        return path
+    except FileNotFoundError:
+        return None
+
+
+def get_remapped_snps(sha256, genotypes_path, builds):
+    """ Get SNPs remapped to other builds, remapping SNPs that aren't cached.
+
+    Parameters
+    ----------
+    sha256 : str
+        SHA-256 of the source SNPs file
+    genotypes_path : str
+        path to canonical genotypes of the source SNPs
+    builds : list of int
+        builds to remap to
+
+    Returns
+    -------
+    dict
+        build to path of remapped SNPs file in the cache, or None if SNPs couldn't be
+        remapped
+    """
+    paths = {}
+    tasks = []
+
+    for build in builds:
+        path = get_cached_remapped_snps(sha256, build)
+        if path is not None:
+            paths[build] = path
+        else:
+            tasks.append({"build": build, "genotypes_path": genotypes_path})
+
+    if not tasks:
+        return paths
+
+    with workspace() as tmpdir:
+        for task in tasks:
+            task["output_dir"] = tmpdir
+
+        def add_remapped_snps(result):
+            build, file = result
+
+            if not file:
+                paths[build] = None
+                return
+
+            paths[build] = get_cache_path(sha256, build)
+            os.makedirs(os.path.dirname(paths[build]), exist_ok=True)
+            publish(file, paths[build])
+
+        processes = min(settings.REMAP_PROCESSES, len(tasks))
+        if processes > 1:
+            # billiard (unlike multiprocessing) can start a pool from a Celery worker
+            with Pool(processes) as p:
+                for result in p.imap_unordered(remap_genotypes, tasks):
+                    add_remapped_snps(result)
+        else:
+            for result in map(remap_genotypes, tasks):
+                add_remapped_snps(result)
+
+    evict_remapped_snps(keep=paths.values())
+
+    return paths
+
+
+def evict_remapped_snps(keep=()):
+    """ Evict the least recently used remapped SNPs until the cache is within its size.
+
+    Parameters
+    ----------
+    keep : iterable of str
+        paths to remapped SNPs files that aren't evicted (e.g., files about to be served)
+    """
+    entries = []
+
+    for dirpath, _, filenames in os.walk(settings.REMAP_CACHE_DIR):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    size = sum(entry[1] for entry in entries)
+    keep = set(keep)
+
+    for _, file_size, path in sorted(entries):
+        if size <= settings.REMAP_CACHE_SIZE:
+            break
+
+        if path in keep:
+            continue
+
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+        size -= file_size
+
+
+def delete_remapped_snps(sha256):
+    """ Delete the remapped SNPs of a source SNPs file from the cache. """
+    for build in ASSEMBLIES:
+        try:
+            os.remove(get_cache_path(sha256, build))
+        except FileNotFoundError:
+            pass
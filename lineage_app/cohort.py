@@ -0,0 +1,508 @@
+""" Memory-mapped genotype matrix of the individuals of a user.
+
+A user's cohort is a matrix of the canonical genotypes (in GRCh37) of each of their individuals,
+over one index of the SNPs of all of the individuals, stored in `COHORT_DIR`. Each call is an
+int8 code, so pairwise and multi-way analyses are slices of one memory-mapped array instead of
+loads of each individual's genotypes.
+
+The cohort is updated incrementally: rows of individuals whose canonical SNPs haven't changed
+are copied, and only the genotypes of new individuals are loaded. The cohort is only a cache of
+the canonical genotypes, so each row records the SHA-256 of the SNPs it was made from.
+"""
+
+from contextlib import contextmanager
+import fcntl
+import json
+import os
+import shutil
+
+from django.conf import settings
+import numpy as np
+
+from .genotypes import encode_alleles, load_genotypes
+from .merge import sort_chromosomes
+from .packed import PackedGenotypes
+from .resources import get_genetic_map
+from .shared_dna import compute_genetic_positions
+from .workspace import publish, workspace
+
+ALLELES = b"ACGTDI"
+
+# SNP isn't in the individual's SNPs
+CODE_ABSENT = -1
+# SNP is in the individual's SNPs, but the genotype is null
+CODE_NULL = 0
+# genotype can't be encoded; it's kept as bytes
+CODE_OTHER = 127
+
+# haploid calls are coded from 1, and diploid calls after them
+_HAPLOID = 1
+_DIPLOID = _HAPLOID + len(ALLELES)
+
+# allele byte value to index in `ALLELES`; alleles that can't be encoded are -1
+_ALLELE_INDEX = np.full(256, -1, dtype=np.int16)
+_ALLELE_INDEX[np.frombuffer(ALLELES, dtype=np.uint8)] = np.arange(len(ALLELES))
+
+
+def _get_code_genotypes():
+    genotypes = np.zeros(256, dtype="S2")
+    for i, a in enumerate(ALLELES):
+        genotypes[_HAPLOID + i] = bytes([a])
+        for j, b in enumerate(ALLELES):
+            genotypes[_DIPLOID + i * len(ALLELES) + j] = bytes([a, b])
+    return genotypes
+
+
+# code (as uint8) to bytes genotype
+_CODE_GENOTYPES = _get_code_genotypes()
+
+
+def _get_code_alleles():
+    alleles = np.full((256, 2), -1, dtype=np.int8)
+    for i in range(len(ALLELES)):
+        for j in range(len(ALLELES)):
+            alleles[_DIPLOID + i * len(ALLELES) + j] = [i, j]
+    return alleles
+
+
+# code (as uint8) to indexes in `ALLELES` of the alleles of diploid calls
+_CODE_ALLELES = _get_code_alleles()
+
+
+def get_cohort_path(user_uuid):
+    return os.path.join(settings.COHORT_DIR, str(user_uuid))
+
+
+@contextmanager
+def cohort_lock(user_uuid):
+    """ Lock the cohort of a user, so that updates are made one at a time. """
+    os.makedirs(settings.COHORT_DIR, exist_ok=True)
+
+    with open(get_cohort_path(user_uuid) + ".lock", "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def encode_genotypes(genotypes):
+    """ Encode bytes genotypes as int8 codes.
+
+    Parameters
+    ----------
+    genotypes : numpy.ndarray
+        bytes genotypes (empty if null)
+
+    Returns
+    -------
+    numpy.ndarray
+        int8 codes; `CODE_OTHER` where the genotype can't be encoded
+    """
+    alleles, length = encode_alleles(genotypes)
+    i = _ALLELE_INDEX[alleles[:, 0]]
+    j = _ALLELE_INDEX[alleles[:, 1]]
+
+    codes = np.full(len(genotypes), CODE_OTHER, dtype=np.int8)
+    codes[length == 0] = CODE_NULL
+
+    haploid = (length == 1) & (i >= 0)
+    codes[haploid] = _HAPLOID + i[haploid]
+
+    diploid = (length == 2) & (i >= 0) & (j >= 0)
+    codes[diploid] = _DIPLOID + i[diploid] * len(ALLELES) + j[diploid]
+
+    return codes
+
+
+def decode_genotypes(codes):
+    """ Decode int8 codes as bytes genotypes.
+
+    Parameters
+    ----------
+    codes : numpy.ndarray
+
+    Returns
+    -------
+    numpy.ndarray
+        bytes genotypes; empty where SNPs are absent or null, or genotypes can't be encoded
+    """
+    return _CODE_GENOTYPES[np.asarray(codes).view(np.uint8)]
+
+
+def decode_alleles(codes):
+    """ Decode int8 codes as the alleles of diploid calls.
+
+    Parameters
+    ----------
+    codes : numpy.ndarray
+
+    Returns
+    -------
+    numpy.ndarray
+        indexes in `ALLELES` of the two alleles of each code (an additional last axis); -1
+        where calls aren't diploid calls of `ALLELES`
+    """
+    return _CODE_ALLELES[np.asarray(codes).view(np.uint8)]
+
+
+class Cohort:
+    """ Cohort of a user, loaded from `COHORT_DIR`.
+
+    Parameters
+    ----------
+    path : str
+        path to cohort directory
+    mmap_mode : str
+        see `numpy.load`
+
+    Attributes
+    ----------
+    individuals : list of dict
+        `individual` (UUID) and `sha256` of the canonical SNPs of each row
+    rsid : numpy.ndarray
+        bytes rsid of each column
+    chrom : numpy.ndarray
+        bytes chromosome of each column
+    pos : numpy.ndarray
+        position (in GRCh37) of each column
+    genotype : numpy.ndarray
+        (individuals, SNPs) int8 codes
+    cM : numpy.ndarray
+        genetic position of each column, or None if the genetic map wasn't available
+    """
+
+    def __init__(self, path, mmap_mode="r"):
+        # an update replaces the directory, so arrays of another version aren't mixed in
+        ino = os.stat(path).st_ino
+
+        with open(os.path.join(path, "info.json"), "r") as f:
+            self.individuals = json.load(f)["individuals"]
+
+        for name in [
+            "rsid",
+            "chrom",
+            "pos",
+            "genotype",
+            "other_row",
+            "other_col",
+            "other_genotype",
+        ]:
+            setattr(
+                self,
+                name,
+                np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode),
+            )
+
+        cM_path = os.path.join(path, "cM.npy")
+        self.cM = (
+            np.load(cM_path, mmap_mode=mmap_mode) if os.path.exists(cM_path) else None
+        )
+
+        if os.stat(path).st_ino != ino:
+            raise ValueError("cohort was updated while it was loaded")
+
+    def __len__(self):
+        return len(self.individuals)
+
+    def get_row(self, individual_uuid, sha256=None):
+        """ Get the row of an individual.
+
+        Parameters
+        ----------
+        individual_uuid : str
+        sha256 : str
+            SHA-256 of the individual's canonical SNPs; if specified, the row is only returned
+            if it was made from those SNPs
+
+        Returns
+        -------
+        int
+            row if the individual is in the cohort, else None
+        """
+        for row, individual in enumerate(self.individuals):
+            if individual["individual"] == str(individual_uuid):
+                if sha256 is None or individual["sha256"] == sha256:
+                    return row
+                break
+
+        return None
+
+    def get_cols(self, rows):
+        """ Get the SNPs that are in the SNPs of all individuals.
+
+        Parameters
+        ----------
+        rows : list of int
+
+        Returns
+        -------
+        numpy.ndarray
+            columns, in order
+        """
+        present = np.ones(self.genotype.shape[1], dtype=bool)
+        for row in rows:
+            present &= self.genotype[row] != CODE_ABSENT
+        return np.flatnonzero(present)
+
+    def get_genotypes(self, row, cols=None):
+        """ Get the bytes genotypes of an individual.
+
+        Parameters
+        ----------
+        row : int
+        cols : numpy.ndarray
+            sorted columns; all SNPs if None
+
+        Returns
+        -------
+        numpy.ndarray
+            bytes genotypes (empty if null or absent)
+        """
+        if cols is None:
+            cols = np.arange(self.genotype.shape[1])
+
+        genotype = decode_genotypes(self.genotype[row, cols])
+
+        other = np.flatnonzero(self.other_row == row)
+        if len(other):
+            genotype = genotype.astype(np.result_type(genotype, self.other_genotype))
+            ix = np.searchsorted(cols, self.other_col[other])
+            found = ix < len(cols)
+            found[found] = cols[ix[found]] == self.other_col[other[found]]
+            genotype[ix[found]] = self.other_genotype[other[found]]
+
+        return genotype
+
+    def get_packed_genotypes(self, row):
+        """ Get the packed genotypes of an individual, in the order of the cohort's SNPs.
+
+        Parameters
+        ----------
+        row : int
+
+        Returns
+        -------
+        PackedGenotypes
+        """
+        cols = self.get_cols([row])
+
+        return PackedGenotypes(
+            self.rsid[cols],
+            self.chrom[cols],
+            self.pos[cols],
+            self.get_genotypes(row, cols),
+            {"build": 37, "build_detected": False, "source": ""},
+            cM=self.cM[cols] if self.cM is not None else None,
+        )
+
+
+def load_cohort(user_uuid):
+    """ Load the cohort of a user.
+
+    Parameters
+    ----------
+    user_uuid : str
+
+    Returns
+    -------
+    Cohort
+        cohort if it exists, else None
+    """
+    try:
+        return Cohort(get_cohort_path(user_uuid))
+    except (OSError, ValueError):
+        return None
+
+
+def update_cohort(user_uuid, individuals):
+    """ Update the cohort of a user.
+
+    The cohort should be locked with `cohort_lock` while the individuals are determined and
+    the cohort is updated.
+
+    Parameters
+    ----------
+    user_uuid : str
+    individuals : list of dict
+        `individual` (UUID), `sha256`, and `genotypes_path` of the canonical SNPs (in GRCh37)
+        of each individual of the user, in order
+
+    Returns
+    -------
+    bool
+        True if the cohort was changed
+    """
+    cohort = load_cohort(user_uuid)
+    rows = [
+        {"individual": str(i["individual"]), "sha256": i["sha256"]} for i in individuals
+    ]
+
+    if cohort is None:
+        if not rows:
+            return False
+        cohort_rows = []
+    else:
+        cohort_rows = cohort.individuals
+
+    if rows == cohort_rows:
+        return False
+
+    if not rows:
+        shutil.rmtree(get_cohort_path(user_uuid), ignore_errors=True)
+        return True
+
+    # rows of the cohort that are kept
+    old_rows = [
+        cohort.get_row(row["individual"], row["sha256"]) if cohort else None
+        for row in rows
+    ]
+
+    # genotypes of new rows, and the first SNP of each rsid
+    new = {}
+    for i, old_row in enumerate(old_rows):
+        if old_row is None:
+            genotypes = load_genotypes(individuals[i]["genotypes_path"])
+            _, ix = np.unique(genotypes["rsid"], return_index=True)
+            new[i] = (genotypes, np.sort(ix))
+
+    rsid, chrom, pos, old_cols = _get_index(
+        cohort, old_rows, [new[i] for i in sorted(new)]
+    )
+
+    # map rsids to columns
+    order = np.argsort(rsid, kind="mergesort")
+    sorted_rsid = rsid[order]
+
+    def get_cols(r):
+        return order[np.searchsorted(sorted_rsid, r)]
+
+    if cohort is not None:
+        kept_cols = get_cols(cohort.rsid[old_cols])
+
+    other_row = []
+    other_col = []
+    other_genotype = []
+
+    with workspace(len(rows) * len(rsid)) as tmpdir:
+        temp = os.path.join(tmpdir, "cohort")
+        os.makedirs(temp)
+
+        np.save(os.path.join(temp, "rsid.npy"), rsid)
+        np.save(os.path.join(temp, "chrom.npy"), chrom)
+        np.save(os.path.join(temp, "pos.npy"), pos)
+
+        # genetic positions are computed once for all rows, as for canonical genotypes
+        genetic_map = get_genetic_map()
+        if genetic_map is not None:
+            np.save(
+                os.path.join(temp, "cM.npy"),
+                compute_genetic_positions(chrom.astype(str), pos, genetic_map),
+            )
+
+        genotype = np.lib.format.open_memmap(
+            os.path.join(temp, "genotype.npy"),
+            mode="w+",
+            dtype=np.int8,
+            shape=(len(rows), len(rsid)),
+        )
+
+        for row, old_row in enumerate(old_rows):
+            genotype[row] = CODE_ABSENT
+
+            if old_row is not None:
+                genotype[row, kept_cols] = cohort.genotype[old_row, old_cols]
+
+                other = np.flatnonzero(cohort.other_row == old_row)
+                other_row.append(np.full(len(other), row, dtype=np.int64))
+                other_col.append(get_cols(cohort.rsid[cohort.other_col[other]]))
+                other_genotype.append(np.array(cohort.other_genotype[other]))
+            else:
+                genotypes, ix = new[row]
+                new_genotype = genotypes["genotype"][ix]
+                codes = encode_genotypes(new_genotype)
+                cols = get_cols(genotypes["rsid"][ix])
+                genotype[row, cols] = codes
+
+                other = np.flatnonzero(codes == CODE_OTHER)
+                other_row.append(np.full(len(other), row, dtype=np.int64))
+                other_col.append(cols[other])
+                other_genotype.append(np.array(new_genotype[other]))
+
+        genotype.flush()
+        del genotype
+
+        other_row = np.concatenate(other_row)
+        other_col = np.concatenate(other_col)
+        other_genotype = np.concatenate(other_genotype).astype("S")
+
+        # sort by row and column so that other genotypes of a row can be looked up
+        order = np.lexsort((other_col, other_row))
+        np.save(os.path.join(temp, "other_row.npy"), other_row[order])
+        np.save(os.path.join(temp, "other_col.npy"), other_col[order])
+        np.save(os.path.join(temp, "other_genotype.npy"), other_genotype[order])
+
+        with open(os.path.join(temp, "info.json"), "w") as f:
+            json.dump({"individuals": rows}, f)
+
+        publish(temp, get_cohort_path(user_uuid))
+
+    return True
+
+
+def _get_index(cohort, old_rows, new):
+    """ Get the SNPs of the rows of an updated cohort.
+
+    SNPs of the cohort that are only in rows that are dropped are dropped. An rsid has the
+    chromosome and position of the first individual with the SNP (kept rows before new rows).
+
+    Returns
+    -------
+    rsid : numpy.ndarray
+    chrom : numpy.ndarray
+    pos : numpy.ndarray
+        SNPs, sorted by chromosome, position, and rsid
+    old_cols : numpy.ndarray
+        columns of the cohort that are kept
+    """
+    rsid = []
+    chrom = []
+    pos = []
+    old_cols = np.zeros(0, dtype=np.int64)
+
+    kept = [row for row in old_rows if row is not None]
+    if kept:
+        old_cols = np.flatnonzero(np.any(cohort.genotype[kept] != CODE_ABSENT, axis=0))
+        rsid.append(cohort.rsid[old_cols])
+        chrom.append(cohort.chrom[old_cols])
+        pos.append(cohort.pos[old_cols])
+
+    for genotypes, ix in new:
+        rsid.append(genotypes["rsid"][ix])
+        chrom.append(genotypes["chrom"][ix])
+        pos.append(genotypes["pos"][ix])
+
+    rsid = np.concatenate(rsid).astype("S")
+    chrom = np.concatenate(chrom).astype("S")
+    pos = np.concatenate(pos).astype(np.int64)
+
+    # keep the first occurrence of each rsid
+    _, ix = np.unique(rsid, return_index=True)
+    rsid = rsid[ix]
+    chrom = chrom[ix]
+    pos = pos[ix]
+
+    # sort chromosomes the same way as `SNPs.sort_snps`
+    uniques, inverse = np.unique(chrom, return_inverse=True)
+    chroms = sort_chromosomes([c.decode() for c in uniques])
+    rank = np.array([chroms.index(c.decode()) for c in uniques], dtype=np.int64)
+    order = np.lexsort((rsid, pos, rank[inverse]))
+
+    return rsid[order], chrom[order], pos[order], old_cols
+
+
+def delete_cohort(user_uuid):
+    shutil.rmtree(get_cohort_path(user_uuid), ignore_errors=True)
+
+    for ext in [".relatedness.npz", ".lock"]:
+        try:
+            os.remove(get_cohort_path(user_uuid) + ext)
+        except FileNotFoundError:
+            pass
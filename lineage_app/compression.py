@@ -0,0 +1,144 @@
+""" Streaming, multi-threaded gzip compression.
+
+Files are compressed like `pigz <https://zlib.net/pigz/>`_: input is read in blocks, blocks are
+deflated concurrently by a pool of threads (zlib releases the GIL), and the deflated blocks are
+written in order as one gzip member. Each block is primed with the end of the previous block, so
+the compression ratio is close to that of compressing the file in one stream. Only a bounded
+number of blocks are held in memory at a time.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import struct
+import zlib
+
+from django.conf import settings
+
+BLOCK_SIZE = 128 * 1024
+# size of the deflate window
+DICT_SIZE = 32 * 1024
+
+
+def _get_gzip_header(level):
+    if level == 9:
+        xfl = 2
+    elif level == 1:
+        xfl = 4
+    else:
+        xfl = 0
+
+    # magic, deflate, no flags, no modification time, extra flags, unknown OS
+    return b"\x1f\x8b\x08\x00" + struct.pack("<I", 0) + bytes([xfl, 255])
+
+
+def _deflate_block(block, zdict, level, last):
+    if zdict:
+        c = zlib.compressobj(
+            level,
+            zlib.DEFLATED,
+            -zlib.MAX_WBITS,
+            zlib.DEF_MEM_LEVEL,
+            zlib.Z_DEFAULT_STRATEGY,
+            zdict,
+        )
+    else:
+        c = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+
+    # sync flush aligns the block to a byte boundary so that the next block can follow it
+    return c.compress(block) + c.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+def compress_file(path_in, path_out, level=None, executor=None, threads=None):
+    """ Compress a file with gzip.
+
+    Parameters
+    ----------
+    path_in : str
+        path to file to compress
+    path_out : str
+        path to compressed file
+    level : int
+        compression level; defaults to `COMPRESSION_LEVEL`
+    executor : concurrent.futures.Executor
+        executor used to deflate blocks; if None, an executor is created for this file
+    threads : int
+        threads used to deflate blocks if `executor` is None; defaults to
+        `COMPRESSION_THREADS`
+    """
+    if level is None:
+        level = settings.COMPRESSION_LEVEL
+
+    if threads is None:
+        threads = settings.COMPRESSION_THREADS
+
+    if executor is None:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            return compress_file(path_in, path_out, level, executor, threads)
+
+    # limit the blocks held in memory
+    max_pending = 2 * threads
+
+    crc = 0
+    size = 0
+    pending = deque()
+
+    with open(path_in, "rb") as f_in, open(path_out, "wb") as f_out:
+        f_out.write(_get_gzip_header(level))
+
+        zdict = b""
+        block = f_in.read(BLOCK_SIZE)
+
+        while True:
+            next_block = f_in.read(BLOCK_SIZE)
+            last = not next_block
+
+            pending.append(executor.submit(_deflate_block, block, zdict, level, last))
+            crc = zlib.crc32(block, crc)
+            size += len(block)
+
+            while len(pending) >= max_pending:
+                f_out.write(pending.popleft().result())
+
+            if last:
+                break
+
+            zdict = block[-DICT_SIZE:]
+            block = next_block
+
+        while pending:
+            f_out.write(pending.popleft().result())
+
+        f_out.write(struct.pack("<II", crc & 0xFFFFFFFF, size & 0xFFFFFFFF))
+
+
+def compress_files(paths, level=None, threads=None):
+    """ Compress files with gzip concurrently.
+
+    Blocks of all of the files are deflated by one pool of threads.
+
+    Parameters
+    ----------
+    paths : list of tuple
+        (path to file to compress, path to compressed file) for each file
+    level : int
+        compression level; defaults to `COMPRESSION_LEVEL`
+    threads : int
+        threads used to deflate blocks; defaults to `COMPRESSION_THREADS`
+    """
+    if not paths:
+        return
+
+    if threads is None:
+        threads = settings.COMPRESSION_THREADS
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        with ThreadPoolExecutor(max_workers=len(paths)) as writers:
+            futures = [
+                writers.submit(
+                    compress_file, path_in, path_out, level, executor, threads
+                )
+                for path_in, path_out in paths
+            ]
+
+            for future in futures:
+                future.result()
@@ -0,0 +1,232 @@
+""" Vectorized engine for finding discordant SNPs between parents and a child.
+
+The engine finds the same SNPs as `Lineage.find_discordant_snps`, but evaluates Mendelian
+inconsistencies on genotypes encoded as small integers instead of with pandas string
+operations.
+"""
+
+from lineage import save_df_as_csv
+import numpy as np
+
+from .assembly_mapping import remap_snps_to_GRCh37
+from .genotypes import allele_eq, encode_alleles
+from .packed import align_rsids
+
+
+def _to_bytes(genotypes):
+    return genotypes.fillna("").values.astype("S")
+
+
+def compute_duo_discordance(genotype1, genotype2):
+    """ Determine where a parent and child don't share an allele.
+
+    Parameters
+    ----------
+    genotype1 : numpy.ndarray
+        bytes genotypes of the child (empty if null)
+    genotype2 : numpy.ndarray
+        bytes genotypes of the parent (empty if null)
+
+    Returns
+    -------
+    numpy.ndarray
+        bool array
+    """
+    a1, len1 = encode_alleles(genotype1)
+    a2, len2 = encode_alleles(genotype2)
+
+    return ((len1 == 1) & (len2 == 1) & ~allele_eq(a1, len1, 0, a2, len2, 0)) | (
+        (len1 == 2)
+        & (len2 == 2)
+        & ~allele_eq(a1, len1, 0, a2, len2, 0)
+        & ~allele_eq(a1, len1, 0, a2, len2, 1)
+        & ~allele_eq(a1, len1, 1, a2, len2, 0)
+        & ~allele_eq(a1, len1, 1, a2, len2, 1)
+    )
+
+
+def compute_trio_discordance(genotype1, genotype2, genotype3):
+    """ Determine where a child is inconsistent with both parents.
+
+    Parameters
+    ----------
+    genotype1 : numpy.ndarray
+        bytes genotypes of the child (empty if null)
+    genotype2 : numpy.ndarray
+        bytes genotypes of a parent (empty if null)
+    genotype3 : numpy.ndarray
+        bytes genotypes of the other parent (empty if null)
+
+    Returns
+    -------
+    numpy.ndarray
+        bool array
+    """
+    a2, len2 = encode_alleles(genotype2)
+
+    # parents are homozygous for the same allele, but the child's genotype differs
+    homozygous_parents = (
+        (len2 == 2)
+        & allele_eq(a2, len2, 0, a2, len2, 1)
+        & (genotype2 == genotype3)
+        & (genotype1 != genotype2)
+    )
+
+    return (
+        compute_duo_discordance(genotype1, genotype2)
+        | compute_duo_discordance(genotype1, genotype3)
+        | homozygous_parents
+    )
+
+
+def find_discordant_snps(
+    l, individual1, individual2, individual3=None, save_output=False
+):
+    """ Find discordant SNPs between two or three individuals.
+
+    Drop-in replacement for `Lineage.find_discordant_snps`; see that method for details.
+
+    Parameters
+    ----------
+    l : Lineage
+    individual1 : Individual
+        reference individual (child if `individual2` and `individual3` are parents)
+    individual2 : Individual
+        comparison individual
+    individual3 : Individual
+        other parent if `individual1` is child and `individual2` is a parent
+    save_output : bool
+        specifies whether to save output to a CSV file in the output directory
+
+    Returns
+    -------
+    pandas.DataFrame
+        discordant SNPs and associated genetic data
+    """
+    remap_snps_to_GRCh37([individual1, individual2, individual3])
+
+    df = individual1.snps
+
+    # remove nulls for reference individual
+    df = df.loc[df["genotype"].notnull()]
+
+    # add SNPs shared with `individual2`
+    df = df.join(individual2.snps["genotype"], rsuffix="2")
+
+    genotype1 = "genotype_" + individual1.get_var_name()
+    genotype2 = "genotype_" + individual2.get_var_name()
+
+    if individual3 is None:
+        df = df.rename(columns={"genotype": genotype1, "genotype2": genotype2})
+
+        # find discordant SNPs between reference and comparison individuals
+        df = df.loc[
+            compute_duo_discordance(_to_bytes(df[genotype1]), _to_bytes(df[genotype2]))
+        ]
+
+        if save_output:
+            save_df_as_csv(
+                df,
+                l._output_dir,
+                "discordant_snps_{}_{}_GRCh37.csv".format(
+                    individual1.get_var_name(), individual2.get_var_name()
+                ),
+            )
+    else:
+        # add SNPs shared with `individual3`
+        df = df.join(individual3.snps["genotype"], rsuffix="3")
+
+        genotype3 = "genotype_" + individual3.get_var_name()
+
+        df = df.rename(
+            columns={
+                "genotype": genotype1,
+                "genotype2": genotype2,
+                "genotype3": genotype3,
+            }
+        )
+
+        # find discordant SNPs between child and two parents
+        df = df.loc[
+            compute_trio_discordance(
+                _to_bytes(df[genotype1]),
+                _to_bytes(df[genotype2]),
+                _to_bytes(df[genotype3]),
+            )
+        ]
+
+        if save_output:
+            save_df_as_csv(
+                df,
+                l._output_dir,
+                "discordant_snps_{}_{}_{}_GRCh37.csv".format(
+                    individual1.get_var_name(),
+                    individual2.get_var_name(),
+                    individual3.get_var_name(),
+                ),
+            )
+
+    return df
+
+
+def find_packed_discordant_snps(l, individuals, packed, save_output=False):
+    """ Find discordant SNPs between two or three individuals with packed genotypes.
+
+    This finds the same SNPs as `find_discordant_snps`, but only the discordant SNPs are
+    converted to a pandas frame. Genotypes that aren't in GRCh37 are loaded into the
+    individuals and remapped with `find_discordant_snps`.
+
+    Parameters
+    ----------
+    l : Lineage
+    individuals : list of Individual
+        `lineage` ``Individual`` without SNPs for each individual, in the order of
+        `find_discordant_snps`; used to name outputs
+    packed : list of PackedGenotypes
+        genotypes of each individual
+    save_output : bool
+        specifies whether to save output to a CSV file in the output directory
+
+    Returns
+    -------
+    pandas.DataFrame
+        discordant SNPs and associated genetic data
+    """
+    if any(p.build != 37 for p in packed):
+        return find_discordant_snps(
+            l,
+            *[p.load_individual(ind) for ind, p in zip(individuals, packed)],
+            save_output=save_output
+        )
+
+    # remove nulls for reference individual, then add SNPs shared with other individuals
+    ix = [np.flatnonzero(packed[0].get_genotypes() != b"")]
+    for p in packed[1:]:
+        ix1, ix2 = align_rsids(packed[0].rsid[ix[0]], p.rsid, how="left")
+        ix = [i[ix1] for i in ix] + [ix2]
+
+    genotypes = [p.get_genotypes(i) for p, i in zip(packed, ix)]
+
+    if len(packed) == 2:
+        discordant = compute_duo_discordance(*genotypes)
+    else:
+        discordant = compute_trio_discordance(*genotypes)
+
+    df = packed[0].to_snps(ix[0][discordant])
+    df = df.rename(columns={"genotype": "genotype_" + individuals[0].get_var_name()})
+
+    for ind, genotype in zip(individuals[1:], genotypes[1:]):
+        genotype = genotype[discordant].astype(str).astype(object)
+        genotype[genotype == ""] = np.nan
+        df["genotype_" + ind.get_var_name()] = genotype
+
+    if save_output:
+        save_df_as_csv(
+            df,
+            l._output_dir,
+            "discordant_snps_{}_GRCh37.csv".format(
+                "_".join(ind.get_var_name() for ind in individuals)
+            ),
+        )
+
+    return df
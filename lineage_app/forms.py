@@ -40,6 +40,14 @@ class SharedDnaGenesForm(forms.ModelForm):
                 pass  # invalid input from the client; ignore and fallback to empty queryset
 
 
+class AllPairsSharedDnaGenesForm(forms.ModelForm):
+    prefix = "all_pairs"
+
+    class Meta:
+        model = SharedDnaGenes
+        fields = ["cM_threshold", "snp_threshold"]
+
+
 class DiscordantSnpsForm(forms.ModelForm):
     class Meta:
         model = DiscordantSnps
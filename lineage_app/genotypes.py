@@ -0,0 +1,254 @@
+""" Canonical, columnar storage of the genotypes of a ``Snps`` file.
+
+Genotypes are stored in a directory of uncompressed NumPy arrays so that they can be memory
+mapped by analyses instead of re-parsing the raw data file.
+"""
+
+from contextlib import contextmanager
+import json
+import os
+import shutil
+from uuid import uuid4
+
+import numpy as np
+import pandas as pd
+
+from .workspace import publish
+
+GENOTYPES_EXT = ".genotypes"
+
+
+def save_genotypes(snps, path, build=37, build_detected=False, source="", cM=None):
+    """ Save SNPs as columnar arrays.
+
+    Parameters
+    ----------
+    snps : pandas.DataFrame
+        SNPs normalized by `lineage` (i.e., indexed by rsid, with `chrom`, `pos`, and
+        `genotype` columns)
+    path : str
+        path to genotypes directory
+    build : int
+        build of SNPs
+    build_detected : bool
+        build of SNPs was detected
+    source : str
+        source(s) of SNPs
+    cM : numpy.ndarray
+        genetic position of each SNP
+    """
+    with _stage_genotypes(path, build, build_detected, source) as temp:
+        np.save(os.path.join(temp, "rsid.npy"), snps.index.values.astype("S"))
+        np.save(os.path.join(temp, "chrom.npy"), snps["chrom"].values.astype("S"))
+        np.save(os.path.join(temp, "pos.npy"), snps["pos"].values.astype(np.int64))
+        np.save(
+            os.path.join(temp, "genotype.npy"),
+            snps["genotype"].fillna("").values.astype("S"),
+        )
+        if cM is not None:
+            np.save(os.path.join(temp, "cM.npy"), np.asarray(cM, dtype=np.float64))
+
+
+def concatenate_genotypes(paths, path, build=37, build_detected=False, source=""):
+    """ Concatenate genotypes saved with `save_genotypes`.
+
+    Arrays are copied through memory maps, so the genotypes aren't loaded into memory.
+
+    Parameters
+    ----------
+    paths : list of str
+        paths to genotypes directories to concatenate, in order
+    path : str
+        path to genotypes directory
+    build : int
+        build of SNPs
+    build_detected : bool
+        build of SNPs was detected
+    source : str
+        source(s) of SNPs
+    """
+    parts = [load_genotypes(p) for p in paths]
+
+    with _stage_genotypes(path, build, build_detected, source) as temp:
+        for name in ["rsid", "chrom", "pos", "genotype", "cM"]:
+            arrays = [part[name] for part in parts if name in part]
+            if not arrays or len(arrays) != len(parts):
+                continue
+
+            out = np.lib.format.open_memmap(
+                os.path.join(temp, name + ".npy"),
+                mode="w+",
+                dtype=np.result_type(*arrays),
+                shape=(sum(len(a) for a in arrays),),
+            )
+
+            start = 0
+            for a in arrays:
+                out[start : start + len(a)] = a
+                start += len(a)
+
+            out.flush()
+            del out
+
+
+@contextmanager
+def _stage_genotypes(path, build, build_detected, source):
+    """ Stage genotypes, then publish them to `path`.
+
+    Genotypes are staged under a unique name, so concurrent saves of the same genotypes don't
+    remove each other's arrays. Existing genotypes are renamed aside, not removed, before the
+    new genotypes are renamed in.
+
+    Yields
+    ------
+    str
+        path to the directory to save arrays in
+    """
+    temp = "{}.{}.tmp".format(path, uuid4().hex)
+    os.makedirs(temp)
+
+    try:
+        yield temp
+
+        with open(os.path.join(temp, "info.json"), "w") as f:
+            # a detected build is a NumPy integer
+            json.dump(
+                {
+                    "build": int(build),
+                    "build_detected": bool(build_detected),
+                    "source": source,
+                },
+                f,
+            )
+
+        publish(temp, path)
+    except:
+        shutil.rmtree(temp, ignore_errors=True)
+        raise
+
+
+def load_genotypes(path, mmap_mode="r"):
+    """ Load genotypes saved with `save_genotypes`.
+
+    Parameters
+    ----------
+    path : str
+        path to genotypes directory
+    mmap_mode : str
+        see `numpy.load`
+
+    Returns
+    -------
+    dict
+        `rsid`, `chrom`, `pos`, `genotype`, and (if saved) `cM` arrays, and `info`
+    """
+    genotypes = {}
+    for name in ["rsid", "chrom", "pos", "genotype", "cM"]:
+        if name == "cM" and not os.path.exists(os.path.join(path, "cM.npy")):
+            continue
+
+        genotypes[name] = np.load(
+            os.path.join(path, name + ".npy"), mmap_mode=mmap_mode
+        )
+
+    with open(os.path.join(path, "info.json"), "r") as f:
+        genotypes["info"] = json.load(f)
+
+    return genotypes
+
+
+def genotypes_exist(path):
+    return os.path.exists(os.path.join(path, "info.json"))
+
+
+def delete_genotypes(path):
+    if os.path.exists(path):
+        shutil.rmtree(path)
+
+
+def move_genotypes(src, dst):
+    publish(src, dst)
+
+
+def genotypes_to_snps(genotypes):
+    """ Convert genotypes to SNPs normalized for use with `lineage`.
+
+    Parameters
+    ----------
+    genotypes : dict
+        genotypes returned by `load_genotypes`
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    genotype = genotypes["genotype"].astype(str).astype(object)
+    genotype[genotype == ""] = np.nan
+
+    df = pd.DataFrame(
+        {
+            "chrom": genotypes["chrom"].astype(str).astype(object),
+            "pos": np.array(genotypes["pos"], dtype=np.int64),
+            "genotype": genotype,
+        },
+        index=pd.Index(genotypes["rsid"].astype(str).astype(object), name="rsid"),
+        columns=["chrom", "pos", "genotype"],
+    )
+    return df
+
+
+def encode_alleles(genotypes):
+    """ Encode bytes genotypes as alleles.
+
+    Parameters
+    ----------
+    genotypes : numpy.ndarray
+        bytes genotypes (empty if null)
+
+    Returns
+    -------
+    alleles : numpy.ndarray
+        (n, 2) array of allele byte values; 0 where the allele is not present
+    length : numpy.ndarray
+        length of each genotype
+    """
+    genotypes = np.ascontiguousarray(genotypes)
+    if genotypes.dtype.itemsize < 2:
+        genotypes = genotypes.astype("S2")
+
+    b = genotypes.view(np.uint8).reshape(len(genotypes), genotypes.dtype.itemsize)
+    return b[:, :2], np.count_nonzero(b, axis=1)
+
+
+def allele_eq(alleles1, length1, i, alleles2, length2, j):
+    # alleles that aren't present never match (i.e., like comparisons with NaN)
+    return (alleles1[:, i] == alleles2[:, j]) & (length1 > i) & (length2 > j)
+
+
+def create_individual(l, name, path):
+    """ Create a `lineage` ``Individual`` from saved genotypes.
+
+    Parameters
+    ----------
+    l : Lineage
+    name : str
+        name of the individual
+    path : str
+        path to genotypes directory
+
+    Returns
+    -------
+    Individual
+    """
+    genotypes = load_genotypes(path)
+    info = genotypes["info"]
+
+    ind = l.create_individual(name)
+    # genotypes were saved from sorted SNPs, so there's no need to sort them again
+    ind._snps = genotypes_to_snps(genotypes)
+    ind._build = info["build"]
+    ind._build_detected = info["build_detected"]
+    if info["source"]:
+        ind._source = [s.strip() for s in info["source"].split(",")]
+
+    return ind
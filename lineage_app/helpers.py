@@ -1,13 +1,16 @@
 import logging
+import math
 import os
 import shutil
-import tempfile
 
 from django.contrib.auth import get_user_model
 from django.db.models import Q
 import ohapi
 
-from .models import Individual, parse_snps
+from .models import Individual, ingest_snps
+from .relatedness import get_degree, load_relatedness
+from .storage import stage_file
+from .workspace import workspace
 
 logger = logging.getLogger(__name__)
 
@@ -37,39 +40,36 @@ def setup_oh_individual(individual_id, progress_recorder):
     user = individual.user
 
     # download, load, and analyze user data
-    with tempfile.TemporaryDirectory() as tmpdir:
+    with workspace() as tmpdir:
         try:
-            progress_recorder.set_progress(1, 6)  # download data
+            progress_recorder.set_progress(1, 5)  # download data
 
             ohapi.command_line.download(
                 directory=tmpdir, access_token=user.openhumansmember.get_access_token()
             )
 
-            progress_recorder.set_progress(2, 6)  # analyze files
+            progress_recorder.set_progress(2, 5)  # analyze files
 
             files = get_paths_to_downloaded_data_files(tmpdir)
 
             for file in files:
-                summary_info, is_valid = parse_snps(file)
+                summary_info, genotypes_path = ingest_snps(file, tmpdir, user.uuid)
 
-                if not is_valid:
+                if summary_info is None:
                     continue
 
-                individual.add_snps(file, summary_info)
+                individual.add_snps(file, summary_info, genotypes_path=genotypes_path)
 
         except Exception as err:
             logger.error(err)
 
-    progress_recorder.set_progress(3, 6)  # merge SNPs
+    progress_recorder.set_progress(3, 5)  # merge SNPs
     individual.merge_snps()
 
-    progress_recorder.set_progress(4, 6)  # remap SNPs
-    individual.remap_snps()
-
-    progress_recorder.set_progress(5, 6)  # upload files
+    progress_recorder.set_progress(4, 5)  # upload files
     upload_files(individual)
 
-    progress_recorder.set_progress(6, 6)  # complete!
+    progress_recorder.set_progress(5, 5)  # complete!
     user.setup_complete = True
     user.save()
 
@@ -124,11 +124,13 @@ def get_paths_to_downloaded_data_files(path):
 def upload_files(individual):
     files_to_upload = []
 
-    with tempfile.TemporaryDirectory() as tmpdir:
-        snps = individual.snps.filter(Q(generated_by_lineage=True) & Q(build=37))
-        if snps:
+    with workspace() as tmpdir:
+        # SNPs in other builds are remapped for the upload if they aren't cached
+        snps_files = individual.get_snps_files([37, 36, 38])
+
+        if snps_files.get(37):
             lineage_GRCh37 = os.path.join(tmpdir, "lineage_GRCh37.csv")
-            shutil.copy(snps[0].file.path, lineage_GRCh37)
+            stage_file(snps_files[37], lineage_GRCh37)
 
             files_to_upload.append(
                 {
@@ -139,10 +141,9 @@ def upload_files(individual):
                 }
             )
 
-        snps = individual.snps.filter(Q(generated_by_lineage=True) & Q(build=36))
-        if snps:
+        if snps_files.get(36):
             lineage_NCBI36 = os.path.join(tmpdir, "lineage_NCBI36.csv")
-            shutil.copy(snps[0].file.path, lineage_NCBI36)
+            stage_file(snps_files[36], lineage_NCBI36)
 
             files_to_upload.append(
                 {
@@ -153,10 +154,9 @@ def upload_files(individual):
                 }
             )
 
-        snps = individual.snps.filter(Q(generated_by_lineage=True) & Q(build=38))
-        if snps:
+        if snps_files.get(38):
             lineage_GRCh38 = os.path.join(tmpdir, "lineage_GRCh38.csv")
-            shutil.copy(snps[0].file.path, lineage_GRCh38)
+            stage_file(snps_files[38], lineage_GRCh38)
 
             files_to_upload.append(
                 {
@@ -170,7 +170,7 @@ def upload_files(individual):
         discrepant_snps = individual.get_discrepant_snps()
         if discrepant_snps:
             discrepant_snps_file = os.path.join(tmpdir, "lineage_discrepant_snps.csv")
-            shutil.copy(discrepant_snps.file.path, discrepant_snps_file)
+            stage_file(discrepant_snps.file.path, discrepant_snps_file)
 
             files_to_upload.append(
                 {
@@ -223,3 +223,73 @@ def shared_dna_genes_calc_exists(d):
         return True
 
     return False
+
+
+def get_relatedness_context(user):
+    """ Get the context of the relatedness heatmap of a user's individuals.
+
+    Parameters
+    ----------
+    user : User
+
+    Returns
+    -------
+    dict
+        `individuals` in the heatmap, `rows` of heatmap cells, `pairs` ordered by kinship,
+        and `pending` individuals whose SNPs aren't in the heatmap yet
+    """
+    relatedness = load_relatedness(user.uuid)
+    if relatedness is None:
+        relatedness = {"individual": [], "sha256": []}
+
+    individuals = {str(i.uuid): i for i in user.individuals.all()}
+
+    # rows of individuals that still exist
+    rows = [
+        row
+        for row, uuid in enumerate(relatedness["individual"])
+        if str(uuid) in individuals
+    ]
+    included = {str(relatedness["individual"][row]): row for row in rows}
+
+    pending = []
+    for individual in user.individuals.all().order_by("created_at"):
+        snps = individual.get_canonical_snps()
+        if not snps:
+            continue
+
+        row = included.get(str(individual.uuid))
+        if row is None or relatedness["sha256"][row] != snps.get_sha256():
+            pending.append(individual)
+
+    def get_cell(i, j):
+        kinship = float(relatedness["kinship"][i, j])
+        # shade from unrelated (0) to duplicate (0.5)
+        alpha = 0.0 if math.isnan(kinship) else min(max(kinship / 0.5, 0.0), 1.0)
+
+        return {
+            "individual1": individuals[str(relatedness["individual"][i])],
+            "individual2": individuals[str(relatedness["individual"][j])],
+            "kinship": kinship,
+            "degree": get_degree(kinship),
+            "ibs0": int(relatedness["ibs0"][i, j]),
+            "ibs1": int(relatedness["ibs1"][i, j]),
+            "ibs2": int(relatedness["ibs2"][i, j]),
+            "snps": int(relatedness["snps"][i, j]),
+            "alpha": "{:.2f}".format(alpha),
+            "dark": alpha > 0.5,
+            "self": i == j,
+        }
+
+    heatmap = [[get_cell(i, j) for j in rows] for i in rows]
+    pairs = [heatmap[i][j] for i in range(len(rows)) for j in range(i + 1, len(rows))]
+    pairs.sort(key=lambda cell: 1 if math.isnan(cell["kinship"]) else -cell["kinship"])
+
+    return {
+        "individuals": [
+            individuals[str(relatedness["individual"][row])] for row in rows
+        ],
+        "rows": heatmap,
+        "pairs": pairs,
+        "pending": pending,
+    }
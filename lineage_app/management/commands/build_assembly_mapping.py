@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from lineage.resources import Resources
+
+from lineage_app.assembly_mapping import (
+    ASSEMBLY_MAPPINGS,
+    get_assembly_mapping_path,
+    save_assembly_mapping,
+)
+
+
+class Command(BaseCommand):
+    help = "Build the assembly mappings used to remap SNPs between builds"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--resources-dir",
+            default=settings.LINEAGE_RESOURCES_DIR,
+            help="lineage resources directory; assembly mapping data is downloaded here "
+            "if necessary",
+        )
+        parser.add_argument(
+            "--mapping-dir",
+            default=None,
+            help="output directory; defaults to ASSEMBLY_MAPPING_DIR",
+        )
+
+    def handle(self, *args, **options):
+        r = Resources(resources_dir=options["resources_dir"])
+
+        for source_assembly, target_assembly in ASSEMBLY_MAPPINGS:
+            assembly_mapping_data = r.get_assembly_mapping_data(
+                source_assembly, target_assembly
+            )
+
+            if assembly_mapping_data is None:
+                raise CommandError(
+                    "Assembly mapping data {} -> {} not available".format(
+                        source_assembly, target_assembly
+                    )
+                )
+
+            path = get_assembly_mapping_path(
+                source_assembly, target_assembly, options["mapping_dir"]
+            )
+            save_assembly_mapping(assembly_mapping_data, path)
+
+            self.stdout.write(
+                "Built {} -> {} in {}".format(source_assembly, target_assembly, path)
+            )
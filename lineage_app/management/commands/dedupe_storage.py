@@ -0,0 +1,29 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from lineage_app.models import sendfile_storage
+
+
+class Command(BaseCommand):
+    help = "Deduplicate files in SENDFILE_ROOT and remove blobs no longer referenced"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--collect-only",
+            action="store_true",
+            help="only remove blobs no longer referenced",
+        )
+
+    def handle(self, *args, **options):
+        if not options["collect_only"]:
+            users_dir = sendfile_storage.path(settings.USERS_DIR)
+
+            if os.path.exists(users_dir):
+                for user_dir in os.listdir(users_dir):
+                    sendfile_storage.dedupe(os.path.join(settings.USERS_DIR, user_dir))
+                    self.stdout.write("Deduplicated {}".format(user_dir))
+
+        count = sendfile_storage.collect_blobs()
+        self.stdout.write("Removed {} blobs".format(count))
@@ -0,0 +1,425 @@
+""" Memoization of ingest, remap, and analysis results by content.
+
+Results are stored under `MEMO_DIR` by a key derived from the SHA-256 of the input files and the
+parameters of the computation, so a result is reused by any user with the same input files (e.g.,
+a relative uploading the same file, or a member onboarding again). Files are hardlinked into and
+out of the memo where possible, so a memoized result doesn't take more space than the files that
+use it. Memoized results are only an optimization; any entry can be deleted at any time, and a
+result that can't be restored is computed again.
+
+Each user that saves or loads a result records a reference to it, with the SHA-256s of its input
+files and the UUID of the object it was found for. A user's references are removed when the
+user, their files, or their analyses are deleted, and a result is deleted when its last
+reference is removed. The memo is also bounded to `MEMO_SIZE` bytes by occasionally evicting the
+least recently used results.
+"""
+
+from decimal import Decimal
+import hashlib
+import json
+import fcntl
+import os
+import shutil
+import time
+from uuid import uuid4
+
+from django.conf import settings
+import numpy as np
+
+
+def get_sha256(path, block_size=1024 * 1024):
+    """ Get the SHA-256 of a file.
+
+    Parameters
+    ----------
+    path : str
+    block_size : int
+        bytes to read at a time
+
+    Returns
+    -------
+    str
+        hex digest
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _to_json(o):
+    if isinstance(o, np.generic):
+        return o.item()
+    elif isinstance(o, Decimal):
+        return str(o)
+    raise TypeError("{} is not JSON serializable".format(type(o).__name__))
+
+
+def get_memo_key(*args):
+    """ Get the key of a memoized result.
+
+    Parameters
+    ----------
+    *args
+        name of the computation, content hashes of its inputs, and its parameters
+
+    Returns
+    -------
+    str
+    """
+    return hashlib.sha256(
+        json.dumps(args, sort_keys=True, default=_to_json).encode("utf-8")
+    ).hexdigest()
+
+
+# directory of the references of each user, in `MEMO_DIR`
+USERS_DIR = "users"
+
+
+def get_memo_path(key):
+    return os.path.join(settings.MEMO_DIR, key[:2], key)
+
+
+def _get_user_dir(user_uuid):
+    return os.path.join(settings.MEMO_DIR, USERS_DIR, str(user_uuid))
+
+
+def link_or_copy(src, dst):
+    """ Hardlink a file or directory of files, falling back to copying.
+
+    Parameters
+    ----------
+    src : str
+    dst : str
+    """
+    if os.path.isdir(src):
+        os.makedirs(dst)
+        for name in os.listdir(src):
+            link_or_copy(os.path.join(src, name), os.path.join(dst, name))
+        return
+
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def _remove(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _add_memo_ref(user_uuid, key, refs):
+    """ Record a reference of a user to a memoized result.
+
+    Returns
+    -------
+    bool
+        True if the reference was recorded (i.e., the result still exists)
+    """
+    user_dir = _get_user_dir(user_uuid)
+    index_path = os.path.join(user_dir, key)
+
+    try:
+        with open(index_path, "r") as f:
+            refs = set(json.load(f)) | {str(ref) for ref in refs}
+    except (OSError, ValueError):
+        refs = {str(ref) for ref in refs}
+
+    try:
+        # the result is marked as referenced by the user
+        users_dir = os.path.join(get_memo_path(key), USERS_DIR)
+        try:
+            os.mkdir(users_dir)
+        except FileExistsError:
+            pass
+        open(os.path.join(users_dir, str(user_uuid)), "w").close()
+
+        # and the user's references are indexed by key, so they're found without a scan
+        os.makedirs(user_dir, exist_ok=True)
+        temp = "{}.{}.tmp".format(index_path, uuid4().hex)
+        with open(temp, "w") as f:
+            json.dump(sorted(refs), f)
+        os.replace(temp, index_path)
+    except OSError:
+        return False
+
+    return True
+
+
+def _remove_memo_ref(user_uuid, key):
+    """ Remove the reference of a user to a memoized result, and the result if it was the last. """
+    path = get_memo_path(key)
+    users_dir = os.path.join(path, USERS_DIR)
+
+    try:
+        os.remove(os.path.join(users_dir, str(user_uuid)))
+    except FileNotFoundError:
+        pass
+
+    try:
+        os.rmdir(users_dir)
+        _remove_memo_entry(path)
+    except FileNotFoundError:
+        # the result was removed
+        pass
+    except OSError:
+        # another user references the result
+        pass
+
+    try:
+        os.remove(os.path.join(_get_user_dir(user_uuid), key))
+    except FileNotFoundError:
+        pass
+
+
+def load_memo(user_uuid, key, refs=()):
+    """ Load a memoized result, and record a reference of a user to it.
+
+    Parameters
+    ----------
+    user_uuid : str
+        UUID of the user the result is loaded for
+    key : str
+        key returned by `get_memo_key`
+    refs : iterable of str
+        SHA-256s of the input files and UUID of the object the result is loaded for; the
+        user's reference is removed when any of them is deleted
+
+    Returns
+    -------
+    dict
+        info of memoized result if it exists, else None
+    """
+    info_path = os.path.join(get_memo_path(key), "info.json")
+
+    try:
+        with open(info_path, "r") as f:
+            info = json.load(f)
+        # mark as recently used
+        os.utime(info_path)
+    except (OSError, ValueError):
+        return None
+
+    if not _add_memo_ref(user_uuid, key, refs):
+        return None
+
+    return info
+
+
+def save_memo(user_uuid, key, info, files=None, refs=()):
+    """ Memoize a result, and record a reference of a user to it.
+
+    If the result is already memoized (e.g., by a concurrent task), the existing result is kept.
+
+    Parameters
+    ----------
+    user_uuid : str
+        UUID of the user the result is memoized for
+    key : str
+        key returned by `get_memo_key`
+    info : dict
+        JSON-serializable info of the result
+    files : dict
+        name to path of each file or directory of the result
+    refs : iterable of str
+        SHA-256s of the input files and UUID of the object the result was found for; the
+        user's reference is removed when any of them is deleted
+    """
+    path = get_memo_path(key)
+    temp = "{}.{}.tmp".format(path, uuid4().hex)
+
+    try:
+        os.makedirs(temp)
+
+        for name, src in (files or {}).items():
+            link_or_copy(src, os.path.join(temp, name))
+
+        with open(os.path.join(temp, "info.json"), "w") as f:
+            json.dump(info, f, default=_to_json)
+
+        os.rename(temp, path)
+    except OSError:
+        shutil.rmtree(temp, ignore_errors=True)
+
+    _add_memo_ref(user_uuid, key, refs)
+
+    _evict_memo_occasionally(keep=[path])
+
+
+def restore_memo_files(key, files):
+    """ Restore the files and directories of a memoized result.
+
+    Either all files are restored, or none are.
+
+    Parameters
+    ----------
+    key : str
+        key returned by `get_memo_key`
+    files : dict
+        name of each memoized file or directory to the path to restore it to
+
+    Returns
+    -------
+    bool
+        True if the files were restored; False if the result was deleted (e.g., evicted) in
+        the meantime
+    """
+    path = get_memo_path(key)
+    restored = []
+
+    try:
+        for name, dst in files.items():
+            restored.append(dst)
+            link_or_copy(os.path.join(path, name), dst)
+    except OSError:
+        for dst in restored:
+            _remove(dst)
+        return False
+
+    return True
+
+
+def _iter_memo_entries(path):
+    """ Iterate over the paths of the memoized results under a directory of the memo. """
+    for dirpath, dirnames, _ in os.walk(path):
+        if dirpath == settings.MEMO_DIR and USERS_DIR in dirnames:
+            dirnames.remove(USERS_DIR)
+
+        for dirname in list(dirnames):
+            if dirname.endswith(".tmp"):
+                # results being saved or removed
+                dirnames.remove(dirname)
+            elif os.path.exists(os.path.join(dirpath, dirname, "info.json")):
+                # don't walk the files of a result
+                dirnames.remove(dirname)
+                yield os.path.join(dirpath, dirname)
+
+
+def _remove_memo_entry(path):
+    # readers never see a partially removed result
+    temp = "{}.{}.tmp".format(path, uuid4().hex)
+    try:
+        os.rename(path, temp)
+    except OSError:
+        return
+    shutil.rmtree(temp, ignore_errors=True)
+
+
+def delete_memo(user_uuid, ref=None):
+    """ Delete the references of a user to memoized results.
+
+    Results without other references are deleted.
+
+    Parameters
+    ----------
+    user_uuid : str
+        UUID of user
+    ref : str
+        only delete references of results found with this SHA-256 or UUID; all references of
+        the user are deleted if None
+    """
+    user_dir = _get_user_dir(user_uuid)
+
+    try:
+        keys = os.listdir(user_dir)
+    except FileNotFoundError:
+        return
+
+    for key in keys:
+        if key.endswith(".tmp"):
+            continue
+
+        if ref is not None:
+            try:
+                with open(os.path.join(user_dir, key), "r") as f:
+                    refs = json.load(f)
+            except (OSError, ValueError):
+                refs = None
+
+            if refs is not None and str(ref) not in refs:
+                continue
+
+        _remove_memo_ref(user_uuid, key)
+
+    if ref is None:
+        shutil.rmtree(user_dir, ignore_errors=True)
+
+
+def _evict_memo_occasionally(keep=()):
+    """ Evict results if they haven't been evicted for `MEMO_EVICT_INTERVAL` seconds.
+
+    The memo is scanned by one process at a time, at most once per interval, so saving a result
+    doesn't scan the memo.
+    """
+    stamp_path = os.path.join(settings.MEMO_DIR, "evicted")
+
+    try:
+        if time.time() - os.stat(stamp_path).st_mtime < settings.MEMO_EVICT_INTERVAL:
+            return
+    except FileNotFoundError:
+        pass
+
+    try:
+        with open(os.path.join(settings.MEMO_DIR, "evict.lock"), "w") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                # another process is evicting results
+                return
+
+            open(stamp_path, "w").close()
+            evict_memo(keep=keep)
+    except OSError:
+        pass
+
+
+def evict_memo(keep=()):
+    """ Evict the least recently used results until the memo is within its size.
+
+    Only files that aren't linked elsewhere (e.g., published to `SENDFILE_ROOT`) count toward
+    the size, since evicting a result doesn't free the space of files that are still used.
+
+    Parameters
+    ----------
+    keep : iterable of str
+        paths to memoized results that aren't evicted (e.g., results just saved)
+    """
+    entries = []
+
+    for entry in _iter_memo_entries(settings.MEMO_DIR):
+        size = 0
+        for dirpath, _, filenames in os.walk(entry):
+            for filename in filenames:
+                try:
+                    stat = os.stat(os.path.join(dirpath, filename))
+                except FileNotFoundError:
+                    continue
+                if stat.st_nlink == 1:
+                    size += stat.st_size
+
+        try:
+            mtime = os.stat(os.path.join(entry, "info.json")).st_mtime
+        except FileNotFoundError:
+            continue
+
+        entries.append((mtime, size, entry))
+
+    size = sum(entry[1] for entry in entries)
+    keep = set(keep)
+
+    for _, entry_size, entry in sorted(entries):
+        if size <= settings.MEMO_SIZE:
+            break
+
+        if entry in keep:
+            continue
+
+        _remove_memo_entry(entry)
+        size -= entry_size
@@ -0,0 +1,402 @@
+""" Out-of-core merge of SNPs, one chromosome at a time.
+
+`lineage` merges SNPs files by loading each of them into one ``Individual``, so memory use grows
+with the number and size of the files. Here, the merged SNPs are partitioned by chromosome and
+kept on disk, and each file is merged into one partition at a time; only a chromosome of SNPs is
+held in memory as a DataFrame, with the rsids of all merged SNPs held as a compact array.
+
+Each partition is merged by `lineage` itself, and the parts of the merge that depend on all of
+the SNPs (i.e., the thresholds for discrepant SNPs, and the order of SNPs at the same position)
+are applied across partitions, so the merged and discrepant SNPs are the same as if the files
+were loaded into one ``Individual``.
+"""
+
+import os
+
+from lineage import save_df_as_csv
+from lineage.individual import Individual
+from lineage.snps import SNPs, SNPsCollection
+import numpy as np
+import pandas as pd
+
+from .assembly_mapping import remap_snps
+from .genotypes import (
+    concatenate_genotypes,
+    delete_genotypes,
+    genotypes_to_snps,
+    load_genotypes,
+    save_genotypes,
+)
+from .shared_dna import compute_genetic_positions
+
+# thresholds of `SNPsCollection.load_snps`
+DISCREPANT_SNP_POSITIONS_THRESHOLD = 100
+DISCREPANT_GENOTYPES_THRESHOLD = 500
+
+# SNPs looked up by `SNPs.detect_build`
+BUILD_RSIDS = ["rs3094315", "rs11928389", "rs2500347", "rs964481", "rs2341354"]
+
+
+def sort_chromosomes(chroms):
+    """ Sort chromosomes the same way as `SNPs.sort_snps`. """
+    chroms = sorted(chroms, key=SNPs._natural_sort_key)
+
+    # PAR and MT are at the end
+    for chrom in ["PAR", "MT"]:
+        if chrom in chroms:
+            chroms.remove(chrom)
+            chroms.append(chrom)
+
+    return chroms
+
+
+def _get_rsids(snps):
+    return snps.index.values.astype(str).astype("S")
+
+
+def _get_order(snps):
+    # SNPs at the same position are in order of rsid
+    return np.lexsort((_get_rsids(snps), snps["pos"].values))
+
+
+class ChromosomeMerge:
+    """ SNPs merged one chromosome at a time.
+
+    SNPs are merged in GRCh37. Like ``SNPsCollection``, SNPs files that have too many
+    discrepant SNPs aren't merged, and their discrepant SNPs are recorded.
+    """
+
+    def __init__(self, output_dir):
+        """ Initialize a ``ChromosomeMerge``.
+
+        Parameters
+        ----------
+        output_dir : str
+            path to directory for the partitions of merged SNPs
+        """
+        self._output_dir = output_dir
+        self._source = []
+        self._build_detected = False
+        # chromosome of each partition to rsids of its SNPs, in order
+        self._rsids = {}
+        # chromosomes of partitions with SNPs at the same position in order of rsid
+        self._ordered = set()
+        self._discrepant_positions = pd.DataFrame()
+        self._discrepant_genotypes = pd.DataFrame()
+
+    @property
+    def source(self):
+        return ", ".join(self._source)
+
+    @property
+    def snp_count(self):
+        return sum(len(rsids) for rsids in self._rsids.values())
+
+    @property
+    def chromosomes(self):
+        return sort_chromosomes(self._rsids)
+
+    @property
+    def discrepant_snps(self):
+        """ SNPs with discrepant positions and / or genotypes discovered while merging SNPs.
+
+        Returns
+        -------
+        pandas.DataFrame
+        """
+        df = pd.concat(
+            [self._discrepant_positions, self._discrepant_genotypes], sort=True
+        )
+        if len(df) > 1:
+            df = df.drop_duplicates()
+        return df
+
+    def _get_partition_path(self, chrom, candidate=False):
+        return os.path.join(
+            self._output_dir,
+            "merge_{}.pkl{}".format(chrom, ".candidate" if candidate else ""),
+        )
+
+    def _load_partition(self, chrom, candidate=False):
+        return pd.read_pickle(self._get_partition_path(chrom, candidate))
+
+    def _save_partition(self, chrom, snps, candidate=False):
+        snps.to_pickle(self._get_partition_path(chrom, candidate))
+
+        order = _get_order(snps)
+        return _get_rsids(snps), np.array_equal(order, np.arange(len(order)))
+
+    def _get_partitions(self, rsid, chrom):
+        """ Get the partition each SNP of a file is merged into.
+
+        A SNP that's already merged is merged into the partition that has it (i.e., if the
+        SNP is on a different chromosome in the file, it's a discrepant position).
+        """
+        partitions = chrom.astype(str).astype(object)
+
+        if not self._rsids:
+            return partitions
+
+        chroms = list(self._rsids)
+        index = np.concatenate([self._rsids[c] for c in chroms])
+        codes = np.repeat(np.arange(len(chroms)), [len(self._rsids[c]) for c in chroms])
+
+        order = np.argsort(index, kind="mergesort")
+        index = index[order]
+        codes = codes[order]
+
+        ix = np.minimum(np.searchsorted(index, rsid), len(index) - 1)
+        merged = index[ix] == rsid
+        partitions[merged] = np.array(chroms, dtype=object)[codes[ix[merged]]]
+
+        return partitions
+
+    def load_genotypes(self, path):
+        """ Load merged SNPs (e.g., from a previous merge) to merge SNPs files into.
+
+        Parameters
+        ----------
+        path : str
+            path to canonical genotypes of merged SNPs in GRCh37
+        """
+        genotypes = load_genotypes(path)
+        info = genotypes["info"]
+
+        if info["source"]:
+            self._source = [s.strip() for s in info["source"].split(",")]
+        self._build_detected = info["build_detected"]
+
+        codes, chroms = pd.factorize(np.asarray(genotypes["chrom"]).astype(str))
+        for code, chrom in enumerate(chroms):
+            ix = np.flatnonzero(codes == code)
+            snps = genotypes_to_snps(
+                {k: genotypes[k][ix] for k in ["rsid", "chrom", "pos", "genotype"]}
+            )
+            self._rsids[chrom], ordered = self._save_partition(chrom, snps)
+            if ordered:
+                self._ordered.add(chrom)
+
+    def add_genotypes(self, path):
+        """ Merge the SNPs of a file.
+
+        Parameters
+        ----------
+        path : str
+            path to canonical genotypes of the SNPs of a file
+        """
+        genotypes = load_genotypes(path)
+        info = genotypes["info"]
+        rsid = np.asarray(genotypes["rsid"])
+        chrom = np.asarray(genotypes["chrom"])
+
+        partitions = self._get_partitions(rsid, chrom)
+        codes, file_chroms = pd.factorize(partitions)
+
+        # SNPs on a different chromosome than the partition they're merged into
+        crossed = np.any(partitions != chrom.astype(str).astype(object))
+
+        discrepant_positions = []
+        discrepant_genotypes = []
+        candidates = {}
+        # the file has the same SNPs in the same order as the merged SNPs
+        equal = not crossed and set(file_chroms) == set(self._rsids)
+        empty = True
+
+        # discrepant SNPs are found in the order of the merged SNPs
+        file_codes = {c: code for code, c in enumerate(file_chroms)}
+        for c in sort_chromosomes(file_chroms):
+            ix = np.flatnonzero(codes == file_codes[c])
+
+            temp = Individual("temp", output_dir=self._output_dir)
+            temp._snps = genotypes_to_snps(
+                {k: genotypes[k][ix] for k in ["rsid", "chrom", "pos", "genotype"]}
+            )
+            temp._build = info["build"]
+            remap_snps(temp, 37)
+
+            snps = SNPs()
+            snps._snps = temp._snps
+            snps._build = temp.build
+            snps._build_detected = True
+
+            merged = SNPsCollection(output_dir=self._output_dir)
+            merged._build = 37
+            if c in self._rsids:
+                merged._snps = self._load_partition(c)
+
+            equal = equal and np.array_equal(_get_rsids(snps._snps), self._rsids.get(c))
+            empty = empty and len(snps._snps) == 0
+
+            # thresholds are applied to the discrepant SNPs of all partitions
+            dp, dg = merged._add_snps(snps, np.inf, np.inf, False)
+            discrepant_positions.append(dp)
+            discrepant_genotypes.append(dg)
+
+            if len(merged._snps) != 0:
+                candidates[c] = self._save_partition(c, merged._snps, candidate=True)
+
+        discrepant_positions = (
+            pd.concat(discrepant_positions) if discrepant_positions else pd.DataFrame()
+        )
+        discrepant_genotypes = (
+            pd.concat(discrepant_genotypes) if discrepant_genotypes else pd.DataFrame()
+        )
+
+        if len(discrepant_positions) >= DISCREPANT_SNP_POSITIONS_THRESHOLD:
+            discrepant_genotypes = pd.DataFrame()
+            accept = False
+        elif len(discrepant_genotypes) >= DISCREPANT_GENOTYPES_THRESHOLD:
+            accept = False
+        else:
+            accept = True
+
+        self._discrepant_positions = pd.concat(
+            [self._discrepant_positions, discrepant_positions], sort=True
+        )
+        self._discrepant_genotypes = pd.concat(
+            [self._discrepant_genotypes, discrepant_genotypes], sort=True
+        )
+
+        if not accept:
+            for c in candidates:
+                os.remove(self._get_partition_path(c, candidate=True))
+            return
+
+        # merged SNPs are ordered by rsid before being sorted by position, unless the SNPs
+        # are merged into nothing, nothing is merged, or the SNPs are the same
+        order_by_rsid = bool(self._rsids) and not empty and not equal
+
+        for c, (rsids, ordered) in candidates.items():
+            os.replace(
+                self._get_partition_path(c, candidate=True), self._get_partition_path(c)
+            )
+            self._rsids[c] = rsids
+            if ordered:
+                self._ordered.add(c)
+            else:
+                self._ordered.discard(c)
+
+        if order_by_rsid:
+            for c in set(self._rsids) - self._ordered:
+                snps = self._load_partition(c)
+                self._rsids[c], _ = self._save_partition(c, snps.iloc[_get_order(snps)])
+                self._ordered.add(c)
+
+        self._source.extend(
+            [s.strip() for s in info["source"].split(",")] if info["source"] else [""]
+        )
+
+    def get_summary(self):
+        """ Get summary of merged SNPs.
+
+        Returns
+        -------
+        dict
+            summary info, else None if no SNPs are merged
+        """
+        chroms = self.chromosomes
+        if not chroms:
+            return None
+
+        # the summary only depends on SNPs of the sex chromosomes, and those used to
+        # detect the build
+        frames = []
+        for chrom in chroms:
+            if chrom in ["X", "Y"]:
+                frames.append(self._load_partition(chrom))
+            elif np.isin(self._rsids[chrom], np.array(BUILD_RSIDS, dtype="S")).any():
+                snps = self._load_partition(chrom)
+                frames.append(snps.loc[snps.index.isin(BUILD_RSIDS)])
+
+        summary = SNPs()
+        summary._build = 37
+        summary._snps = (
+            pd.concat(frames)
+            if frames
+            else pd.DataFrame(columns=["chrom", "pos", "genotype"])
+        )
+
+        chromosomes = SNPs()
+        chromosomes._snps = pd.DataFrame({"chrom": chroms})
+
+        return {
+            "source": self.source,
+            "assembly": summary.assembly,
+            "build": summary.build,
+            "build_detected": summary.detect_build() == summary.build,
+            "snp_count": self.snp_count,
+            "chromosomes": chromosomes.chromosomes_summary,
+            "sex": summary.sex,
+        }
+
+    def save(self, file, genotypes_path, genetic_map=None):
+        """ Save merged SNPs.
+
+        Parameters
+        ----------
+        file : str
+            path to save merged SNPs as a `lineage` SNPs file
+        genotypes_path : str
+            path to save canonical genotypes of merged SNPs
+        genetic_map : dict
+            genetic map used to save genetic positions of SNPs
+
+        Returns
+        -------
+        dict
+            summary info of merged SNPs if any SNPs are merged, else None
+        """
+        summary_info = self.get_summary()
+        if summary_info is None:
+            return None
+
+        # same header as `SNPs.save_snps`
+        comment = (
+            "# Source(s): {}\n"
+            "# Assembly: {}\n"
+            "# SNPs: {}\n"
+            "# Chromosomes: {}\n".format(
+                summary_info["source"],
+                summary_info["assembly"],
+                summary_info["snp_count"],
+                summary_info["chromosomes"],
+            )
+        )
+
+        paths = []
+        for i, chrom in enumerate(self.chromosomes):
+            snps = self._load_partition(chrom)
+
+            if i == 0:
+                save_df_as_csv(
+                    snps,
+                    os.path.dirname(file),
+                    os.path.basename(file),
+                    comment=comment,
+                    header=["chromosome", "position", "genotype"],
+                )
+            else:
+                with open(file, "a") as f:
+                    snps.to_csv(f, na_rep="--", header=False)
+
+            cM = None
+            if genetic_map is not None:
+                cM = compute_genetic_positions(
+                    snps["chrom"].values, snps["pos"].values, genetic_map
+                )
+
+            paths.append(self._get_partition_path(chrom) + ".genotypes")
+            save_genotypes(snps, paths[-1], cM=cM)
+
+        concatenate_genotypes(
+            paths,
+            genotypes_path,
+            build=summary_info["build"],
+            build_detected=self._build_detected,
+            source=summary_info["source"],
+        )
+
+        for path in paths:
+            delete_genotypes(path)
+
+        return summary_info
@@ -0,0 +1,82 @@
+import os
+
+from django.db import migrations
+import numpy as np
+import pandas as pd
+
+# frozen copy of `lineage_app.segments`, so this migration doesn't change with the app
+SEGMENTS_EXT = ".npy"
+
+SEGMENT_COLUMNS = ["segment_col", "chrom", "start", "end", "cMs", "snps"]
+
+
+def save_segments(shared_dna, path):
+    chrom = shared_dna["chrom"].values.astype(str).astype("S")
+
+    dtype = [
+        ("segment_col", np.int64),
+        ("chrom", chrom.dtype),
+        ("start", np.int64),
+        ("end", np.int64),
+        ("cMs", np.float64),
+        ("snps", np.int64),
+    ]
+    for column in SEGMENT_COLUMNS:
+        dtype += [("asc_" + column, np.int64), ("desc_" + column, np.int64)]
+
+    segments = np.zeros(len(shared_dna), dtype=dtype)
+    segments["segment_col"] = shared_dna.index.values
+    segments["chrom"] = chrom
+    for column in ["start", "end", "cMs", "snps"]:
+        segments[column] = shared_dna[column].values
+
+    for column in SEGMENT_COLUMNS:
+        values = segments[column]
+        segments["asc_" + column] = np.argsort(values, kind="mergesort")
+        segments["desc_" + column] = (
+            len(values) - 1 - np.argsort(values[::-1], kind="mergesort")[::-1]
+        )
+
+    with open(path, "wb") as f:
+        np.save(f, segments)
+
+
+def convert_pickles_to_segments(apps, schema_editor):
+    SharedDnaGenes = apps.get_model("lineage_app", "SharedDnaGenes")
+
+    for shared_dna_genes in SharedDnaGenes.objects.all():
+        for field_name in [
+            "shared_dna_one_chrom_segments",
+            "shared_dna_two_chrom_segments",
+        ]:
+            field = getattr(shared_dna_genes, field_name)
+            if not field or not field.name.endswith(".pkl.gz"):
+                continue
+
+            pickle_path = field.path
+            field.name = field.name[: -len(".pkl.gz")] + SEGMENTS_EXT
+
+            if os.path.exists(pickle_path):
+                save_segments(pd.read_pickle(pickle_path), field.path)
+                os.remove(pickle_path)
+
+        shared_dna_genes.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("lineage_app", "0002_auto_20190129_0733")]
+
+    operations = [
+        migrations.RenameField(
+            model_name="shareddnagenes",
+            old_name="shared_dna_one_chrom_pickle",
+            new_name="shared_dna_one_chrom_segments",
+        ),
+        migrations.RenameField(
+            model_name="shareddnagenes",
+            old_name="shared_dna_two_chrom_pickle",
+            new_name="shared_dna_two_chrom_segments",
+        ),
+        migrations.RunPython(convert_pickles_to_segments, migrations.RunPython.noop),
+    ]
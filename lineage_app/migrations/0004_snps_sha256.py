@@ -0,0 +1,14 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("lineage_app", "0003_shared_dna_segments")]
+
+    operations = [
+        migrations.AddField(
+            model_name="snps",
+            name="sha256",
+            field=models.CharField(default="", editable=False, max_length=64),
+        )
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("lineage_app", "0004_snps_sha256")]
+
+    operations = [
+        migrations.AddField(
+            model_name="individual",
+            name="merge_request_id",
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="individual",
+            name="merge_started_at",
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+    ]
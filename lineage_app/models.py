@@ -1,10 +1,9 @@
+from datetime import timedelta
 from decimal import Decimal
-import gzip
 import os
 import logging
 import re
 import shutil
-import tempfile
 from uuid import uuid4
 
 from django.conf import settings
@@ -12,13 +11,46 @@ from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
 from django.dispatch import receiver
 from django.db import models
+from django.db.models import Q
 from django.db.models.signals import pre_delete
 from django.urls import reverse
+from django.utils import timezone
 from lineage import Lineage, save_df_as_csv
 from lineage.snps import SNPs
 import pandas as pd
 
-from .storage import SendFileFileSystemStorage
+from .builds import ASSEMBLIES, REMAPPED_BUILDS, delete_remapped_snps, get_remapped_snps
+from .cohort import cohort_lock, load_cohort, update_cohort
+from .compression import compress_file, compress_files
+from .discordant_snps import find_packed_discordant_snps
+from .genotypes import GENOTYPES_EXT, genotypes_exist, move_genotypes, save_genotypes
+from .merge import ChromosomeMerge
+from .memo import (
+    delete_memo,
+    get_memo_key,
+    get_sha256,
+    load_memo,
+    restore_memo_files,
+    save_memo,
+)
+from .packed import load_packed_genotypes
+from .relatedness import get_relatedness_path, update_relatedness
+from .resources import get_genetic_map, get_lineage
+from .segments import SEGMENTS_EXT, save_segments
+from .shared_dna import (
+    align_packed_snps,
+    compute_genetic_positions,
+    find_packed_shared_dna_runs,
+    find_shared_dna_from_runs,
+    get_runs_min_cM,
+    get_shared_dna,
+    load_shared_dna_runs,
+    prune_shared_dna_runs,
+    save_shared_dna_runs,
+    screen_packed_shared_dna,
+)
+from .storage import SendFileFileSystemStorage, stage_file
+from .workspace import get_staged_path, publish, workspace
 
 User = get_user_model()
 
@@ -27,18 +59,142 @@ logger = logging.getLogger(__name__)
 sendfile_storage = SendFileFileSystemStorage()
 
 
-def parse_snps(file):
-    summary_info = None
-    is_valid = False
+def parse_individual(file, output_dir):
+    """ Create an individual with the SNPs of a raw data file, as `lineage` does for an analysis.
+
+    PAR SNPs aren't assigned to the X and Y chromosomes, which may need Ensembl's REST API.
+
+    Parameters
+    ----------
+    file : str
+        path to raw data file
+    output_dir : str
+        path to output directory
+
+    Returns
+    -------
+    lineage.individual.Individual
+    """
+    l = Lineage(output_dir=output_dir, parallelize=False)
+    ind = l.create_individual("snps")
+    # the same as `Individual.load_snps`, except for the assignment of PAR SNPs
+    ind._add_snps(SNPs(file, assign_par_snps=False), 100, 500, False)
+    return ind
+
+
+def load_snps(file, output_dir):
+    """ Load a raw data file the same way `lineage` loads it for an analysis.
+
+    Parameters
+    ----------
+    file : str
+        path to raw data file
+    output_dir : str
+        path to output directory
+
+    Returns
+    -------
+    lineage.individual.Individual
+        SNPs loaded from `file` if valid, else None
+    """
     try:
-        # just getting summary, don't need to assign PAR SNPs to a chromosome
-        snps = SNPs(file, assign_par_snps=False)
-        summary_info = snps.get_summary()
-        is_valid = snps.is_valid()
+        ind = parse_individual(file, output_dir)
+        if ind.is_valid():
+            return ind
     except Exception as err:
         logger.error(err)
 
-    return summary_info, is_valid
+    return None
+
+
+def get_file_ext(path):
+    """ Get the extension of a raw data file, which determines how the file is parsed. """
+    if ".zip" in path:
+        return ".zip"
+    elif ".csv.gz" in path:
+        return ".csv.gz"
+    elif ".txt.gz" in path:
+        return ".txt.gz"
+    elif ".gz" in path:
+        return ".gz"
+    elif ".csv" in path:
+        return ".csv"
+    else:
+        return ".txt"
+
+
+def save_individual_genotypes(ind, genotypes_path):
+    """ Save canonical genotypes of SNPs loaded by `lineage`.
+
+    Genetic positions are also saved for SNPs in GRCh37.
+
+    Parameters
+    ----------
+    ind : lineage.individual.Individual
+    genotypes_path : str
+        path to genotypes directory
+    """
+    cM = None
+    if ind.build == 37:
+        genetic_map = get_genetic_map()
+        if genetic_map is not None:
+            cM = compute_genetic_positions(
+                ind.snps["chrom"].values, ind.snps["pos"].values, genetic_map
+            )
+
+    save_genotypes(
+        ind.snps,
+        genotypes_path,
+        build=ind.build,
+        build_detected=ind.build_detected,
+        source=ind.source,
+        cM=cM,
+    )
+
+
+def ingest_snps(file, output_dir, user_uuid):
+    """ Load a raw data file and save its canonical genotypes.
+
+    Results are memoized by the SHA-256 of the file, so a file that has already been ingested
+    (e.g., the same raw data uploaded again) isn't parsed again.
+
+    Parameters
+    ----------
+    file : str
+        path to raw data file
+    output_dir : str
+        path to output directory
+    user_uuid : str
+        UUID of the user the file belongs to
+
+    Returns
+    -------
+    summary_info : dict
+        summary info of SNPs, including the `sha256` of `file`, if valid, else None
+    genotypes_path : str
+        path to canonical genotypes in `output_dir` if valid, else None
+    """
+    sha256 = get_sha256(file)
+    key = get_memo_key("ingest", sha256, get_file_ext(file))
+    genotypes_path = os.path.join(output_dir, sha256 + GENOTYPES_EXT)
+
+    info = load_memo(user_uuid, key, refs=[sha256])
+    if info is not None and not restore_memo_files(key, {"genotypes": genotypes_path}):
+        info = None
+
+    if info is None:
+        ind = load_snps(file, output_dir)
+
+        if ind is None:
+            return None, None
+
+        info = {"summary_info": ind.get_summary()}
+        save_individual_genotypes(ind, genotypes_path)
+        save_memo(user_uuid, key, info, {"genotypes": genotypes_path}, refs=[sha256])
+
+    summary_info = info["summary_info"]
+    summary_info["sha256"] = sha256
+    return summary_info, genotypes_path
 
 
 def get_relative_user_dir(user_uuid):
@@ -62,6 +218,45 @@ def remove_user_dir_if_empty(user_uuid):
             os.rmdir(user_dir)
 
 
+def update_user_cohort(user):
+    """ Update the cohort of a user with the canonical SNPs of their individuals.
+
+    Individuals without canonical SNPs in GRCh37 aren't in the cohort. The relatedness of the
+    individuals is found whenever the cohort changes.
+
+    Parameters
+    ----------
+    user : User
+
+    Returns
+    -------
+    bool
+        True if the cohort was changed
+    """
+    with cohort_lock(user.uuid), workspace() as tmpdir:
+        individuals = []
+
+        for individual in user.individuals.all().order_by("created_at"):
+            snps = individual.get_canonical_snps()
+            if not snps or not snps.setup_complete or snps.build != 37:
+                continue
+
+            individuals.append(
+                {
+                    "individual": individual.uuid,
+                    "sha256": snps.get_sha256(),
+                    "genotypes_path": snps.get_genotypes(tmpdir),
+                }
+            )
+
+        changed = update_cohort(user.uuid, individuals)
+
+        if changed or not os.path.exists(get_relatedness_path(user.uuid)):
+            update_relatedness(user.uuid)
+
+        return changed
+
+
 def clean_string(s):
     """ Clean a string so that it can be a valid Python variable name.
 
@@ -79,13 +274,102 @@ def clean_string(s):
     return re.sub("\W|^(?=\d)", "_", s)
 
 
-def compress_file(path_in, path_out):
-    # https://stackoverflow.com/a/25729514
-    with open(path_in, "rb") as f_in:
-        with open(path_out, "wb") as f_out:
-            gz = gzip.GzipFile("", "wb", 9, f_out, 0.0)
-            gz.write(f_in.read())
-            gz.close()
+def dedupe_files(obj):
+    """ Deduplicate the files of a model instance in `sendfile_storage`. """
+    for field in obj._meta.get_fields():
+        if isinstance(field, models.FileField):
+            f = getattr(obj, field.name)
+            if f:
+                f.storage.dedupe(f.name)
+
+
+def publish_files(obj, workspace_dir):
+    """ Publish the files of a model instance staged in a workspace. """
+    os.makedirs(get_absolute_user_dir(obj.user.uuid), exist_ok=True)
+
+    for field in obj._meta.get_fields():
+        if isinstance(field, models.FileField):
+            f = getattr(obj, field.name)
+            if f:
+                staged_path = get_staged_path(workspace_dir, f.path)
+                if os.path.exists(staged_path):
+                    publish(staged_path, f.path)
+
+
+def save_results_memo(key, obj, sha256s):
+    """ Memoize the results of an analysis.
+
+    The results are the files and `total_` summary statistics of `obj`.
+
+    Parameters
+    ----------
+    key : str
+        key returned by `get_memo_key`
+    obj : SharedDnaGenes or DiscordantSnps
+        analysis with results
+    sha256s : list of str
+        SHA-256s of the SNPs files analyzed
+    """
+    info = {}
+    files = {}
+
+    for field in obj._meta.get_fields():
+        if isinstance(field, models.FileField):
+            f = getattr(obj, field.name)
+            if f:
+                # results are named by UUID; keep the extension
+                info[field.name] = os.path.basename(f.name)[len(str(uuid4())) :]
+                files[field.name] = f.path
+        elif field.name.startswith("total_"):
+            info[field.name] = getattr(obj, field.name)
+
+    save_memo(obj.user.uuid, key, info, files, refs=list(sha256s) + [obj.uuid])
+
+
+def restore_results_memo(key, obj, sha256s):
+    """ Restore memoized results of an analysis.
+
+    Parameters
+    ----------
+    key : str
+        key returned by `get_memo_key`
+    obj : SharedDnaGenes or DiscordantSnps
+        analysis to restore results to
+    sha256s : list of str
+        SHA-256s of the SNPs files analyzed
+
+    Returns
+    -------
+    bool
+        True if results were restored
+    """
+    info = load_memo(obj.user.uuid, key, refs=list(sha256s) + [obj.uuid])
+    if info is None:
+        return False
+
+    os.makedirs(get_absolute_user_dir(obj.user.uuid), exist_ok=True)
+
+    files = {}
+    names = {}
+    for field in obj._meta.get_fields():
+        if field.name in info and isinstance(field, models.FileField):
+            f = getattr(obj, field.name)
+            names[field.name] = f.name
+            f.name = get_relative_user_dir_file(
+                obj.user.uuid, uuid4(), info[field.name]
+            )
+            files[field.name] = f.path
+
+    if not restore_memo_files(key, files):
+        for name, previous_name in names.items():
+            getattr(obj, name).name = previous_name
+        return False
+
+    for field in obj._meta.get_fields():
+        if field.name in info and not isinstance(field, models.FileField):
+            setattr(obj, field.name, info[field.name])
+
+    return True
 
 
 class Individual(models.Model):
@@ -95,6 +379,9 @@ class Individual(models.Model):
     openhumans_individual = models.BooleanField(default=False, editable=False)
     locked = models.BooleanField(default=False, editable=False)
     created_at = models.DateTimeField(auto_now_add=True, editable=False)
+    # latest request to merge SNPs files; earlier requests are coalesced into it
+    merge_request_id = models.UUIDField(null=True, editable=False)
+    merge_started_at = models.DateTimeField(null=True, editable=False)
 
     def __str__(self):
         return str(self.name)
@@ -132,16 +419,62 @@ class Individual(models.Model):
 
     @property
     def merging_in_progress(self):
-        return False
+        return self.merge_started_at is not None
+
+    def request_merge(self):
+        """ Request a merge of this individual's SNPs files.
+
+        Only the latest request is carried out, so requests made in quick succession (e.g.,
+        by a multi-file upload) result in one merge of the final set of files.
+
+        Returns
+        -------
+        str
+            ID of the request
+        """
+        merge_request_id = uuid4()
+        Individual.objects.filter(pk=self.pk).update(merge_request_id=merge_request_id)
+        return str(merge_request_id)
+
+    def start_merge(self, merge_request_id):
+        """ Start a merge if the request is the latest and no merge is in progress.
+
+        A merge started longer ago than the task time limit is assumed to have failed.
+
+        Parameters
+        ----------
+        merge_request_id : str
+            ID returned by `request_merge`
+
+        Returns
+        -------
+        bool
+            True if the merge was started
+        """
+        stale = timezone.now() - timedelta(seconds=settings.CELERYD_TASK_TIME_LIMIT)
+
+        return (
+            Individual.objects.filter(pk=self.pk, merge_request_id=merge_request_id)
+            .filter(Q(merge_started_at=None) | Q(merge_started_at__lt=stale))
+            .update(merge_started_at=timezone.now())
+            == 1
+        )
+
+    def finish_merge(self):
+        Individual.objects.filter(pk=self.pk).update(merge_started_at=None)
+
+    def merge_is_requested(self, merge_request_id):
+        """ Check if a merge request is the latest. """
+        return Individual.objects.filter(
+            pk=self.pk, merge_request_id=merge_request_id
+        ).exists()
 
     def remapping_in_progress(self):
         return False
 
     def get_discrepant_snps(self):
-        try:
-            return self.discrepant_snps
-        except:
-            return None
+        # query rather than use the cached relation, which may have been deleted
+        return DiscrepantSnps.objects.filter(individual=self).first()
 
     def loading_snps(self):
         if self.snps.filter(setup_complete=False).count() > 0:
@@ -175,96 +508,264 @@ class Individual(models.Model):
         else:
             return None
 
+    def get_merged_snps(self):
+        """ Get the SNPs merged from this individual's SNPs files, in GRCh37.
+
+        Returns
+        -------
+        Snps
+            merged SNPs if they exist, else None
+        """
+        return self.snps.filter(generated_by_lineage=True, build=37).first()
+
+    def get_snps_files(self, builds):
+        """ Get this individual's merged SNPs files in builds.
+
+        Merged SNPs are remapped to builds other than GRCh37 on demand.
+
+        Parameters
+        ----------
+        builds : list of int
+
+        Returns
+        -------
+        dict
+            build to path of merged SNPs file, or None if SNPs couldn't be remapped; empty if
+            SNPs haven't been merged
+        """
+        merged_snps = self.get_merged_snps()
+        if not merged_snps:
+            return {}
+
+        files = {}
+        remapped_builds = []
+
+        for build in builds:
+            # SNPs may have been remapped when they were merged
+            snps = self.snps.filter(generated_by_lineage=True, build=build).first()
+            if snps:
+                files[build] = snps.file.path
+            else:
+                remapped_builds.append(build)
+
+        if remapped_builds:
+            files.update(merged_snps.get_remapped_files(remapped_builds))
+
+        return files
+
     def merge_snps(self):
+        """ Merge this individual's SNPs files.
+
+        If SNPs files were added since the last merge, only the new files are merged into the
+        existing merged SNPs.
+        """
         if not self.snps_can_be_merged:
             return
 
-        snps = self.snps.filter(generated_by_lineage=True)
-        if len(snps) == 1:
-            # remove SNPs generated by lineage since we're remaking that file
-            snps[0].delete()
-
-        if self.get_discrepant_snps():
-            # remove discrepant SNPs since we'll be refreshing that data
-            self.discrepant_snps.delete()
-
-        with tempfile.TemporaryDirectory() as tmpdir:
-            l = Lineage(output_dir=tmpdir, parallelize=False)
-
-            ind = l.create_individual("ind")
-            for snps in self.snps.all():
-                if snps.build != 37:
-                    temp = l.create_individual("temp", snps.file.path)
-                    temp.remap_snps(37, parallelize=False)
-                    temp_snps = temp.save_snps()
-                    ind.load_snps(temp_snps)
-                    del temp
-                else:
-                    ind.load_snps(snps.file.path)
+        snps_all = list(
+            self.snps.filter(generated_by_lineage=False, setup_complete=True).order_by(
+                "id"
+            )
+        )
+        if not snps_all:
+            return
 
-                snps.merged = True
-                snps.save()
+        merged_snps = self.get_merged_snps()
+        new_snps = [snps for snps in snps_all if not snps.merged]
 
-            if ind.snp_count != 0:
-                if len(ind.discrepant_snps) != 0:
-                    dsnps = DiscrepantSnps.objects.create(
-                        user=self.user,
-                        individual=self,
-                        snp_count=len(ind.discrepant_snps),
-                    )
-                    discrepant_snps_file = ind.save_discrepant_snps()
-                    dsnps.file.name = dsnps.get_relative_path()
-                    dsnps.save()
-                    shutil.move(discrepant_snps_file, dsnps.file.path)
-
-                merged_snps_file = ind.save_snps()
-                summary_info, snps_is_valid = parse_snps(merged_snps_file)
-
-                if snps_is_valid:
-                    summary_info["generated_by_lineage"] = True
-                    summary_info["merged"] = True
-                    self.add_snps(merged_snps_file, summary_info)
-
-    def remap_snps(self):
-        # SNPs already remapped
-        if len(self.snps.filter(generated_by_lineage=True)) == 3:
+        if merged_snps and not new_snps:
+            # all SNPs files have already been merged
             return
 
-        if len(self.snps.filter(generated_by_lineage=True)) == 1:
-            snps = self.snps.filter(generated_by_lineage=True).get()
-        else:
-            # TODO: merge SNPs here, but for now just get canonical SNPs; assume Build 37
-            snps = self.get_canonical_snps()
+        # merged SNPs are memoized by the SNPs files merged, in order
+        sha256s = [snps.get_sha256() for snps in snps_all]
+        key = get_memo_key("merge", sha256s)
+
+        with workspace() as tmpdir:
+            merged_snps_file = os.path.join(tmpdir, "lineage_GRCh37.csv")
+            discrepant_snps_file = os.path.join(tmpdir, "lineage_discrepant_snps.csv")
+            genotypes_path = merged_snps_file + GENOTYPES_EXT
+
+            def get_files(info):
+                files = {}
+                if info["discrepant_snp_count"] != 0:
+                    files["discrepant_snps"] = discrepant_snps_file
+                if info["summary_info"] is not None:
+                    files["file"] = merged_snps_file
+                    files["genotypes"] = genotypes_path
+                return files
+
+            info = load_memo(self.user.uuid, key, refs=sha256s)
+            if info is not None and not restore_memo_files(key, get_files(info)):
+                info = None
+
+            if info is None:
+                if merged_snps and len(new_snps) < len(snps_all):
+                    info = self._merge_new_snps(
+                        merged_snps,
+                        new_snps,
+                        tmpdir,
+                        merged_snps_file,
+                        discrepant_snps_file,
+                    )
+                else:
+                    info = self._merge_snps(
+                        snps_all, tmpdir, merged_snps_file, discrepant_snps_file
+                    )
 
-        if not snps:
-            return
+                save_memo(self.user.uuid, key, info, get_files(info), refs=sha256s)
 
-        with tempfile.TemporaryDirectory() as tmpdir:
-            l = Lineage(output_dir=tmpdir, parallelize=False)
+            # remove SNPs generated by lineage and discrepant SNPs since we're remaking them
+            for snps in self.snps.filter(generated_by_lineage=True):
+                snps.delete()
 
-            ind = l.create_individual("lineage_NCBI36", snps.file.path)
-            ind.remap_snps(36, parallelize=False)
-            file = ind.save_snps()
+            dsnps = self.get_discrepant_snps()
+            if dsnps:
+                dsnps.delete()
 
-            summary_info, snps_is_valid = parse_snps(file)
+            for snps in new_snps:
+                snps.merged = True
+                snps.save()
+
+            if info["discrepant_snp_count"] != 0:
+                dsnps = DiscrepantSnps.objects.create(
+                    user=self.user,
+                    individual=self,
+                    snp_count=info["discrepant_snp_count"],
+                )
+                dsnps.file.name = dsnps.get_relative_path()
+                dsnps.save()
+                publish(discrepant_snps_file, dsnps.file.path)
+                dedupe_files(dsnps)
 
-            if snps_is_valid:
+            summary_info = info["summary_info"]
+            if summary_info is not None:
                 summary_info["generated_by_lineage"] = True
                 summary_info["merged"] = True
-                self.add_snps(file, summary_info)
+                self.add_snps(
+                    merged_snps_file, summary_info, genotypes_path=genotypes_path
+                )
 
-            ind = l.create_individual("lineage_GRCh38", snps.file.path)
-            ind.remap_snps(38, parallelize=False)
-            file = ind.save_snps()
+    def _merge_snps(self, snps_all, tmpdir, merged_snps_file, discrepant_snps_file):
+        """ Merge SNPs files.
+
+        Parameters
+        ----------
+        snps_all : list of Snps
+            SNPs to merge, in order
+        tmpdir : str
+            path to temporary directory
+        merged_snps_file : str
+            path to save merged SNPs; canonical genotypes are saved alongside
+        discrepant_snps_file : str
+            path to save discrepant SNPs
+
+        Returns
+        -------
+        dict
+            `summary_info` of merged SNPs if valid, else None, and `discrepant_snp_count`
+        """
+        merge = ChromosomeMerge(tmpdir)
+        for snps in snps_all:
+            merge.add_genotypes(snps.get_genotypes(tmpdir))
 
-            summary_info, snps_is_valid = parse_snps(file)
+        return self._save_merge(
+            merge, merge.discrepant_snps, tmpdir, merged_snps_file, discrepant_snps_file
+        )
 
-            if snps_is_valid:
-                summary_info["generated_by_lineage"] = True
-                summary_info["merged"] = True
-                self.add_snps(file, summary_info)
+    def _merge_new_snps(
+        self, merged_snps, new_snps, tmpdir, merged_snps_file, discrepant_snps_file
+    ):
+        """ Merge new SNPs files into merged SNPs.
+
+        This is equivalent to merging all of the SNPs files, since each file is merged into
+        the SNPs merged from the files before it.
+
+        Parameters
+        ----------
+        merged_snps : Snps
+            SNPs merged from the files before `new_snps`
+        new_snps : list of Snps
+            SNPs to merge, in order
+        tmpdir : str
+            path to temporary directory
+        merged_snps_file : str
+            path to save merged SNPs; canonical genotypes are saved alongside
+        discrepant_snps_file : str
+            path to save discrepant SNPs, including those found by previous merges
+
+        Returns
+        -------
+        dict
+            `summary_info` of merged SNPs if valid, else None, and `discrepant_snp_count`
+        """
+        merge = ChromosomeMerge(tmpdir)
+        merge.load_genotypes(merged_snps.get_genotypes(tmpdir))
+        for snps in new_snps:
+            merge.add_genotypes(snps.get_genotypes(tmpdir))
+
+        # discrepant SNPs found by previous merges, plus those found merging new SNPs
+        discrepant_snps = merge.discrepant_snps
+        dsnps = self.get_discrepant_snps()
+        if dsnps:
+            discrepant_snps = pd.concat(
+                [
+                    pd.read_csv(
+                        dsnps.file.path,
+                        comment="#",
+                        index_col=0,
+                        dtype={"chrom": object, "chrom_added": object},
+                    ),
+                    discrepant_snps,
+                ],
+                sort=True,
+            )
+            if len(discrepant_snps) > 1:
+                discrepant_snps = discrepant_snps.drop_duplicates()
 
-    def add_snps(self, file, snps_info):
+        return self._save_merge(
+            merge, discrepant_snps, tmpdir, merged_snps_file, discrepant_snps_file
+        )
+
+    def _save_merge(
+        self, merge, discrepant_snps, tmpdir, merged_snps_file, discrepant_snps_file
+    ):
+        """ Save merged SNPs and discrepant SNPs for `_merge_snps` and `_merge_new_snps`. """
+        info = {"summary_info": None, "discrepant_snp_count": 0}
+
+        if merge.snp_count != 0:
+            if len(discrepant_snps) != 0:
+                info["discrepant_snp_count"] = len(discrepant_snps)
+                save_df_as_csv(
+                    discrepant_snps,
+                    tmpdir,
+                    os.path.basename(discrepant_snps_file),
+                    comment="# Source(s): {}\n".format(merge.source),
+                )
+
+            info["summary_info"] = merge.save(
+                merged_snps_file,
+                merged_snps_file + GENOTYPES_EXT,
+                genetic_map=get_genetic_map(),
+            )
+
+        return info
+
+    def add_snps(self, file, snps_info, ind=None, genotypes_path=None):
+        """ Add a SNPs file to this individual.
+
+        Parameters
+        ----------
+        file : str
+            path to SNPs file; file is moved to the individual's media directory
+        snps_info : dict
+            summary info of SNPs
+        ind : lineage.individual.Individual
+            SNPs loaded from `file`, used to save canonical genotypes
+        genotypes_path : str
+            path to canonical genotypes already saved for `file`; genotypes are moved to
+            the individual's media directory
+        """
         snps = self.snps.create(user=self.user, **snps_info)
 
         snps.file_ext = os.path.splitext(file)[1]
@@ -275,8 +776,17 @@ class Individual(models.Model):
         os.makedirs(get_absolute_user_dir(self.user.uuid), exist_ok=True)
 
         # move file to individual's media directory
-        shutil.move(file, snps.file.path)
+        publish(file, snps.file.path)
+
+        if ind is not None:
+            snps.save_genotypes(ind)
+        elif genotypes_path is not None:
+            move_genotypes(genotypes_path, snps.get_genotypes_path())
 
+        if not snps.sha256:
+            snps.sha256 = get_sha256(snps.file.path)
+
+        snps.dedupe()
         snps.setup_complete = True
 
         snps.save()
@@ -303,6 +813,8 @@ class Snps(models.Model):
     sex = models.CharField(
         default="", max_length=16, verbose_name="Determined Sex", editable=False
     )
+    # SHA-256 of file, used as the key of memoized results
+    sha256 = models.CharField(default="", max_length=64, editable=False)
     uploaded_at = models.DateTimeField(auto_now_add=True, editable=False)
     # https://stackoverflow.com/a/39725317
     # https://github.com/celery/celery/issues/1813#issuecomment-33142648
@@ -314,11 +826,34 @@ class Snps(models.Model):
 
     def delete(self, *args, **kwargs):
         self.file.delete()
+        sendfile_storage.delete(self.get_relative_genotypes_path())
+
+        if self.sha256:
+            # results memoized from this file
+            delete_memo(self.user.uuid, self.sha256)
+
+        if self.generated_by_lineage and self.sha256:
+            delete_remapped_snps(self.sha256)
 
         # deleting last SNP file so remove any discrepant SNPs
         if self.individual.snps.count() == 1:
-            if self.individual.get_discrepant_snps():
-                self.individual.discrepant_snps.delete()
+            dsnps = self.individual.get_discrepant_snps()
+            if dsnps:
+                dsnps.delete()
+
+        if self.merged and not self.generated_by_lineage:
+            # SNPs merged from this file are stale, so they'll be merged again from the
+            # remaining files
+            for snps in self.individual.snps.filter(generated_by_lineage=True):
+                snps.delete()
+
+            dsnps = self.individual.get_discrepant_snps()
+            if dsnps:
+                dsnps.delete()
+
+            self.individual.snps.filter(merged=True).exclude(id=self.id).update(
+                merged=False
+            )
 
         remove_user_dir_if_empty(self.user.uuid)
         super().delete(*args, **kwargs)
@@ -326,47 +861,167 @@ class Snps(models.Model):
     def get_relative_path(self):
         return get_relative_user_dir_file(self.user.uuid, self.uuid)
 
+    def get_relative_genotypes_path(self):
+        return get_relative_user_dir_file(self.user.uuid, self.uuid, GENOTYPES_EXT)
+
+    def get_genotypes_path(self):
+        return sendfile_storage.path(self.get_relative_genotypes_path())
+
+    def dedupe(self):
+        """ Deduplicate the file and canonical genotypes of these SNPs. """
+        dedupe_files(self)
+        sendfile_storage.dedupe(self.get_relative_genotypes_path())
+
+    def save_genotypes(self, ind):
+        """ Save canonical genotypes of these SNPs.
+
+        Genetic positions are also saved for SNPs in GRCh37.
+
+        Parameters
+        ----------
+        ind : lineage.individual.Individual
+            SNPs loaded from this ``Snps``'s file
+        """
+        save_individual_genotypes(ind, self.get_genotypes_path())
+
+    def get_sha256(self):
+        """ Get the SHA-256 of the file of these SNPs.
+
+        The SHA-256 is computed and saved for SNPs added before it was recorded.
+
+        Returns
+        -------
+        str
+        """
+        if not self.sha256:
+            self.sha256 = get_sha256(self.file.path)
+            Snps.objects.filter(id=self.id).update(sha256=self.sha256)
+
+        return self.sha256
+
+    def get_genotypes(self, tmpdir):
+        """ Get the path to the canonical genotypes of these SNPs.
+
+        If the canonical genotypes haven't been saved, the raw data file is parsed and the
+        canonical genotypes are saved for subsequent analyses.
+
+        Parameters
+        ----------
+        tmpdir : str
+            path to temporary directory for staging the raw data file
+
+        Returns
+        -------
+        str
+            path to genotypes directory
+        """
+        genotypes_path = self.get_genotypes_path()
+        if not genotypes_exist(genotypes_path):
+            # raw data is parsed based on the file extension
+            file = stage_file(
+                self.file.path, os.path.join(tmpdir, str(self.uuid) + self.file_ext)
+            )
+            self.save_genotypes(parse_individual(file, tmpdir))
+            sendfile_storage.dedupe(self.get_relative_genotypes_path())
+
+        return genotypes_path
+
+    def get_packed_genotypes(self, tmpdir, cohort=None):
+        """ Get the packed genotypes of these SNPs.
+
+        Parameters
+        ----------
+        tmpdir : str
+            path to temporary directory for staging the raw data file
+        cohort : Cohort
+            cohort of the user; genotypes are sliced from the cohort if it has a row made from
+            these SNPs, instead of loading them
+
+        Returns
+        -------
+        PackedGenotypes
+        """
+        if cohort is not None:
+            row = cohort.get_row(self.individual_id, self.get_sha256())
+            if row is not None:
+                return cohort.get_packed_genotypes(row)
+
+        return load_packed_genotypes(self.get_genotypes(tmpdir))
+
     def _get_filename_source(self):
         if self.generated_by_lineage:
             return "lineage"
         else:
             return self.source
 
-    def get_filename(self, include_individual_name=True):
+    def get_filename(self, include_individual_name=True, build=None):
         s = ""
         if include_individual_name:
             s += clean_string(self.individual.name) + "_"
         s += self._get_filename_source() + "_"
-        s += self.assembly + self.file_ext
+        s += (ASSEMBLIES[build] if build else self.assembly) + self.file_ext
         return s
 
-    def get_url(self):
+    def get_url(self, build=None):
+        if build:
+            return reverse("download_snps_build", args=[self.uuid, build])
         return reverse("download_snps", args=[self.uuid])
 
+    def get_remapped_files(self, builds):
+        """ Get these SNPs remapped to other builds.
+
+        Parameters
+        ----------
+        builds : list of int
+
+        Returns
+        -------
+        dict
+            build to path of remapped SNPs file, or None if SNPs couldn't be remapped
+        """
+        with workspace() as tmpdir:
+            return get_remapped_snps(
+                self.get_sha256(), self.get_genotypes(tmpdir), builds
+            )
+
+    def get_remapped_urls(self):
+        """ Get the assemblies and URLs these merged SNPs can be downloaded in. """
+        if not self.generated_by_lineage or self.build != 37:
+            return []
+
+        # SNPs may have been remapped when they were merged
+        builds = set(
+            self.individual.snps.filter(generated_by_lineage=True).values_list(
+                "build", flat=True
+            )
+        )
+
+        return [
+            (ASSEMBLIES[build], self.get_url(build))
+            for build in REMAPPED_BUILDS
+            if build not in builds
+        ]
+
     def setup(self, progress_recorder=None):
-        summary_info, snps_is_valid = parse_snps(self.file.path)
-        if snps_is_valid:
-            Snps.objects.filter(id=self.id).update(**summary_info)
-            self.refresh_from_db()
-            os.makedirs(get_absolute_user_dir(self.user.uuid), exist_ok=True)
-            original_path = self.file.path
-            if ".zip" in original_path:
-                self.file_ext = ".zip"
-            elif ".csv.gz" in original_path:
-                self.file_ext = ".csv.gz"
-            elif ".txt.gz" in original_path:
-                self.file_ext = ".txt.gz"
-            elif ".gz" in original_path:
-                self.file_ext = ".gz"
-            elif ".csv" in original_path:
-                self.file_ext = ".csv"
-            else:
-                self.file_ext = ".txt"
-            self.file.name = self.get_relative_path()
-            shutil.move(original_path, self.file.path)
-            self.setup_complete = True
-            self.save()
-        else:
+        with workspace() as tmpdir:
+            summary_info, genotypes_path = ingest_snps(
+                self.file.path, tmpdir, self.user.uuid
+            )
+
+            if summary_info is not None:
+                Snps.objects.filter(id=self.id).update(**summary_info)
+                self.refresh_from_db()
+                os.makedirs(get_absolute_user_dir(self.user.uuid), exist_ok=True)
+                original_path = self.file.path
+                self.file_ext = get_file_ext(original_path)
+                self.file.name = self.get_relative_path()
+                publish(original_path, self.file.path)
+                move_genotypes(genotypes_path, self.get_genotypes_path())
+                self.dedupe()
+                self.setup_complete = True
+                self.save()
+
+        if summary_info is None:
             self.delete()
 
 
@@ -440,13 +1095,13 @@ class SharedDnaGenes(models.Model):
     shared_dna_one_chrom_csv = models.FileField(
         storage=sendfile_storage, editable=False
     )
-    shared_dna_one_chrom_pickle = models.FileField(
+    shared_dna_one_chrom_segments = models.FileField(
         storage=sendfile_storage, editable=False
     )
     shared_dna_two_chrom_csv = models.FileField(
         storage=sendfile_storage, editable=False
     )
-    shared_dna_two_chrom_pickle = models.FileField(
+    shared_dna_two_chrom_segments = models.FileField(
         storage=sendfile_storage, editable=False
     )
     shared_genes_one_chrom_csv = models.FileField(
@@ -516,19 +1171,10 @@ class SharedDnaGenes(models.Model):
                 # https://stackoverflow.com/a/9379402
                 getattr(self, field.name).delete()
 
+        delete_memo(self.user.uuid, self.uuid)
         remove_user_dir_if_empty(self.user.uuid)
         super().delete(*args, **kwargs)
 
-    def get_shared_dna_one_chrom(self):
-        df = pd.read_pickle(self.shared_dna_one_chrom_pickle.path)
-        df["segment_col"] = df.index
-        return df.to_dict("records")
-
-    def get_shared_dna_two_chrom(self):
-        df = pd.read_pickle(self.shared_dna_two_chrom_pickle.path)
-        df["segment_col"] = df.index
-        return df.to_dict("records")
-
     def get_shared_dna_plot_png_url(self):
         return reverse("shared_dna_plot", args=[self.uuid])
 
@@ -594,7 +1240,20 @@ class SharedDnaGenes(models.Model):
         s += ".csv.gz"
         return s
 
-    def find_shared_dna_genes(self, progress_recorder=None):
+    def find_shared_dna_genes(self, progress_recorder=None, genotypes=None):
+        """ Find the shared DNA and genes between the individuals.
+
+        The runs of matching SNPs of the individuals don't depend on the thresholds, so they're
+        memoized; results for other thresholds are derived from the runs without loading the
+        individuals' genotypes.
+
+        Parameters
+        ----------
+        progress_recorder : ProgressRecorder
+        genotypes : dict
+            `Snps` ID to packed genotypes already loaded (e.g., for a batch of pairs);
+            genotypes of other SNPs are loaded
+        """
         ind1_snps = self.individual1.get_canonical_snps()
         ind2_snps = self.individual2.get_canonical_snps()
 
@@ -602,27 +1261,118 @@ class SharedDnaGenes(models.Model):
             self.delete()
             return
 
-        with tempfile.TemporaryDirectory() as tmpdir:
-            l = Lineage(output_dir=tmpdir, parallelize=False)
+        sha256s = [ind1_snps.get_sha256(), ind2_snps.get_sha256()]
+
+        # outputs are named by individual, so names are part of the key
+        key = get_memo_key(
+            "shared_dna_genes",
+            sha256s[0],
+            sha256s[1],
+            self.individual1.name,
+            self.individual2.name,
+            "{:.2f}".format(self.cM_threshold),
+            int(self.snp_threshold),
+        )
 
-            ind1_snps_file = shutil.copy(
-                ind1_snps.file.path,
-                os.path.join(tmpdir, "ind1_snps" + ind1_snps.file_ext),
-            )
+        if restore_results_memo(key, self, sha256s):
+            # restored files are referenced like any other files
+            dedupe_files(self)
+        else:
+            self._find_shared_dna_genes(ind1_snps, ind2_snps, genotypes or {})
 
-            ind2_snps_file = shutil.copy(
-                ind2_snps.file.path,
-                os.path.join(tmpdir, "ind2_snps" + ind2_snps.file_ext),
-            )
+            dedupe_files(self)
+            save_results_memo(key, self, sha256s)
+
+        self.setup_complete = True
+        self.save()
 
-            ind1 = l.create_individual(self.individual1.name, ind1_snps_file)
-            ind2 = l.create_individual(self.individual2.name, ind2_snps_file)
+    def _get_shared_dna_runs(self, l, tmpdir, ind1_snps, ind2_snps, genotypes):
+        # runs depend only on the genotypes of the individuals
+        sha256s = [ind1_snps.get_sha256(), ind2_snps.get_sha256()]
+        key = get_memo_key("shared_dna_runs", sha256s[0], sha256s[1])
+        path = os.path.join(tmpdir, "runs.npz")
+
+        info = load_memo(self.user.uuid, key, refs=sha256s)
+        memoized = info is not None and restore_memo_files(key, {"runs": path})
+        if memoized:
+            try:
+                runs = load_shared_dna_runs(path)
+                if float(self.cM_threshold) >= get_runs_min_cM(runs):
+                    return runs
+            except (OSError, ValueError):
+                # memoized runs are corrupt
+                memoized = False
+
+        cohort = load_cohort(self.user.uuid)
+        packed1, packed2 = [
+            genotypes[snps.id]
+            if snps.id in genotypes
+            else snps.get_packed_genotypes(tmpdir, cohort)
+            for snps in [ind1_snps, ind2_snps]
+        ]
+
+        # SNPs are aligned once for the screen and the runs
+        aligned = align_packed_snps(packed1, packed2)
+
+        if not screen_packed_shared_dna(
+            packed1,
+            packed2,
+            cM_threshold=float(self.cM_threshold),
+            snp_threshold=int(self.snp_threshold),
+            aligned=aligned,
+        ):
+            # no shared DNA, so the runs aren't needed
+            return None
+
+        runs = find_packed_shared_dna_runs(
+            l,
+            l.create_individual(self.individual1.name),
+            l.create_individual(self.individual2.name),
+            packed1,
+            packed2,
+            aligned=aligned,
+        )
 
-            shared_dna_one_chrom, shared_dna_two_chrom, shared_genes_one_chrom, shared_genes_two_chrom = l.find_shared_dna(
-                ind1,
-                ind2,
-                cM_threshold=float(self.cM_threshold),
-                snp_threshold=int(self.snp_threshold),
+        if not memoized:
+            save_shared_dna_runs(
+                prune_shared_dna_runs(runs, settings.SHARED_DNA_RUNS_MIN_CM), path
+            )
+            save_memo(self.user.uuid, key, {}, {"runs": path}, refs=sha256s)
+
+        return runs
+
+    def _find_shared_dna_genes(self, ind1_snps, ind2_snps, genotypes):
+        with workspace() as tmpdir:
+            l = get_lineage(tmpdir)
+
+            runs = self._get_shared_dna_runs(l, tmpdir, ind1_snps, ind2_snps, genotypes)
+
+            cM_threshold = float(self.cM_threshold)
+            snp_threshold = int(self.snp_threshold)
+
+            if runs is None or not any(
+                get_shared_dna(runs, cM_threshold, snp_threshold)
+            ):
+                # no shared DNA, so there are no shared genes, files, or plot to make
+                self.total_shared_segments_one_chrom = 0
+                self.total_shared_segments_two_chrom = 0
+                self.total_shared_cMs_one_chrom = Decimal(0)
+                self.total_shared_cMs_two_chrom = Decimal(0)
+                self.total_snps_one_chrom = 0
+                self.total_snps_two_chrom = 0
+                self.total_chrom_one_chrom = 0
+                self.total_chrom_two_chrom = 0
+                self.total_shared_genes_one_chrom = 0
+                self.total_shared_genes_two_chrom = 0
+                return
+
+            shared_dna_one_chrom, shared_dna_two_chrom, shared_genes_one_chrom, shared_genes_two_chrom = find_shared_dna_from_runs(
+                l,
+                l.create_individual(self.individual1.name),
+                l.create_individual(self.individual2.name),
+                runs,
+                cM_threshold=cM_threshold,
+                snp_threshold=snp_threshold,
                 shared_genes=True,
                 save_output=True,
             )
@@ -638,6 +1388,8 @@ class SharedDnaGenes(models.Model):
             self.total_shared_genes_one_chrom = len(shared_genes_one_chrom)
             self.total_shared_genes_two_chrom = len(shared_genes_two_chrom)
 
+            compress_tasks = []
+
             for root, dirs, files in os.walk(tmpdir):
                 for file in files:
                     file_path = os.path.join(root, file)
@@ -645,67 +1397,110 @@ class SharedDnaGenes(models.Model):
                         self.shared_dna_plot_png.name = get_relative_user_dir_file(
                             self.user.uuid, uuid4(), ".png"
                         )
-                        shutil.move(file_path, self.shared_dna_plot_png.path)
-                        os.chmod(self.shared_dna_plot_png.path, 0o640)
+                        staged_path = get_staged_path(
+                            tmpdir, self.shared_dna_plot_png.path
+                        )
+                        shutil.move(file_path, staged_path)
+                        os.chmod(staged_path, 0o640)
 
                     elif "shared_dna_one_chrom" in file:
                         self.shared_dna_one_chrom_csv = get_relative_user_dir_file(
                             self.user.uuid, uuid4()
                         )
-                        compress_file(file_path, self.shared_dna_one_chrom_csv.path)
+                        compress_tasks.append(
+                            (
+                                file_path,
+                                get_staged_path(
+                                    tmpdir, self.shared_dna_one_chrom_csv.path
+                                ),
+                            )
+                        )
 
-                        self.shared_dna_one_chrom_pickle = get_relative_user_dir_file(
-                            self.user.uuid, uuid4(), ".pkl.gz"
+                        self.shared_dna_one_chrom_segments = get_relative_user_dir_file(
+                            self.user.uuid, uuid4(), SEGMENTS_EXT
                         )
 
-                        shared_dna_one_chrom.to_pickle(
-                            self.shared_dna_one_chrom_pickle.path
+                        save_segments(
+                            shared_dna_one_chrom,
+                            get_staged_path(
+                                tmpdir, self.shared_dna_one_chrom_segments.path
+                            ),
                         )
 
                     elif "shared_genes_one_chrom" in file:
                         self.shared_genes_one_chrom_csv = get_relative_user_dir_file(
                             self.user.uuid, uuid4()
                         )
-                        compress_file(file_path, self.shared_genes_one_chrom_csv.path)
+                        compress_tasks.append(
+                            (
+                                file_path,
+                                get_staged_path(
+                                    tmpdir, self.shared_genes_one_chrom_csv.path
+                                ),
+                            )
+                        )
 
                         self.shared_genes_one_chrom_pickle = get_relative_user_dir_file(
                             self.user.uuid, uuid4(), ".pkl.gz"
                         )
 
                         shared_genes_one_chrom.to_pickle(
-                            self.shared_genes_one_chrom_pickle.path
+                            get_staged_path(
+                                tmpdir, self.shared_genes_one_chrom_pickle.path
+                            )
                         )
 
                     elif "shared_dna_two_chrom" in file:
                         self.shared_dna_two_chrom_csv = get_relative_user_dir_file(
                             self.user.uuid, uuid4()
                         )
-                        compress_file(file_path, self.shared_dna_two_chrom_csv.path)
+                        compress_tasks.append(
+                            (
+                                file_path,
+                                get_staged_path(
+                                    tmpdir, self.shared_dna_two_chrom_csv.path
+                                ),
+                            )
+                        )
 
-                        self.shared_dna_two_chrom_pickle = get_relative_user_dir_file(
-                            self.user.uuid, uuid4(), ".pkl.gz"
+                        self.shared_dna_two_chrom_segments = get_relative_user_dir_file(
+                            self.user.uuid, uuid4(), SEGMENTS_EXT
                         )
 
-                        shared_dna_two_chrom.to_pickle(
-                            self.shared_dna_two_chrom_pickle.path
+                        save_segments(
+                            shared_dna_two_chrom,
+                            get_staged_path(
+                                tmpdir, self.shared_dna_two_chrom_segments.path
+                            ),
                         )
 
                     elif "shared_genes_two_chrom" in file:
                         self.shared_genes_two_chrom_csv = get_relative_user_dir_file(
                             self.user.uuid, uuid4()
                         )
-                        compress_file(file_path, self.shared_genes_two_chrom_csv.path)
+                        compress_tasks.append(
+                            (
+                                file_path,
+                                get_staged_path(
+                                    tmpdir, self.shared_genes_two_chrom_csv.path
+                                ),
+                            )
+                        )
 
                         self.shared_genes_two_chrom_pickle = get_relative_user_dir_file(
                             self.user.uuid, uuid4(), ".pkl.gz"
                         )
 
                         shared_genes_two_chrom.to_pickle(
-                            self.shared_genes_two_chrom_pickle.path
+                            get_staged_path(
+                                tmpdir, self.shared_genes_two_chrom_pickle.path
+                            )
                         )
 
-        self.setup_complete = True
-        self.save()
+            # compress outputs concurrently
+            compress_files(compress_tasks)
+
+            publish_files(self, tmpdir)
 
 
 class DiscordantSnps(models.Model):
@@ -767,6 +1562,7 @@ class DiscordantSnps(models.Model):
                 # https://stackoverflow.com/a/9379402
                 getattr(self, field.name).delete()
 
+        delete_memo(self.user.uuid, self.uuid)
         remove_user_dir_if_empty(self.user.uuid)
         super().delete(*args, **kwargs)
 
@@ -804,35 +1600,44 @@ class DiscordantSnps(models.Model):
             if not ind3_snps:
                 self.delete()
                 return
+        else:
+            ind3_snps = None
 
-        with tempfile.TemporaryDirectory() as tmpdir:
-            l = Lineage(output_dir=tmpdir, parallelize=False)
-
-            ind1_snps_file = shutil.copy(
-                ind1_snps.file.path,
-                os.path.join(tmpdir, "ind1_snps" + ind1_snps.file_ext),
-            )
+        sha256s = [
+            snps.get_sha256() for snps in [ind1_snps, ind2_snps, ind3_snps] if snps
+        ]
 
-            ind2_snps_file = shutil.copy(
-                ind2_snps.file.path,
-                os.path.join(tmpdir, "ind2_snps" + ind2_snps.file_ext),
-            )
+        # outputs are named by individual, so names are part of the key
+        key = get_memo_key("discordant_snps", sha256s, self._get_individuals_str())
 
-            if self.individual3:
-                ind3_snps_file = shutil.copy(
-                    ind3_snps.file.path,
-                    os.path.join(tmpdir, "ind3_snps" + ind3_snps.file_ext),
-                )
-
-            ind1 = l.create_individual(self.individual1.name, ind1_snps_file)
-            ind2 = l.create_individual(self.individual2.name, ind2_snps_file)
+        if restore_results_memo(key, self, sha256s):
+            # restored files are referenced like any other files
+            dedupe_files(self)
+        else:
+            self._find_discordant_snps(ind1_snps, ind2_snps, ind3_snps)
+            dedupe_files(self)
+            save_results_memo(key, self, sha256s)
 
-            if self.individual3:
-                ind3 = l.create_individual(self.individual3.name, ind3_snps_file)
-            else:
-                ind3 = None
+        self.setup_complete = True
+        self.save()
 
-            discordant_snps = l.find_discordant_snps(ind1, ind2, ind3, save_output=True)
+    def _find_discordant_snps(self, ind1_snps, ind2_snps, ind3_snps):
+        with workspace() as tmpdir:
+            l = get_lineage(tmpdir)
+
+            individuals = [self.individual1, self.individual2, self.individual3]
+            cohort = load_cohort(self.user.uuid)
+
+            discordant_snps = find_packed_discordant_snps(
+                l,
+                [l.create_individual(ind.name) for ind in individuals if ind],
+                [
+                    snps.get_packed_genotypes(tmpdir, cohort)
+                    for snps in [ind1_snps, ind2_snps, ind3_snps]
+                    if snps
+                ],
+                save_output=True,
+            )
 
             self.total_discordant_snps = len(discordant_snps)
 
@@ -843,14 +1648,17 @@ class DiscordantSnps(models.Model):
                         self.discordant_snps_csv.name = get_relative_user_dir_file(
                             self.user.uuid, uuid4()
                         )
-                        compress_file(file_path, self.discordant_snps_csv.path)
-
                         self.discordant_snps_pickle = get_relative_user_dir_file(
                             self.user.uuid, uuid4(), ".pkl.gz"
                         )
-                        discordant_snps.to_pickle(self.discordant_snps_pickle.path)
+                        compress_file(
+                            file_path,
+                            get_staged_path(tmpdir, self.discordant_snps_csv.path),
+                        )
+                        discordant_snps.to_pickle(
+                            get_staged_path(tmpdir, self.discordant_snps_pickle.path)
+                        )
 
                         break
 
-        self.setup_complete = True
-        self.save()
+            publish_files(self, tmpdir)
@@ -0,0 +1,390 @@
+""" Compact, packed representation of the genotypes of an individual.
+
+Each allele of a call is encoded in 2 bits (A, C, G, T), so a diploid call takes half a byte, and
+missing and haploid calls are kept in bit masks. Calls with other alleles (e.g., insertions and
+deletions) are rare and are kept as bytes. Positions are stored as int32 arrays per chromosome.
+Besides rsids, a 1M-SNP individual takes about 5 MB instead of the hundreds of MB of a pandas
+frame, so a worker can hold many individuals at once.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .genotypes import encode_alleles, load_genotypes
+
+ALLELES = b"ACGT"
+
+# allele byte value to 2-bit code; alleles that can't be packed are 4
+_ALLELE_CODES = np.full(256, 4, dtype=np.uint8)
+_ALLELE_CODES[np.frombuffer(ALLELES, dtype=np.uint8)] = np.arange(4, dtype=np.uint8)
+
+_ALLELE_BYTES = np.frombuffer(ALLELES, dtype=np.uint8)
+
+
+def _get_bits(packed, ix):
+    return ((packed[ix >> 3] >> (7 - (ix & 7))) & 1).astype(bool)
+
+
+class PackedGenotypes:
+    """ Packed genotypes of an individual, in the order of its canonical genotypes.
+
+    Parameters
+    ----------
+    rsid : numpy.ndarray
+        bytes rsids
+    chrom : numpy.ndarray
+        bytes chromosome of each SNP
+    pos : numpy.ndarray
+        position of each SNP
+    genotype : numpy.ndarray
+        bytes genotypes (empty if null)
+    info : dict
+        `build`, `build_detected`, and `source` of the genotypes
+    cM : numpy.ndarray
+        genetic position of each SNP
+    """
+
+    def __init__(self, rsid, chrom, pos, genotype, info, cM=None):
+        self.rsid = np.array(rsid)
+        self.info = dict(info)
+        self.cM = None if cM is None else np.array(cM, dtype=np.float64)
+
+        self._pack_positions(np.asarray(chrom), np.asarray(pos))
+        self._pack_calls(np.asarray(genotype))
+
+    def __len__(self):
+        return len(self.rsid)
+
+    @property
+    def build(self):
+        return self.info["build"]
+
+    @property
+    def nbytes(self):
+        """ Bytes used by the arrays of these genotypes. """
+        arrays = [self.rsid, self._calls, self._missing, self._haploid]
+        arrays += [self._other_ix, self._other_genotype, self._starts]
+        arrays += self._pos
+        if self.cM is not None:
+            arrays.append(self.cM)
+        return sum(a.nbytes for a in arrays)
+
+    def _pack_positions(self, chrom, pos):
+        # SNPs are sorted by chromosome, so each chromosome is (usually) one run of SNPs
+        if len(chrom):
+            boundaries = np.flatnonzero(chrom[1:] != chrom[:-1]) + 1
+            self._starts = np.r_[0, boundaries, len(chrom)].astype(np.int64)
+        else:
+            self._starts = np.zeros(1, dtype=np.int64)
+
+        self._chroms = [c.decode() for c in chrom[self._starts[:-1]]]
+
+        dtype = np.int32
+        if len(pos) and pos.max() > np.iinfo(np.int32).max:
+            dtype = np.int64
+
+        self._pos = [
+            np.array(pos[start:end], dtype=dtype)
+            for start, end in zip(self._starts[:-1], self._starts[1:])
+        ]
+
+    def _pack_calls(self, genotype):
+        alleles, length = encode_alleles(genotype)
+        codes = _ALLELE_CODES[alleles]
+
+        self._missing = np.packbits(length == 0)
+        self._haploid = np.packbits(length == 1)
+
+        # calls with alleles that can't be packed are kept as bytes
+        other = (
+            (length > 2)
+            | ((length > 0) & (codes[:, 0] > 3))
+            | ((length > 1) & (codes[:, 1] > 3))
+        )
+        self._other_ix = np.flatnonzero(other)
+        self._other_genotype = np.array(genotype[self._other_ix])
+
+        codes[:, 1][length < 2] = 0
+        codes[length == 0] = 0
+        codes[other] = 0
+
+        # two 2-bit alleles per call, and two calls per byte
+        calls = (codes[:, 0] << 2) | codes[:, 1]
+        if len(calls) % 2:
+            calls = np.r_[calls, np.uint8(0)]
+        self._calls = ((calls[0::2] << 4) | calls[1::2]).astype(np.uint8)
+
+    def _get_ix(self, ix):
+        if ix is None:
+            return np.arange(len(self))
+        return np.asarray(ix, dtype=np.int64)
+
+    def get_chrom(self, ix=None):
+        """ Get the chromosomes of SNPs.
+
+        Parameters
+        ----------
+        ix : numpy.ndarray
+            indexes of SNPs; all SNPs if None
+
+        Returns
+        -------
+        numpy.ndarray
+            str chromosomes (object array)
+        """
+        ix = self._get_ix(ix)
+        runs = np.searchsorted(self._starts, ix, side="right") - 1
+        return np.array(self._chroms, dtype=object)[runs]
+
+    def get_pos(self, ix=None):
+        """ Get the positions of SNPs.
+
+        Parameters
+        ----------
+        ix : numpy.ndarray
+            indexes of SNPs; all SNPs if None
+
+        Returns
+        -------
+        numpy.ndarray
+            int64 positions
+        """
+        pos = np.concatenate(self._pos) if self._pos else np.zeros(0, dtype=np.int32)
+        return pos[self._get_ix(ix)].astype(np.int64)
+
+    def get_chrom_pos(self, chrom):
+        """ Get the positions of the SNPs on a chromosome.
+
+        Parameters
+        ----------
+        chrom : str
+
+        Returns
+        -------
+        numpy.ndarray
+        """
+        pos = [p for c, p in zip(self._chroms, self._pos) if c == chrom]
+        if len(pos) == 1:
+            return pos[0]
+        return np.concatenate(pos) if pos else np.zeros(0, dtype=np.int32)
+
+    def get_chrom_ix(self, chrom):
+        """ Get the indexes of the SNPs on a chromosome. """
+        return np.concatenate(
+            [
+                np.arange(start, end)
+                for c, start, end in zip(
+                    self._chroms, self._starts[:-1], self._starts[1:]
+                )
+                if c == chrom
+            ]
+            or [np.zeros(0, dtype=np.int64)]
+        )
+
+    def get_genotypes(self, ix=None):
+        """ Unpack genotypes for use with the shared DNA and discordant SNPs engines.
+
+        Parameters
+        ----------
+        ix : numpy.ndarray
+            indexes of SNPs; negative indexes (e.g., of SNPs that aren't aligned) are null
+
+        Returns
+        -------
+        numpy.ndarray
+            bytes genotypes (empty if null)
+        """
+        ix = self._get_ix(ix)
+        if not len(self):
+            return np.zeros(len(ix), dtype="S2")
+
+        present = ix >= 0
+        ix = np.where(present, ix, 0)
+
+        calls = (self._calls[ix >> 1] >> np.where(ix & 1, 0, 4).astype(np.uint8)) & 15
+
+        width = max(2, self._other_genotype.dtype.itemsize)
+        b = np.zeros((len(ix), width), dtype=np.uint8)
+        b[:, 0] = _ALLELE_BYTES[calls >> 2]
+        b[:, 1] = _ALLELE_BYTES[calls & 3]
+
+        if len(ix):
+            missing = _get_bits(self._missing, ix) | ~present
+            b[:, 1][_get_bits(self._haploid, ix)] = 0
+            b[missing] = 0
+
+        genotype = b.view("S{}".format(width)).ravel()
+
+        # restore calls that aren't packed
+        if len(self._other_ix):
+            other = np.minimum(
+                np.searchsorted(self._other_ix, ix), len(self._other_ix) - 1
+            )
+            is_other = present & (self._other_ix[other] == ix)
+            genotype[is_other] = self._other_genotype[other[is_other]]
+
+        return genotype
+
+    def get_rsids(self, ix=None):
+        """ Get the rsids of SNPs as str (object array). """
+        return self.rsid[self._get_ix(ix)].astype(str).astype(object)
+
+    def determine_sex(
+        self, y_snps_not_null_threshold=0.1, heterozygous_x_snps_threshold=0.01
+    ):
+        """ Determine sex from SNPs using thresholds.
+
+        This is equivalent to `SNPs.determine_sex`.
+
+        Parameters
+        ----------
+        y_snps_not_null_threshold : float
+            percentage Y SNPs that are not null; above this threshold, Male is determined
+        heterozygous_x_snps_threshold : float
+            percentage heterozygous X SNPs; above this threshold, Female is determined
+
+        Returns
+        -------
+        str
+            'Male' or 'Female' if detected, else empty str
+        """
+        y_ix = self.get_chrom_ix("Y")
+        if len(y_ix) > 0:
+            y_snps_not_null = np.count_nonzero(~_get_bits(self._missing, y_ix))
+
+            if y_snps_not_null / len(y_ix) > y_snps_not_null_threshold:
+                return "Male"
+            else:
+                return "Female"
+
+        x_ix = self.get_chrom_ix("X")
+        if len(x_ix) == 0:
+            return ""
+
+        # a haploid call is heterozygous, like comparisons with NaN
+        alleles, length = encode_alleles(self.get_genotypes(x_ix))
+        heterozygous_x_snps = np.count_nonzero(
+            (length > 0) & (alleles[:, 0] != alleles[:, 1])
+        )
+
+        if heterozygous_x_snps / len(x_ix) > heterozygous_x_snps_threshold:
+            return "Female"
+        else:
+            return "Male"
+
+    def to_snps(self, ix=None):
+        """ Convert genotypes to SNPs normalized for use with `lineage`.
+
+        Parameters
+        ----------
+        ix : numpy.ndarray
+            indexes of SNPs; all SNPs if None
+
+        Returns
+        -------
+        pandas.DataFrame
+        """
+        genotype = self.get_genotypes(ix).astype(str).astype(object)
+        genotype[genotype == ""] = np.nan
+
+        return pd.DataFrame(
+            {
+                "chrom": self.get_chrom(ix),
+                "pos": self.get_pos(ix),
+                "genotype": genotype,
+            },
+            index=pd.Index(self.get_rsids(ix), name="rsid"),
+            columns=["chrom", "pos", "genotype"],
+        )
+
+    def load_individual(self, ind):
+        """ Load these genotypes into a `lineage` ``Individual`` without SNPs.
+
+        Parameters
+        ----------
+        ind : Individual
+
+        Returns
+        -------
+        Individual
+        """
+        ind._snps = self.to_snps()
+        ind._build = self.info["build"]
+        ind._build_detected = self.info["build_detected"]
+        if self.info["source"]:
+            ind._source = [s.strip() for s in self.info["source"].split(",")]
+
+        return ind
+
+
+def load_packed_genotypes(path):
+    """ Load and pack genotypes saved with `save_genotypes`.
+
+    Parameters
+    ----------
+    path : str
+        path to genotypes directory
+
+    Returns
+    -------
+    PackedGenotypes
+    """
+    genotypes = load_genotypes(path)
+
+    return PackedGenotypes(
+        genotypes["rsid"],
+        genotypes["chrom"],
+        genotypes["pos"],
+        genotypes["genotype"],
+        genotypes["info"],
+        cM=genotypes.get("cM"),
+    )
+
+
+def align_rsids(rsid1, rsid2, how="inner"):
+    """ Align two arrays of rsids like a join of frames indexed by rsid.
+
+    Parameters
+    ----------
+    rsid1 : numpy.ndarray
+        rsids of the first individual; determines order
+    rsid2 : numpy.ndarray
+        rsids of the second individual
+    how : str
+        'inner' or 'left'
+
+    Returns
+    -------
+    ix1 : numpy.ndarray
+        indexes into `rsid1`
+    ix2 : numpy.ndarray
+        indexes into `rsid2`; -1 where an rsid isn't in `rsid2`
+    """
+    order = np.argsort(rsid2, kind="mergesort")
+    sorted_rsid2 = rsid2[order]
+
+    if len(sorted_rsid2) > 1 and np.any(sorted_rsid2[1:] == sorted_rsid2[:-1]):
+        # duplicate rsids are joined to each match, like `pandas.DataFrame.join`
+        df = pd.DataFrame({"ix1": np.arange(len(rsid1))}, index=rsid1).join(
+            pd.DataFrame({"ix2": np.arange(len(rsid2))}, index=rsid2), how=how
+        )
+        return (
+            df["ix1"].values.astype(np.int64),
+            df["ix2"].fillna(-1).values.astype(np.int64),
+        )
+
+    ix1 = np.arange(len(rsid1))
+    ix2 = np.full(len(rsid1), -1, dtype=np.int64)
+
+    if len(sorted_rsid2):
+        sorted_ix = np.minimum(
+            np.searchsorted(sorted_rsid2, rsid1), len(sorted_rsid2) - 1
+        )
+        found = sorted_rsid2[sorted_ix] == rsid1
+        ix2[found] = order[sorted_ix[found]]
+
+    if how == "inner":
+        found = ix2 >= 0
+        return ix1[found], ix2[found]
+
+    return ix1, ix2
@@ -0,0 +1,188 @@
+""" Genome-wide relatedness of all pairs of the individuals of a user.
+
+The relatedness of a user's individuals is found in one pass over their cohort. Each autosomal,
+biallelic SNP is coded as indicators of the individual's dosage of a reference allele (0, 1, or 2
+copies) and of the SNP being called; the IBS0, IBS1, and IBS2 counts, and the counts of the
+KING-robust kinship estimator (Manichaikul et al., 2010), of every pair are then blocks of the
+product of the indicator matrix with itself. The product is computed by BLAS, a chunk of SNPs at
+a time, so the SNPs of the cohort are read once regardless of the number of pairs.
+
+The relatedness is saved in the cohort's directory, so it's replaced whenever the cohort is.
+"""
+
+import os
+
+import numpy as np
+
+from .cohort import ALLELES, Cohort, decode_alleles, get_cohort_path
+from .workspace import publish, workspace
+
+# maximum elements of the indicator matrix of a chunk of SNPs
+CHUNK_ELEMENTS = 1 << 24
+
+# lower bounds of kinship for each degree of relationship (Manichaikul et al., 2010)
+DEGREES = [
+    (2 ** -1.5, "Duplicate / MZ twin"),
+    (2 ** -2.5, "1st degree"),
+    (2 ** -3.5, "2nd degree"),
+    (2 ** -4.5, "3rd degree"),
+]
+
+AUTOSOMES = [str(chrom).encode() for chrom in range(1, 23)]
+
+
+def get_relatedness_path(user_uuid):
+    # kept outside of the cohort, so it's kept while the cohort is replaced by an update
+    return get_cohort_path(user_uuid) + ".relatedness.npz"
+
+
+def _get_indicators(codes):
+    """ Get the indicator matrix of a chunk of SNPs of a cohort.
+
+    Parameters
+    ----------
+    codes : numpy.ndarray
+        (individuals, SNPs) int8 codes
+
+    Returns
+    -------
+    numpy.ndarray
+        (4 * individuals, SNPs) float32 indicators of dosages 0, 1, and 2, and of calls
+    """
+    alleles = decode_alleles(codes)
+    called = alleles[:, :, 0] >= 0
+
+    # SNPs with more than two alleles in the cohort aren't biallelic
+    present = np.stack([np.any(alleles == i, axis=(0, 2)) for i in range(len(ALLELES))])
+    called &= np.count_nonzero(present, axis=0) <= 2
+
+    ref = np.argmax(present, axis=0).astype(np.int8)
+    dosage = np.count_nonzero(alleles == ref[:, np.newaxis], axis=2)
+
+    return np.concatenate(
+        [called & (dosage == 0), called & (dosage == 1), called & (dosage == 2), called]
+    ).astype(np.float32)
+
+
+def find_relatedness(cohort):
+    """ Find the relatedness of all pairs of individuals of a cohort.
+
+    Parameters
+    ----------
+    cohort : Cohort
+
+    Returns
+    -------
+    dict
+        `individual` and `sha256` of each row of the cohort; (individuals, individuals)
+        matrices of SNPs called in both individuals (`snps`), `ibs0`, `ibs1`, `ibs2`, and
+        `kinship` (NaN if there are no heterozygous SNPs)
+    """
+    n = len(cohort)
+    cols = np.flatnonzero(np.isin(cohort.chrom, AUTOSOMES))
+    chunk_size = max(1, CHUNK_ELEMENTS // max(1, 4 * n))
+
+    # blocks of the product of the indicators with themselves, summed over chunks
+    product = np.zeros((4 * n, 4 * n), dtype=np.int64)
+
+    for start in range(0, len(cols), chunk_size):
+        chunk = cols[start : start + chunk_size]
+        # slices of the memory map are read sequentially
+        indicators = _get_indicators(
+            np.asarray(cohort.genotype[:, chunk[0] : chunk[-1] + 1])[
+                :, chunk - chunk[0]
+            ]
+        )
+        # counts of a chunk are exact in float32
+        product += np.rint(np.dot(indicators, indicators.T)).astype(np.int64)
+
+    def block(a, b):
+        return product[a * n : (a + 1) * n, b * n : (b + 1) * n]
+
+    snps = block(3, 3)
+    ibs0 = block(0, 2) + block(2, 0)
+    ibs2 = block(0, 0) + block(1, 1) + block(2, 2)
+
+    # KING-robust: heterozygous in both, opposite homozygotes, and heterozygous in either
+    het = block(1, 3) + block(3, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        kinship = np.where(het > 0, (block(1, 1) - 2 * ibs0) / het, np.nan)
+
+    return {
+        "individual": np.array([row["individual"] for row in cohort.individuals]),
+        "sha256": np.array([row["sha256"] for row in cohort.individuals]),
+        "snps": snps,
+        "ibs0": ibs0,
+        "ibs1": snps - ibs0 - ibs2,
+        "ibs2": ibs2,
+        "kinship": kinship,
+    }
+
+
+def get_degree(kinship):
+    """ Get the degree of relationship implied by a kinship estimate.
+
+    Parameters
+    ----------
+    kinship : float
+
+    Returns
+    -------
+    str
+        degree of relationship, or empty str if `kinship` is NaN
+    """
+    if np.isnan(kinship):
+        return ""
+
+    for threshold, degree in DEGREES:
+        if kinship > threshold:
+            return degree
+
+    return "Unrelated"
+
+
+def update_relatedness(user_uuid):
+    """ Find and save the relatedness of the individuals of a user's cohort.
+
+    The cohort should be locked with `cohort_lock`.
+
+    Parameters
+    ----------
+    user_uuid : str
+
+    Returns
+    -------
+    bool
+        True if relatedness was saved, False if the user has no cohort
+    """
+    path = get_cohort_path(user_uuid)
+    if not os.path.isdir(path):
+        return False
+
+    relatedness = find_relatedness(Cohort(path))
+
+    with workspace() as tmpdir:
+        temp = os.path.join(tmpdir, "relatedness.npz")
+        np.savez(temp, **relatedness)
+        publish(temp, get_relatedness_path(user_uuid))
+
+    return True
+
+
+def load_relatedness(user_uuid):
+    """ Load the relatedness of the individuals of a user's cohort.
+
+    Parameters
+    ----------
+    user_uuid : str
+
+    Returns
+    -------
+    dict
+        see `find_relatedness`, or None if relatedness hasn't been found
+    """
+    try:
+        with np.load(get_relatedness_path(user_uuid)) as f:
+            return {key: f[key] for key in f.files}
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,126 @@
+""" Process-wide cache of the `lineage` resources used by analyses.
+
+`lineage` loads resources per ``Lineage`` object, so every task would otherwise reload the
+genetic map, gene annotations, and cytobands. Resources are loaded once per process instead (see
+`load_resources`, which Celery workers call before forking worker processes) and shared by the
+``Lineage`` objects returned by `get_lineage`.
+
+The genetic map and the index of gene annotations are kept as NumPy arrays, which are compact
+and aren't touched by reference counting, so memory pages loaded before forking stay shared
+with worker processes.
+"""
+
+from django.conf import settings
+from lineage import Lineage
+from lineage.resources import Resources
+import numpy as np
+
+from .shared_genes import GENE_COLUMNS, build_gene_index
+
+_resources = None
+_genetic_map = None
+_genes = None
+
+
+def get_resources():
+    """ Get the ``Resources`` shared by this process.
+
+    Returns
+    -------
+    lineage.resources.Resources
+    """
+    global _resources
+
+    if _resources is None:
+        _resources = Resources(resources_dir=settings.LINEAGE_RESOURCES_DIR)
+
+    return _resources
+
+
+def get_genetic_map():
+    """ Get the HapMap Phase II genetic map (GRCh37) shared by this process.
+
+    Returns
+    -------
+    dict
+        chromosome to (positions, rates) arrays if loading was successful, else None
+    """
+    global _genetic_map
+
+    if _genetic_map is None:
+        r = get_resources()
+        # load directly (i.e., not via `get_genetic_map_HapMapII_GRCh37`) so that the
+        # dataframes aren't also cached by `Resources`
+        genetic_map = r._load_genetic_map(r._get_path_genetic_map_HapMapII_GRCh37())
+
+        if genetic_map is None:
+            return None
+
+        _genetic_map = {
+            chrom: (
+                df["pos"].values.astype(np.int64),
+                df["rate"].values.astype(np.float64),
+            )
+            for chrom, df in genetic_map.items()
+        }
+
+    return _genetic_map
+
+
+def get_genes():
+    """ Get the gene annotations (hg19) shared by this process.
+
+    Returns
+    -------
+    genes : pandas.DataFrame
+        knownGene table joined with kgXref table (see `GENE_COLUMNS`)
+    gene_index : dict
+        index of genes returned by `build_gene_index`
+
+    Returns None if loading wasn't successful.
+    """
+    global _genes
+
+    if _genes is None:
+        r = get_resources()
+        knownGene = r._load_knownGene(r._get_path_knownGene_hg19())
+        kgXref = r._load_kgXref(r._get_path_kgXref_hg19())
+
+        if knownGene is None or kgXref is None:
+            return None
+
+        # http://seqanswers.com/forums/showthread.php?t=22336
+        genes = knownGene.join(kgXref)[GENE_COLUMNS]
+
+        _genes = (genes, build_gene_index(genes))
+
+    return _genes
+
+
+def load_resources():
+    """ Load the resources used by analyses into this process. """
+    get_genetic_map()
+    get_genes()
+    get_resources().get_cytoBand_hg19()
+
+
+def get_lineage(output_dir):
+    """ Get a ``Lineage`` object that uses the resources shared by this process.
+
+    Parameters
+    ----------
+    output_dir : str
+        path to output directory
+
+    Returns
+    -------
+    Lineage
+    """
+    l = Lineage(
+        output_dir=output_dir,
+        resources_dir=settings.LINEAGE_RESOURCES_DIR,
+        parallelize=False,
+    )
+    l._resources = get_resources()
+
+    return l
@@ -0,0 +1,110 @@
+""" Columnar storage of shared DNA segments for paginated tables.
+
+Segments are saved as an uncompressed NumPy structured array with a row per segment. The array
+also holds the order of the segments when sorted by each column, so a page of sorted segments is
+read from a memory map without loading or sorting all of the segments.
+"""
+
+import numpy as np
+
+SEGMENTS_EXT = ".npy"
+
+# columns of `SharedDnaTable`
+SEGMENT_COLUMNS = ["segment_col", "chrom", "start", "end", "cMs", "snps"]
+
+
+def save_segments(shared_dna, path):
+    """ Save segments of shared DNA.
+
+    Parameters
+    ----------
+    shared_dna : pandas.DataFrame
+        segments of shared DNA returned by `find_shared_dna`, indexed by segment
+    path : str
+        path to segments file
+    """
+    chrom = shared_dna["chrom"].values.astype(str).astype("S")
+
+    dtype = [
+        ("segment_col", np.int64),
+        ("chrom", chrom.dtype),
+        ("start", np.int64),
+        ("end", np.int64),
+        ("cMs", np.float64),
+        ("snps", np.int64),
+    ]
+    for column in SEGMENT_COLUMNS:
+        dtype += [("asc_" + column, np.int64), ("desc_" + column, np.int64)]
+
+    segments = np.zeros(len(shared_dna), dtype=dtype)
+    segments["segment_col"] = shared_dna.index.values
+    segments["chrom"] = chrom
+    for column in ["start", "end", "cMs", "snps"]:
+        segments[column] = shared_dna[column].values
+
+    for column in SEGMENT_COLUMNS:
+        values = segments[column]
+        segments["asc_" + column] = np.argsort(values, kind="mergesort")
+        # descending order is stable too (i.e., ties stay in ascending order of rows)
+        segments["desc_" + column] = (
+            len(values) - 1 - np.argsort(values[::-1], kind="mergesort")[::-1]
+        )
+
+    with open(path, "wb") as f:
+        np.save(f, segments)
+
+
+def load_segments(path):
+    """ Load segments saved with `save_segments` as a memory map.
+
+    Parameters
+    ----------
+    path : str
+        path to segments file
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+    return np.load(path, mmap_mode="r")
+
+
+def get_segments(segments, start, stop, order_by=None):
+    """ Get a range of segments.
+
+    Parameters
+    ----------
+    segments : numpy.ndarray
+        segments returned by `load_segments`
+    start : int
+        index of first segment
+    stop : int
+        index after last segment
+    order_by : str
+        column to order by; prefixed with '-' for descending order
+
+    Returns
+    -------
+    list of dict
+        segments as records of `SEGMENT_COLUMNS`
+    """
+    if order_by is None:
+        rows = segments[start:stop]
+    else:
+        if order_by.startswith("-"):
+            order = segments["desc_" + order_by[1:]]
+        else:
+            order = segments["asc_" + order_by]
+        rows = segments[np.asarray(order[start:stop])]
+
+    return [
+        {
+            "segment_col": int(row["segment_col"]),
+            "chrom": row["chrom"].decode(),
+            "start": int(row["start"]),
+            "end": int(row["end"]),
+            "cMs": float(row["cMs"]),
+            "snps": int(row["snps"]),
+        }
+        for row in rows
+    ]
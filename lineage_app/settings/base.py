@@ -243,3 +243,50 @@ SENDFILE_URL = "/protected/"
 
 DEAUTH_ROUTE = env("DEAUTH_ROUTE", default="deauth/")
 USERS_DIR = "users"
+# deduplicated contents of files in `SENDFILE_ROOT`
+BLOBS_DIR = "blobs"
+# seconds to wait for more uploads before merging an individual's SNPs files
+MERGE_DELAY = env.int("MERGE_DELAY", default=10)
+# number of processes used to remap SNPs to other builds
+REMAP_PROCESSES = env.int("REMAP_PROCESSES", default=2)
+# number of processes used to find shared DNA for a batch of pairs of individuals
+SHARED_DNA_PROCESSES = env.int("SHARED_DNA_PROCESSES", default=2)
+# number of pairs of individuals compared by each task of a batch, so that tasks finish within
+# `CELERYD_TASK_TIME_LIMIT`
+SHARED_DNA_BATCH_SIZE = env.int("SHARED_DNA_BATCH_SIZE", default=50)
+# cache of SNPs remapped to other builds on demand, bounded to `REMAP_CACHE_SIZE` bytes; under
+# `SENDFILE_ROOT` so that remapped SNPs can be downloaded
+REMAP_CACHE_DIR = env(
+    "REMAP_CACHE_DIR", default=str(environ.Path(SENDFILE_ROOT).path("remapped"))
+)
+REMAP_CACHE_SIZE = env.int("REMAP_CACHE_SIZE", default=10 * 1024 ** 3)
+# directory of users' cohorts (memory-mapped genotype matrices of their individuals)
+COHORT_DIR = env("COHORT_DIR", default=str(environ.Path(SENDFILE_ROOT).path("cohorts")))
+# gzip compression of output files
+COMPRESSION_LEVEL = env.int("COMPRESSION_LEVEL", default=9)
+COMPRESSION_THREADS = env.int("COMPRESSION_THREADS", default=4)
+# directory of resources downloaded by `lineage`
+LINEAGE_RESOURCES_DIR = env("LINEAGE_RESOURCES_DIR", default=str(ROOT_DIR("resources")))
+# directory of assembly mappings built with the `build_assembly_mapping` command
+ASSEMBLY_MAPPING_DIR = env(
+    "ASSEMBLY_MAPPING_DIR", default=str(ROOT_DIR("resources/assembly_mapping"))
+)
+# directory of memoized results; on the same filesystem as `SENDFILE_ROOT` so that results
+# can be hardlinked
+MEMO_DIR = env("MEMO_DIR", default=str(environ.Path(SENDFILE_ROOT).path("memo")))
+# memoized results are bounded to `MEMO_SIZE` bytes
+MEMO_SIZE = env.int("MEMO_SIZE", default=10 * 1024 ** 3)
+# memoized results are evicted at most once per `MEMO_EVICT_INTERVAL` seconds
+MEMO_EVICT_INTERVAL = env.int("MEMO_EVICT_INTERVAL", default=60 * 60)
+# runs of matching SNPs of at most this many cMs aren't memoized, so shared DNA is only derived
+# from memoized runs for cM thresholds of at least this many cMs
+SHARED_DNA_RUNS_MIN_CM = env.float("SHARED_DNA_RUNS_MIN_CM", default=0.1)
+# directory of task workspaces; on the same filesystem as `SENDFILE_ROOT` so that results
+# are published by renaming
+WORKSPACE_DIR = env(
+    "WORKSPACE_DIR", default=str(environ.Path(SENDFILE_ROOT).path("workspace"))
+)
+# optional RAM-backed (e.g., tmpfs) directory for workspaces, used while its usage is within
+# `WORKSPACE_TMPFS_QUOTA` bytes
+WORKSPACE_TMPFS_DIR = env("WORKSPACE_TMPFS_DIR", default="")
+WORKSPACE_TMPFS_QUOTA = env.int("WORKSPACE_TMPFS_QUOTA", default=1024 ** 3)
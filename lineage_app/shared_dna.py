@@ -0,0 +1,964 @@
+""" Vectorized engine for finding the shared DNA between two individuals.
+
+The engine computes the same segments as `Lineage.find_shared_dna`, but operates on aligned
+NumPy arrays instead of per-segment pandas lookups.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .assembly_mapping import remap_snps_to_GRCh37
+from .genotypes import allele_eq, encode_alleles
+from .packed import align_rsids
+from .resources import get_genes, get_genetic_map
+from .shared_genes import compute_shared_genes
+
+# https://www.ncbi.nlm.nih.gov/grc/human
+X_NON_PAR_START = 2699520
+X_NON_PAR_END = 154931044
+
+
+def align_snps(snps1, snps2, cM1=None):
+    """ Align the SNPs of two individuals on rsid.
+
+    Parameters
+    ----------
+    snps1 : pandas.DataFrame
+        SNPs of the first individual; determines order, chromosomes, and positions
+    snps2 : pandas.DataFrame
+        SNPs of the second individual
+    cM1 : numpy.ndarray
+        genetic positions of the SNPs of the first individual
+
+    Returns
+    -------
+    chrom : numpy.ndarray
+    pos : numpy.ndarray
+    genotype1 : numpy.ndarray
+        bytes genotypes of the first individual (empty if null)
+    genotype2 : numpy.ndarray
+        bytes genotypes of the second individual (empty if null)
+    cM : numpy.ndarray
+        genetic positions of aligned SNPs if `cM1` is specified, else None
+    """
+    df = snps1[["chrom", "pos", "genotype"]]
+    if cM1 is not None:
+        df = df.assign(cM=cM1)
+
+    df = df.join(snps2["genotype"], rsuffix="2", how="inner")
+
+    return (
+        df["chrom"].values,
+        df["pos"].values.astype(np.int64),
+        df["genotype"].fillna("").values.astype("S"),
+        df["genotype2"].fillna("").values.astype("S"),
+        df["cM"].values if cM1 is not None else None,
+    )
+
+
+def compute_one_chrom_match(genotype1, genotype2):
+    """ Determine where individuals share an allele on one chromosome.
+
+    Null genotypes are considered matches.
+
+    Parameters
+    ----------
+    genotype1 : numpy.ndarray
+    genotype2 : numpy.ndarray
+
+    Returns
+    -------
+    numpy.ndarray
+        bool array
+    """
+    a1, len1 = encode_alleles(genotype1)
+    a2, len2 = encode_alleles(genotype2)
+
+    return (
+        (len1 == 0)
+        | (len2 == 0)
+        | allele_eq(a1, len1, 0, a2, len2, 0)
+        | allele_eq(a1, len1, 0, a2, len2, 1)
+        | allele_eq(a1, len1, 1, a2, len2, 0)
+        | allele_eq(a1, len1, 1, a2, len2, 1)
+    )
+
+
+def compute_two_chrom_match(genotype1, genotype2):
+    """ Determine where individuals share alleles on both chromosomes.
+
+    Null genotypes are considered matches.
+
+    Parameters
+    ----------
+    genotype1 : numpy.ndarray
+    genotype2 : numpy.ndarray
+
+    Returns
+    -------
+    numpy.ndarray
+        bool array
+    """
+    a1, len1 = encode_alleles(genotype1)
+    a2, len2 = encode_alleles(genotype2)
+
+    same = allele_eq(a1, len1, 0, a2, len2, 0) & allele_eq(a1, len1, 1, a2, len2, 1)
+    swapped = allele_eq(a1, len1, 0, a2, len2, 1) & allele_eq(a1, len1, 1, a2, len2, 0)
+
+    return (len1 == 0) | (len2 == 0) | ((len1 == 2) & (len2 == 2) & (same | swapped))
+
+
+def compute_snp_distances(pos, genetic_map_pos, genetic_map_rate):
+    """ Compute genetic distance between SNPs on a chromosome.
+
+    This is equivalent to `Lineage._compute_snp_distances`: SNPs are merged with the genetic
+    map, recombination rates are filled forward, and cMs are summed between SNPs.
+
+    Parameters
+    ----------
+    pos : numpy.ndarray
+        positions of SNPs
+    genetic_map_pos : numpy.ndarray
+        positions of the genetic map
+    genetic_map_rate : numpy.ndarray
+        recombination rates (cM/Mb) of the genetic map
+
+    Returns
+    -------
+    numpy.ndarray
+        cMs from the previous SNP for each SNP
+    """
+    if len(pos) == 0:
+        return np.zeros(0)
+
+    all_pos = np.r_[pos, genetic_map_pos]
+    order = np.argsort(all_pos, kind="mergesort")
+    all_pos = all_pos[order]
+    is_map = order >= len(pos)
+
+    # fill recombination rates forward; assume rate of 0 upstream of first defined rate
+    rate = np.zeros(len(all_pos))
+    rate[is_map] = genetic_map_rate[order[is_map] - len(pos)]
+    last_map_ix = np.maximum.accumulate(np.where(is_map, np.arange(len(all_pos)), -1))
+    rate = np.where(last_map_ix >= 0, rate[np.maximum(last_map_ix, 0)], 0)
+
+    # compute cMs between each pos based on probabilistic recombination rate
+    cMs = rate * np.r_[np.diff(all_pos), 0] / 1e6
+    cMs = np.r_[0, cMs][:-1]
+
+    snp_ix = np.nonzero(~is_map)[0]
+
+    # sum cMs between SNPs to get total cM distance between SNPs
+    c = np.r_[0, np.cumsum(cMs)]
+    cM_from_prev_snp = c[np.r_[snp_ix, snp_ix[-1]][1:] + 1] - c[snp_ix + 1]
+    cM_from_prev_snp = np.r_[0, cM_from_prev_snp][:-1]
+
+    # restore order of SNPs
+    result = np.empty(len(pos))
+    result[order[~is_map]] = cM_from_prev_snp
+    return result
+
+
+def compute_genetic_positions(chrom, pos, genetic_map):
+    """ Compute the genetic position (i.e., cMs from the start of the chromosome) of SNPs.
+
+    Recombination rates are interpolated the same way as `compute_snp_distances`, so the
+    difference between the genetic positions of two SNPs on a chromosome is the total cM
+    distance between the SNPs.
+
+    Parameters
+    ----------
+    chrom : numpy.ndarray
+    pos : numpy.ndarray
+    genetic_map : dict
+        chromosome to (positions, rates) arrays
+
+    Returns
+    -------
+    numpy.ndarray
+        genetic position of each SNP; NaN if there's no genetic map for the chromosome
+    """
+    cM = np.full(len(pos), np.nan)
+
+    codes, chroms = pd.factorize(chrom)
+
+    for code, c in enumerate(chroms):
+        if c not in genetic_map:
+            continue
+
+        ix = np.flatnonzero(codes == code)
+        genetic_map_pos, genetic_map_rate = genetic_map[c]
+
+        # genetic positions of the genetic map
+        genetic_map_cM = np.r_[
+            0, np.cumsum(genetic_map_rate[:-1] * np.diff(genetic_map_pos) / 1e6)
+        ]
+
+        # assume rate of 0 upstream of first defined rate
+        map_ix = np.searchsorted(genetic_map_pos, pos[ix], side="right") - 1
+        upstream = map_ix < 0
+        map_ix[upstream] = 0
+
+        cM[ix] = np.where(
+            upstream,
+            0,
+            genetic_map_cM[map_ix]
+            + genetic_map_rate[map_ix] * (pos[ix] - genetic_map_pos[map_ix]) / 1e6,
+        )
+
+    return cM
+
+
+def find_runs(match):
+    """ Find runs of matching SNPs on a chromosome.
+
+    Parameters
+    ----------
+    match : numpy.ndarray
+        bool array where SNPs match
+
+    Returns
+    -------
+    starts : numpy.ndarray
+        index of the first SNP of each run
+    ends : numpy.ndarray
+        index after the last SNP of each run
+    """
+    # get consecutive strings of trues
+    # http://stackoverflow.com/a/17151327
+    a = np.r_[match, False]
+    a_rshifted = np.roll(a, 1)
+    starts = np.nonzero(a & ~a_rshifted)[0]
+    ends = np.nonzero(~a & a_rshifted)[0]
+
+    return starts, ends
+
+
+def filter_runs(
+    starts, ends, start_cM, end_cM, cM_threshold, snp_threshold, chrom=None
+):
+    """ Stitch runs of matching SNPs into segments that pass thresholds.
+
+    Parameters
+    ----------
+    starts : numpy.ndarray
+        index of the first SNP of each run
+    ends : numpy.ndarray
+        index after the last SNP of each run
+    start_cM : numpy.ndarray
+        genetic position of the SNP preceding each run (segments include the cMs from the SNP
+        preceding the segment)
+    end_cM : numpy.ndarray
+        genetic position of the last SNP of each run
+    cM_threshold : float
+        minimum centiMorgans for each segment
+    snp_threshold : int
+        minimum SNPs for each segment
+    chrom : numpy.ndarray
+        chromosome of each run; runs are only stitched together on the same chromosome
+
+    Returns
+    -------
+    first : numpy.ndarray
+        index of the first run of each segment
+    last : numpy.ndarray
+        index of the last run of each segment
+    """
+    # get matching runs where total cMs is greater than the threshold
+    passed = np.flatnonzero((end_cM - start_cM) > cM_threshold)
+
+    # stitch together adjacent runs (i.e., separated by one discrepant SNP)
+    first = last = passed
+    if len(passed) > 0:
+        new_segment = starts[passed[1:]] != ends[passed[:-1]] + 1
+        if chrom is not None:
+            new_segment |= chrom[passed[1:]] != chrom[passed[:-1]]
+
+        first = passed[np.r_[True, new_segment]]
+        last = passed[np.r_[new_segment, True]]
+
+    # apply SNP count threshold for each segment
+    passed = (ends[last] - starts[first]) > snp_threshold
+
+    return first[passed], last[passed]
+
+
+def _iter_chroms(chrom, pos, genetic_map, cM=None):
+    """ Iterate over the chromosomes of aligned SNPs that have genetic distance data.
+
+    Yields
+    ------
+    c : str
+        chromosome
+    ix : numpy.ndarray
+        indexes of the SNPs on the chromosome
+    chrom_cM : numpy.ndarray
+        genetic positions of the SNPs on the chromosome
+    """
+    codes, chroms = pd.factorize(chrom)
+
+    for code, c in enumerate(chroms):
+        # drop chromosomes without genetic distance data
+        if c not in genetic_map:
+            continue
+
+        ix = np.flatnonzero(codes == code)
+        if cM is None:
+            chrom_cM = np.cumsum(compute_snp_distances(pos[ix], *genetic_map[c]))
+        else:
+            chrom_cM = cM[ix]
+
+        yield c, ix, chrom_cM
+
+
+def screen_shared_dna(
+    chrom, pos, genotype1, genotype2, genetic_map, cM_threshold, snp_threshold, cM=None
+):
+    """ Determine if individuals could share DNA, without computing all runs.
+
+    Segments of shared DNA on two chromosomes are within segments of shared DNA on one
+    chromosome, so individuals share DNA if and only if there's a segment on one chromosome.
+    Chromosomes are searched until one has a segment.
+
+    Parameters
+    ----------
+    chrom : numpy.ndarray
+    pos : numpy.ndarray
+    genotype1 : numpy.ndarray
+    genotype2 : numpy.ndarray
+    genetic_map : dict
+        chromosome to (positions, rates) arrays
+    cM_threshold : float
+    snp_threshold : int
+    cM : numpy.ndarray
+        precomputed genetic positions of SNPs (see `compute_genetic_positions`)
+
+    Returns
+    -------
+    bool
+        True if `get_shared_dna` would find shared DNA in the runs of the individuals
+    """
+    one_chrom_match = compute_one_chrom_match(genotype1, genotype2)
+
+    for _, ix, chrom_cM in _iter_chroms(chrom, pos, genetic_map, cM):
+        starts, ends = find_runs(one_chrom_match[ix])
+
+        # segments include the cMs from the SNP preceding the segment
+        cMs = np.r_[chrom_cM[:1], chrom_cM]
+
+        first, _ = filter_runs(
+            starts, ends, cMs[starts], cMs[ends], cM_threshold, snp_threshold
+        )
+        if len(first):
+            return True
+
+    return False
+
+
+def compute_shared_dna_runs(
+    chrom, pos, genotype1, genotype2, genetic_map, one_x_chrom, cM=None
+):
+    """ Compute the runs of matching SNPs of two individuals from aligned arrays.
+
+    Runs don't depend on the thresholds of segments, so the segments of shared DNA for any
+    thresholds can be found from the runs with `get_shared_dna`.
+
+    Parameters
+    ----------
+    chrom : numpy.ndarray
+    pos : numpy.ndarray
+    genotype1 : numpy.ndarray
+    genotype2 : numpy.ndarray
+    genetic_map : dict
+        chromosome to (positions, rates) arrays
+    one_x_chrom : bool
+        at least one individual has only one X chromosome
+    cM : numpy.ndarray
+        precomputed genetic positions of SNPs (see `compute_genetic_positions`); if None,
+        cMs between SNPs are interpolated from the genetic map
+
+    Returns
+    -------
+    dict
+        `chroms` with genetic distance data, and for runs on one chromosome (`one_chrom_`) and
+        two chromosomes (`two_chrom_`), arrays of the `chrom` (index in `chroms`), `start` and
+        `end` (see `find_runs`), `start_pos` and `end_pos` (positions of the first and last
+        SNPs), and `start_cM` and `end_cM` (see `filter_runs`) of each run
+    """
+    one_chrom_match = compute_one_chrom_match(genotype1, genotype2)
+    two_chrom_match = compute_two_chrom_match(genotype1, genotype2)
+
+    chroms = []
+    runs = {"one_chrom": [], "two_chrom": []}
+
+    for c, ix, chrom_cM in _iter_chroms(chrom, pos, genetic_map, cM):
+        chrom_pos = pos[ix]
+
+        two_chrom_match_chrom = two_chrom_match[ix]
+        if c == "X" and one_x_chrom:
+            two_chrom_match_chrom = two_chrom_match_chrom & ~(
+                (chrom_pos > X_NON_PAR_START) & (chrom_pos < X_NON_PAR_END)
+            )
+
+        # segments include the cMs from the SNP preceding the segment
+        cMs = np.r_[chrom_cM[:1], chrom_cM]
+
+        for kind, match in [
+            ("one_chrom", one_chrom_match[ix]),
+            ("two_chrom", two_chrom_match_chrom),
+        ]:
+            starts, ends = find_runs(match)
+            runs[kind].append(
+                {
+                    "chrom": np.full(len(starts), len(chroms), dtype=np.int64),
+                    "start": starts,
+                    "end": ends,
+                    "start_pos": chrom_pos[starts],
+                    "end_pos": chrom_pos[ends - 1],
+                    "start_cM": cMs[starts],
+                    "end_cM": cMs[ends],
+                }
+            )
+
+        chroms.append(c)
+
+    result = {"chroms": np.array(chroms, dtype=str)}
+
+    for kind, kind_runs in runs.items():
+        for field, dtype in [
+            ("chrom", np.int64),
+            ("start", np.int64),
+            ("end", np.int64),
+            ("start_pos", np.int64),
+            ("end_pos", np.int64),
+            ("start_cM", np.float64),
+            ("end_cM", np.float64),
+        ]:
+            result["{}_{}".format(kind, field)] = np.concatenate(
+                [r[field] for r in kind_runs] + [np.zeros(0, dtype=dtype)]
+            ).astype(dtype)
+
+    return result
+
+
+def get_shared_dna(runs, cM_threshold, snp_threshold):
+    """ Get the segments of shared DNA that pass thresholds from runs of matching SNPs.
+
+    Parameters
+    ----------
+    runs : dict
+        runs returned by `compute_shared_dna_runs`
+    cM_threshold : float
+    snp_threshold : int
+
+    Returns
+    -------
+    one_chrom_shared_dna : list of dict
+    two_chrom_shared_dna : list of dict
+    """
+    if cM_threshold < get_runs_min_cM(runs):
+        raise ValueError("runs were pruned for higher cM thresholds")
+
+    shared_dna = []
+
+    for kind in ["one_chrom", "two_chrom"]:
+
+        def get(field):
+            return runs["{}_{}".format(kind, field)]
+
+        first, last = filter_runs(
+            get("start"),
+            get("end"),
+            get("start_cM"),
+            get("end_cM"),
+            cM_threshold,
+            snp_threshold,
+            chrom=get("chrom"),
+        )
+
+        shared_dna.append(
+            [
+                {
+                    "chrom": str(runs["chroms"][get("chrom")[i]]),
+                    "start": get("start_pos")[i],
+                    "end": get("end_pos")[j],
+                    "cMs": get("end_cM")[j] - get("start_cM")[i],
+                    "snps": get("end")[j] - get("start")[i],
+                }
+                for i, j in zip(first, last)
+            ]
+        )
+
+    return shared_dna[0], shared_dna[1]
+
+
+def prune_shared_dna_runs(runs, min_cM):
+    """ Prune runs of matching SNPs that can't pass cM thresholds of `min_cM` or more.
+
+    Parameters
+    ----------
+    runs : dict
+        runs returned by `compute_shared_dna_runs`
+    min_cM : float
+        runs of at most this many cMs are pruned
+
+    Returns
+    -------
+    dict
+        runs of more than `min_cM` cMs, with `min_cM`
+    """
+    pruned = {"chroms": runs["chroms"], "min_cM": np.array(min_cM, dtype=np.float64)}
+
+    for kind in ["one_chrom", "two_chrom"]:
+        prefix = kind + "_"
+        kept = (runs[prefix + "end_cM"] - runs[prefix + "start_cM"]) > min_cM
+
+        for name, values in runs.items():
+            if name.startswith(prefix):
+                pruned[name] = values[kept]
+
+    return pruned
+
+
+def get_runs_min_cM(runs):
+    """ Get the minimum cM threshold that segments can be found for from runs. """
+    return float(runs["min_cM"]) if "min_cM" in runs else -np.inf
+
+
+def save_shared_dna_runs(runs, path):
+    """ Save runs of matching SNPs returned by `compute_shared_dna_runs`.
+
+    Parameters
+    ----------
+    runs : dict
+    path : str
+        path to runs file (.npz)
+    """
+    np.savez_compressed(path, **runs)
+
+
+def load_shared_dna_runs(path):
+    """ Load runs of matching SNPs saved with `save_shared_dna_runs`.
+
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    -------
+    dict
+    """
+    with np.load(path) as f:
+        return {name: f[name] for name in f.files}
+
+
+def compute_shared_dna(
+    chrom,
+    pos,
+    genotype1,
+    genotype2,
+    genetic_map,
+    cM_threshold,
+    snp_threshold,
+    one_x_chrom,
+    cM=None,
+):
+    """ Compute segments of shared DNA from aligned arrays.
+
+    Parameters
+    ----------
+    chrom : numpy.ndarray
+    pos : numpy.ndarray
+    genotype1 : numpy.ndarray
+    genotype2 : numpy.ndarray
+    genetic_map : dict
+        chromosome to (positions, rates) arrays
+    cM_threshold : float
+    snp_threshold : int
+    one_x_chrom : bool
+        at least one individual has only one X chromosome
+    cM : numpy.ndarray
+        precomputed genetic positions of SNPs (see `compute_genetic_positions`); if None,
+        cMs between SNPs are interpolated from the genetic map
+
+    Returns
+    -------
+    one_chrom_shared_dna : list of dict
+    two_chrom_shared_dna : list of dict
+    """
+    return get_shared_dna(
+        compute_shared_dna_runs(
+            chrom, pos, genotype1, genotype2, genetic_map, one_x_chrom, cM=cM
+        ),
+        cM_threshold,
+        snp_threshold,
+    )
+
+
+def find_shared_dna_runs(l, individual1, individual2, genetic_positions=None):
+    """ Find the runs of matching SNPs of two individuals.
+
+    Parameters
+    ----------
+    l : Lineage
+    individual1 : Individual
+    individual2 : Individual
+    genetic_positions : numpy.ndarray
+        genetic positions of `individual1`'s SNPs in GRCh37 (see
+        `compute_genetic_positions`); if specified, cMs aren't interpolated for each run
+
+    Returns
+    -------
+    dict
+        see `compute_shared_dna_runs`
+    """
+    # genetic positions are only valid for `individual1`'s SNPs as they are in GRCh37
+    if genetic_positions is not None and (
+        individual1.build != 37 or len(genetic_positions) != len(individual1.snps)
+    ):
+        genetic_positions = None
+
+    remap_snps_to_GRCh37([individual1, individual2])
+
+    chrom, pos, genotype1, genotype2, cM = align_snps(
+        individual1.snps, individual2.snps, genetic_positions
+    )
+
+    return compute_shared_dna_runs(
+        chrom,
+        pos,
+        genotype1,
+        genotype2,
+        genetic_map=get_genetic_map(),
+        one_x_chrom=l._is_one_individual_male([individual1, individual2]),
+        cM=cM,
+    )
+
+
+def align_packed_snps(packed1, packed2):
+    """ Align the SNPs of two individuals with packed genotypes on rsid.
+
+    Parameters
+    ----------
+    packed1 : PackedGenotypes
+    packed2 : PackedGenotypes
+
+    Returns
+    -------
+    tuple
+        see `align_snps`; None if genotypes aren't in GRCh37 (i.e., SNPs can't be aligned
+        without remapping)
+    """
+    if packed1.build != 37 or packed2.build != 37:
+        return None
+
+    ix1, ix2 = align_rsids(packed1.rsid, packed2.rsid)
+
+    return (
+        packed1.get_chrom(ix1),
+        packed1.get_pos(ix1),
+        packed1.get_genotypes(ix1),
+        packed2.get_genotypes(ix2),
+        packed1.cM[ix1] if packed1.cM is not None else None,
+    )
+
+
+def screen_packed_shared_dna(
+    packed1, packed2, cM_threshold=0.75, snp_threshold=1100, aligned=None
+):
+    """ Determine if individuals with packed genotypes could share DNA.
+
+    This is a pre-screen for `find_packed_shared_dna_runs`: only the runs of matching SNPs on
+    one chromosome are searched, until a segment is found.
+
+    Parameters
+    ----------
+    packed1 : PackedGenotypes
+    packed2 : PackedGenotypes
+    cM_threshold : float
+        minimum centiMorgans for each shared DNA segment
+    snp_threshold : int
+        minimum SNPs for each shared DNA segment
+    aligned : tuple
+        SNPs returned by `align_packed_snps`, so they're aligned once for the screen and the
+        runs
+
+    Returns
+    -------
+    bool
+        True if the individuals could share DNA, or if genotypes aren't in GRCh37 (i.e., the
+        individuals can't be screened without remapping)
+    """
+    if aligned is None:
+        aligned = align_packed_snps(packed1, packed2)
+        if aligned is None:
+            return True
+
+    chrom, pos, genotype1, genotype2, cM = aligned
+
+    return screen_shared_dna(
+        chrom,
+        pos,
+        genotype1,
+        genotype2,
+        genetic_map=get_genetic_map(),
+        cM_threshold=cM_threshold,
+        snp_threshold=snp_threshold,
+        cM=cM,
+    )
+
+
+def find_packed_shared_dna_runs(
+    l, individual1, individual2, packed1, packed2, aligned=None
+):
+    """ Find the runs of matching SNPs of two individuals with packed genotypes.
+
+    SNPs are aligned and compared without creating pandas frames of the individuals' SNPs.
+    Genotypes that aren't in GRCh37 are loaded into the individuals and remapped with
+    `find_shared_dna_runs`.
+
+    Parameters
+    ----------
+    l : Lineage
+    individual1 : Individual
+        `lineage` ``Individual`` without SNPs
+    individual2 : Individual
+        `lineage` ``Individual`` without SNPs
+    packed1 : PackedGenotypes
+        genotypes of `individual1`
+    packed2 : PackedGenotypes
+        genotypes of `individual2`
+    aligned : tuple
+        SNPs already aligned with `align_packed_snps` (e.g., for `screen_packed_shared_dna`)
+
+    Returns
+    -------
+    dict
+        see `compute_shared_dna_runs`
+    """
+    if aligned is None:
+        aligned = align_packed_snps(packed1, packed2)
+
+    if aligned is None:
+        return find_shared_dna_runs(
+            l,
+            packed1.load_individual(individual1),
+            packed2.load_individual(individual2),
+            genetic_positions=packed1.cM,
+        )
+
+    chrom, pos, genotype1, genotype2, cM = aligned
+
+    return compute_shared_dna_runs(
+        chrom,
+        pos,
+        genotype1,
+        genotype2,
+        genetic_map=get_genetic_map(),
+        one_x_chrom="Male" in [packed1.determine_sex(), packed2.determine_sex()],
+        cM=cM,
+    )
+
+
+def find_shared_dna_from_runs(
+    l,
+    individual1,
+    individual2,
+    runs,
+    cM_threshold=0.75,
+    snp_threshold=1100,
+    shared_genes=False,
+    save_output=True,
+):
+    """ Find the shared DNA between two individuals from their runs of matching SNPs.
+
+    Parameters
+    ----------
+    l : Lineage
+    individual1 : Individual
+        `lineage` ``Individual``; used to name outputs
+    individual2 : Individual
+        `lineage` ``Individual``; used to name outputs
+    runs : dict
+        runs returned by `find_shared_dna_runs` or `find_packed_shared_dna_runs`
+    cM_threshold : float
+        minimum centiMorgans for each shared DNA segment
+    snp_threshold : int
+        minimum SNPs for each shared DNA segment
+    shared_genes : bool
+        determine shared genes
+    save_output : bool
+        specifies whether to save output files in the output directory
+
+    Returns
+    -------
+    tuple
+        see `find_shared_dna`
+    """
+    one_chrom_shared_dna, two_chrom_shared_dna = get_shared_dna(
+        runs, cM_threshold, snp_threshold
+    )
+
+    return _get_shared_dna_results(
+        l,
+        individual1,
+        individual2,
+        one_chrom_shared_dna,
+        two_chrom_shared_dna,
+        shared_genes,
+        save_output,
+    )
+
+
+def find_shared_dna(
+    l,
+    individual1,
+    individual2,
+    cM_threshold=0.75,
+    snp_threshold=1100,
+    shared_genes=False,
+    save_output=True,
+    genetic_positions=None,
+):
+    """ Find the shared DNA between two individuals.
+
+    Drop-in replacement for `Lineage.find_shared_dna`; see that method for details.
+
+    Parameters
+    ----------
+    l : Lineage
+    individual1 : Individual
+    individual2 : Individual
+    cM_threshold : float
+        minimum centiMorgans for each shared DNA segment
+    snp_threshold : int
+        minimum SNPs for each shared DNA segment
+    shared_genes : bool
+        determine shared genes
+    save_output : bool
+        specifies whether to save output files in the output directory
+    genetic_positions : numpy.ndarray
+        genetic positions of `individual1`'s SNPs in GRCh37 (see
+        `compute_genetic_positions`); if specified, cMs aren't interpolated for each run
+
+    Returns
+    -------
+    one_chrom_shared_dna : pandas.DataFrame
+        segments of shared DNA on one chromosome
+    two_chrom_shared_dna : pandas.DataFrame
+        segments of shared DNA on two chromosomes
+    one_chrom_shared_genes : pandas.DataFrame
+        shared genes on one chromosome
+    two_chrom_shared_genes : pandas.DataFrame
+        shared genes on two chromosomes
+    """
+    runs = find_shared_dna_runs(
+        l, individual1, individual2, genetic_positions=genetic_positions
+    )
+
+    return find_shared_dna_from_runs(
+        l,
+        individual1,
+        individual2,
+        runs,
+        cM_threshold=cM_threshold,
+        snp_threshold=snp_threshold,
+        shared_genes=shared_genes,
+        save_output=save_output,
+    )
+
+
+def find_packed_shared_dna(
+    l,
+    individual1,
+    individual2,
+    packed1,
+    packed2,
+    cM_threshold=0.75,
+    snp_threshold=1100,
+    shared_genes=False,
+    save_output=True,
+):
+    """ Find the shared DNA between two individuals with packed genotypes.
+
+    This computes the same results as `find_shared_dna`; see `find_packed_shared_dna_runs`.
+
+    Parameters
+    ----------
+    l : Lineage
+    individual1 : Individual
+        `lineage` ``Individual`` without SNPs; used to name outputs
+    individual2 : Individual
+        `lineage` ``Individual`` without SNPs; used to name outputs
+    packed1 : PackedGenotypes
+        genotypes of `individual1`
+    packed2 : PackedGenotypes
+        genotypes of `individual2`
+    cM_threshold : float
+        minimum centiMorgans for each shared DNA segment
+    snp_threshold : int
+        minimum SNPs for each shared DNA segment
+    shared_genes : bool
+        determine shared genes
+    save_output : bool
+        specifies whether to save output files in the output directory
+
+    Returns
+    -------
+    tuple
+        see `find_shared_dna`
+    """
+    runs = find_packed_shared_dna_runs(l, individual1, individual2, packed1, packed2)
+
+    return find_shared_dna_from_runs(
+        l,
+        individual1,
+        individual2,
+        runs,
+        cM_threshold=cM_threshold,
+        snp_threshold=snp_threshold,
+        shared_genes=shared_genes,
+        save_output=save_output,
+    )
+
+
+def _get_shared_dna_results(
+    l,
+    individual1,
+    individual2,
+    one_chrom_shared_dna,
+    two_chrom_shared_dna,
+    shared_genes,
+    save_output,
+):
+    one_chrom_shared_genes = pd.DataFrame()
+    two_chrom_shared_genes = pd.DataFrame()
+
+    one_chrom_shared_dna = l._convert_shared_dna_list_to_df(one_chrom_shared_dna)
+    two_chrom_shared_dna = l._convert_shared_dna_list_to_df(two_chrom_shared_dna)
+
+    if shared_genes:
+        genes, gene_index = get_genes()
+        one_chrom_shared_genes = compute_shared_genes(
+            one_chrom_shared_dna, genes, gene_index
+        )
+        two_chrom_shared_genes = compute_shared_genes(
+            two_chrom_shared_dna, genes, gene_index
+        )
+
+    if save_output:
+        l._find_shared_dna_output_helper(
+            individual1,
+            individual2,
+            one_chrom_shared_dna,
+            two_chrom_shared_dna,
+            one_chrom_shared_genes,
+            two_chrom_shared_genes,
+        )
+
+    return (
+        one_chrom_shared_dna,
+        two_chrom_shared_dna,
+        one_chrom_shared_genes,
+        two_chrom_shared_genes,
+    )
@@ -0,0 +1,106 @@
+""" Index of gene annotations for finding the genes transcribed from shared DNA segments.
+
+Genes are indexed per chromosome by transcription start position, so the genes of a segment are
+found with binary searches instead of by filtering the full gene annotation table.
+"""
+
+import numpy as np
+import pandas as pd
+
+GENE_COLUMNS = [
+    "geneSymbol",
+    "chrom",
+    "strand",
+    "txStart",
+    "txEnd",
+    "refseq",
+    "proteinID",
+    "description",
+]
+
+
+def build_gene_index(genes):
+    """ Build an index of genes per chromosome.
+
+    Parameters
+    ----------
+    genes : pandas.DataFrame
+        gene annotations with `chrom`, `txStart`, and `txEnd` columns
+
+    Returns
+    -------
+    dict
+        chromosome to (transcription starts, transcription ends, rows) arrays, sorted by
+        transcription start; rows are the positions of the genes in `genes`
+    """
+    gene_index = {}
+
+    codes, chroms = pd.factorize(genes["chrom"])
+    tx_start = genes["txStart"].values.astype(np.int64)
+    tx_end = genes["txEnd"].values.astype(np.int64)
+
+    for code, chrom in enumerate(chroms):
+        rows = np.flatnonzero(codes == code)
+        rows = rows[np.argsort(tx_start[rows], kind="mergesort")]
+        gene_index[chrom] = (tx_start[rows], tx_end[rows], rows)
+
+    return gene_index
+
+
+def find_segment_genes(gene_index, chrom, start, end):
+    """ Find the genes transcribed from a segment.
+
+    Parameters
+    ----------
+    gene_index : dict
+        index returned by `build_gene_index`
+    chrom : str
+    start : int
+    end : int
+
+    Returns
+    -------
+    numpy.ndarray
+        positions of the genes in the indexed gene annotations, in order
+    """
+    if chrom not in gene_index:
+        return np.zeros(0, dtype=np.intp)
+
+    tx_start, tx_end, rows = gene_index[chrom]
+
+    # genes transcribed from the segment start and end in the segment
+    lo = np.searchsorted(tx_start, start, side="left")
+    hi = np.searchsorted(tx_start, end, side="right")
+
+    return np.sort(rows[lo:hi][tx_end[lo:hi] <= end])
+
+
+def compute_shared_genes(shared_dna, genes, gene_index):
+    """ Determine the genes transcribed from segments of shared DNA.
+
+    This is equivalent to `Lineage._compute_shared_genes`.
+
+    Parameters
+    ----------
+    shared_dna : pandas.DataFrame
+        segments of shared DNA
+    genes : pandas.DataFrame
+        gene annotations (see `GENE_COLUMNS`)
+    gene_index : dict
+        index of `genes` returned by `build_gene_index`
+
+    Returns
+    -------
+    pandas.DataFrame
+        shared genes
+    """
+    rows = [
+        find_segment_genes(gene_index, segment.chrom, segment.start, segment.end)
+        for segment in shared_dna.itertuples()
+    ]
+    rows = [r for r in rows if len(r) > 0]
+
+    if len(rows) == 0:
+        return pd.DataFrame()
+
+    return genes.iloc[np.concatenate(rows)][sorted(GENE_COLUMNS)]
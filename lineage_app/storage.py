@@ -13,10 +13,45 @@
 # You should have received a copy of the GNU General Public License
 # along with this program; if not, see <http://www.gnu.org/licenses/>.
 
+import hashlib
+import os
+from uuid import uuid4
+
 from django.conf import settings
 from django.core.files.storage import FileSystemStorage
 from django.utils.deconstruct import deconstructible
 
+from .memo import get_sha256
+
+# directory in `BLOBS_DIR` of the blob of each file, by name
+NAMES_DIR = "names"
+
+
+def stage_file(src, dst):
+    """ Stage a file under another name without copying it.
+
+    The file is hardlinked, or symlinked if `dst` is on another filesystem, so it's read in
+    place. Staged files must not be modified.
+
+    Parameters
+    ----------
+    src : str
+        path to file
+    dst : str
+        path to staged file
+
+    Returns
+    -------
+    str
+        `dst`
+    """
+    try:
+        os.link(src, dst)
+    except OSError:
+        os.symlink(os.path.abspath(src), dst)
+
+    return dst
+
 
 # https://github.com/translate/pootle/commit/8ff2463f0b1f1771595334df9ff9f7ba4ec33ae5
 @deconstructible
@@ -25,6 +60,14 @@ class SendFileFileSystemStorage(FileSystemStorage):
     uploads headed to `MEDIA_ROOT`.
 
     Subclassing necessary to avoid messing up with migrations.
+
+    Files are deduplicated by content: the bytes of a file are stored once as a blob in
+    `BLOBS_DIR`, named by SHA-256, and each file with those bytes is a hardlink to the blob.
+    Files keep their names, so they're served as before. Each file linked to a blob is recorded
+    as a reference of the blob; a blob is removed when the last file referencing it is deleted.
+    References are counted explicitly, since blobs are also linked outside of the storage
+    (e.g., by memoized results and staged files). The blob of each file is also recorded by
+    name, so files are deleted without hashing them again.
     """
 
     def __init__(self, **kwargs):
@@ -32,3 +75,248 @@ class SendFileFileSystemStorage(FileSystemStorage):
             {"location": settings.SENDFILE_ROOT, "file_permissions_mode": 0o640}
         )
         super(SendFileFileSystemStorage, self).__init__(**kwargs)
+
+    def _save(self, name, content):
+        name = super(SendFileFileSystemStorage, self)._save(name, content)
+        self.dedupe(name)
+        return name
+
+    def get_blob_path(self, sha256):
+        return os.path.join(self.location, settings.BLOBS_DIR, sha256[:2], sha256)
+
+    def get_refs_path(self, blob_path):
+        return blob_path + ".refs"
+
+    def _get_ref_path(self, blob_path, name):
+        return os.path.join(
+            self.get_refs_path(blob_path),
+            hashlib.sha256(name.encode("utf-8")).hexdigest(),
+        )
+
+    def _get_name_path(self, name):
+        h = hashlib.sha256(name.encode("utf-8")).hexdigest()
+        return os.path.join(self.location, settings.BLOBS_DIR, NAMES_DIR, h[:2], h)
+
+    def get_blob_of(self, name):
+        """ Get the path to the blob that a file was linked to, or None if it wasn't. """
+        try:
+            with open(self._get_name_path(name), "r") as f:
+                sha256 = f.readline().strip()
+        except OSError:
+            return None
+
+        return self.get_blob_path(sha256) if sha256 else None
+
+    def _set_blob_of(self, name, sha256):
+        path = self._get_name_path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        temp = "{}.{}.tmp".format(path, uuid4().hex)
+        with open(temp, "w") as f:
+            f.write("{}\n{}".format(sha256, name))
+        os.replace(temp, path)
+
+    def _remove_blob_of(self, name):
+        try:
+            os.remove(self._get_name_path(name))
+        except FileNotFoundError:
+            pass
+
+    def add_ref(self, blob_path, name):
+        """ Record a file as a reference of a blob. """
+        os.makedirs(self.get_refs_path(blob_path), exist_ok=True)
+        with open(self._get_ref_path(blob_path, name), "w") as f:
+            f.write(name)
+
+    def remove_ref(self, blob_path, name):
+        """ Remove a reference of a blob, and the blob if it's no longer referenced. """
+        try:
+            os.remove(self._get_ref_path(blob_path, name))
+        except FileNotFoundError:
+            pass
+
+        self.collect_blob(blob_path, verify=False)
+
+    def dedupe(self, name):
+        """ Replace a file, or the files in a directory, with links to blobs.
+
+        Files that can't be linked (e.g., if `BLOBS_DIR` is on another filesystem) are left
+        as they are.
+
+        Parameters
+        ----------
+        name : str
+            name of file or directory
+        """
+        path = self.path(name)
+
+        if os.path.isdir(path):
+            for entry in os.listdir(path):
+                self.dedupe(os.path.join(name, entry))
+            return
+
+        try:
+            sha256 = get_sha256(path)
+            blob_path = self.get_blob_path(sha256)
+            old_blob_path = self.get_blob_of(name)
+
+            # referenced before linking, so the blob isn't collected in between
+            self.add_ref(blob_path, name)
+            self._set_blob_of(name, sha256)
+
+            if old_blob_path is not None and old_blob_path != blob_path:
+                # the file was replaced since it was deduplicated
+                self.remove_ref(old_blob_path, name)
+
+            if not os.path.exists(blob_path):
+                try:
+                    # the file becomes the blob
+                    os.link(path, blob_path)
+                    return
+                except FileExistsError:
+                    pass
+
+            if os.path.samefile(path, blob_path):
+                return
+
+            # replace the file atomically
+            temp = "{}.{}.tmp".format(path, uuid4().hex)
+            os.link(blob_path, temp)
+            os.replace(temp, path)
+        except OSError:
+            pass
+
+    def delete(self, name):
+        """ Delete a file or directory of files, and blobs no longer referenced. """
+        assert name, "The name argument is not allowed to be empty."
+        path = self.path(name)
+
+        if os.path.isdir(path):
+            for entry in os.listdir(path):
+                self.delete(os.path.join(name, entry))
+
+        blob_path = self.get_blob_of(name)
+
+        super(SendFileFileSystemStorage, self).delete(name)
+
+        if blob_path is not None:
+            self.remove_ref(blob_path, name)
+            self._remove_blob_of(name)
+
+    def _is_ref(self, blob_path, ref_path):
+        """ Check that a reference of a blob is a file linked to the blob. """
+        try:
+            with open(ref_path, "r") as f:
+                name = f.read()
+            return os.path.samefile(self.path(name), blob_path)
+        except (OSError, ValueError):
+            return False
+
+    def collect_blob(self, blob_path, verify=True):
+        """ Remove a blob if no files reference it.
+
+        Parameters
+        ----------
+        blob_path : str
+        verify : bool
+            remove references that aren't files linked to the blob (e.g., files that were
+            replaced without the storage) before counting them
+
+        Returns
+        -------
+        bool
+            True if the blob was removed
+        """
+        refs_path = self.get_refs_path(blob_path)
+
+        try:
+            refs = os.listdir(refs_path)
+        except FileNotFoundError:
+            refs = []
+
+        referenced = False
+        for ref in refs:
+            ref_path = os.path.join(refs_path, ref)
+            if verify and not self._is_ref(blob_path, ref_path):
+                try:
+                    os.remove(ref_path)
+                except FileNotFoundError:
+                    pass
+            elif verify:
+                # keep verifying, so stale references don't keep the blob later
+                referenced = True
+            else:
+                return False
+
+        if referenced:
+            return False
+
+        try:
+            os.remove(blob_path)
+            removed = True
+        except FileNotFoundError:
+            removed = False
+
+        try:
+            os.rmdir(refs_path)
+        except OSError:
+            # a file referenced the blob in the meantime
+            pass
+
+        return removed
+
+    def collect_blobs(self):
+        """ Remove blobs that no files reference.
+
+        References are verified, so blobs of files that were replaced or removed without the
+        storage are removed too.
+
+        Returns
+        -------
+        int
+            number of blobs removed
+        """
+        blobs_dir = os.path.join(self.location, settings.BLOBS_DIR)
+        if not os.path.exists(blobs_dir):
+            return 0
+
+        self._collect_names()
+
+        count = 0
+        for prefix in os.listdir(blobs_dir):
+            if prefix == NAMES_DIR:
+                continue
+
+            prefix_dir = os.path.join(blobs_dir, prefix)
+            for entry in os.listdir(prefix_dir):
+                if entry.endswith(".refs"):
+                    blob_path = os.path.join(prefix_dir, entry[: -len(".refs")])
+                    if not os.path.exists(blob_path):
+                        # references of a blob removed without the storage
+                        self.collect_blob(blob_path)
+                elif self.collect_blob(os.path.join(prefix_dir, entry)):
+                    count += 1
+
+        return count
+
+    def _collect_names(self):
+        """ Remove the recorded blobs of files that were removed without the storage. """
+        names_dir = os.path.join(self.location, settings.BLOBS_DIR, NAMES_DIR)
+        if not os.path.exists(names_dir):
+            return
+
+        for prefix in os.listdir(names_dir):
+            prefix_dir = os.path.join(names_dir, prefix)
+            for entry in os.listdir(prefix_dir):
+                path = os.path.join(prefix_dir, entry)
+                try:
+                    with open(path, "r") as f:
+                        name = f.read().split("\n", 1)[1]
+                except (OSError, IndexError):
+                    continue
+
+                if not os.path.exists(self.path(name)):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
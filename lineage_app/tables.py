@@ -1,5 +1,8 @@
 import django_tables2 as tables
+from django_tables2.data import TableData
+
 from .models import SharedDnaGenes, DiscordantSnps
+from .segments import get_segments, load_segments
 
 
 class SharedDnaGenesTable(tables.Table):
@@ -31,6 +34,33 @@ class SharedDnaGenesTable(tables.Table):
         template_name = "django_tables2/bootstrap4.html"
 
 
+class SegmentsTableData(TableData):
+    """ Table data for segments saved with `save_segments`.
+
+    Only the segments of the requested page are read, in the order of the first order by alias.
+    """
+
+    def __init__(self, path):
+        super().__init__(load_segments(path))
+        self._order_by = None
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, _ = key.indices(len(self))
+            return get_segments(self.data, start, stop, self._order_by)
+
+        return get_segments(self.data, key, key + 1, self._order_by)[0]
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def order_by(self, aliases):
+        self._order_by = str(aliases[0]) if aliases else None
+
+
 class SharedDnaTable(tables.Table):
     segment_col = tables.Column(verbose_name="Seg")
     chrom = tables.Column(verbose_name="Chrom")
@@ -1,19 +1,113 @@
 import logging
 
 from celery import shared_task
+from celery.signals import worker_init, worker_process_init
 from celery_progress.backend import ProgressRecorder
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
 
-from .models import Snps, SharedDnaGenes, DiscordantSnps
+from . import batch
+from .models import Individual, Snps, SharedDnaGenes, DiscordantSnps, update_user_cohort
+from .resources import load_resources
+
+User = get_user_model()
 
 logger = logging.getLogger(__name__)
 
 
+@worker_init.connect
+@worker_process_init.connect
+def setup_resources(**kwargs):
+    # resources are loaded before worker processes are forked if possible, so that worker
+    # processes share them; otherwise, they're loaded once by each worker process
+    try:
+        load_resources()
+    except Exception as err:
+        logger.error(err)
+
+
 @shared_task(bind=True)
 def setup_snps(self, snps_id):
     progress_recorder = ProgressRecorder(self)
     snps = Snps.objects.get(id=snps_id)
     snps.setup(progress_recorder=progress_recorder)
 
+    if snps.setup_complete:
+        schedule_merge(snps.individual)
+        update_cohort.delay(snps.user_id)
+
+
+def schedule_merge(individual):
+    """ Request a merge of an individual's SNPs files after `MERGE_DELAY` seconds.
+
+    Requests made within the delay, or while a merge is in progress, are coalesced into one
+    merge of the final set of files.
+    """
+    merge_snps.apply_async(
+        (str(individual.pk), individual.request_merge()), countdown=settings.MERGE_DELAY
+    )
+
+
+# setups and merges are bounded by the task time limit, so waiting for them is too
+@shared_task(bind=True, max_retries=100)
+def merge_snps(self, individual_id, merge_request_id):
+    try:
+        individual = Individual.objects.get(pk=individual_id)
+    except Individual.DoesNotExist:
+        return
+
+    if not individual.merge_is_requested(merge_request_id):
+        # superseded by a later request
+        return
+
+    if individual.loading_snps() or not individual.start_merge(merge_request_id):
+        # wait for uploaded files to be set up, or for the merge in progress to finish
+        raise self.retry(countdown=settings.MERGE_DELAY)
+
+    try:
+        individual.merge_snps()
+    finally:
+        individual.finish_merge()
+
+    update_cohort.delay(individual.user_id)
+
+
+def get_remap_lock_key(snps_id, build):
+    """ Get the cache key of the lock held while a remap of SNPs is queued or running. """
+    return "remap_snps_{}_{}".format(snps_id, build)
+
+
+def schedule_remap(snps, build):
+    """ Request a remap of merged SNPs to another build, unless one is already requested. """
+    if cache.add(
+        get_remap_lock_key(snps.id, build), True, settings.CELERYD_TASK_TIME_LIMIT
+    ):
+        remap_snps.delay(snps.id, build)
+
+
+@shared_task
+def remap_snps(snps_id, build):
+    """ Remap merged SNPs to another build, so they can be downloaded from the cache. """
+    try:
+        snps = Snps.objects.get(id=snps_id)
+        snps.get_remapped_files([build])
+    except Snps.DoesNotExist:
+        pass
+    finally:
+        cache.delete(get_remap_lock_key(snps_id, build))
+
+
+@shared_task
+def update_cohort(user_id):
+    """ Update a user's cohort after their individuals' SNPs change. """
+    try:
+        user = User.objects.get(id=user_id)
+    except User.DoesNotExist:
+        return
+
+    update_user_cohort(user)
+
 
 @shared_task(bind=True)
 def find_shared_dna_genes(self, shared_dna_genes_id):
@@ -22,6 +116,26 @@ def find_shared_dna_genes(self, shared_dna_genes_id):
     shared_dna_genes.find_shared_dna_genes(progress_recorder=progress_recorder)
 
 
+# the soft time limit leaves time to clean up before the task is killed
+@shared_task(bind=True, soft_time_limit=settings.CELERYD_TASK_TIME_LIMIT - 30)
+def find_all_shared_dna_genes(self, shared_dna_genes_ids):
+    progress_recorder = ProgressRecorder(self)
+    shared_dna_genes_all = list(
+        SharedDnaGenes.objects.filter(id__in=shared_dna_genes_ids).order_by("id")
+    )
+
+    try:
+        batch.find_all_shared_dna_genes(
+            shared_dna_genes_all, progress_recorder=progress_recorder
+        )
+    finally:
+        # pairs that weren't compared (e.g., the task timed out) can be submitted again
+        for shared_dna_genes in SharedDnaGenes.objects.filter(
+            id__in=shared_dna_genes_ids, setup_complete=False
+        ):
+            shared_dna_genes.delete()
+
+
 @shared_task(bind=True)
 def find_discordant_snps(self, discordant_snps_id):
     progress_recorder = ProgressRecorder(self)
@@ -0,0 +1,214 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+import numpy as np
+import pandas as pd
+
+from lineage_app.genotypes import save_genotypes
+from lineage_app.packed import load_packed_genotypes
+from lineage_app.resources import get_genetic_map, get_lineage
+from lineage_app.shared_dna import (
+    compute_genetic_positions,
+    find_packed_shared_dna,
+    find_shared_dna,
+)
+
+# SNPs per chromosome, so individuals have as many SNPs as a genotyping array
+SNPS_PER_CHROM = 30000
+CHROMS = [str(c) for c in range(1, 23)] + ["X"]
+
+# probability of a crossover between adjacent SNPs
+CROSSOVER_RATE = 1 / 3000
+
+# a synthetic genetic map, so the test doesn't depend on (or download) resources
+RESOURCES_DIR = os.path.join(os.path.dirname(__file__), "resources")
+
+
+def _make_sites(rng):
+    chrom = np.repeat(CHROMS, SNPS_PER_CHROM)
+    pos = np.concatenate(
+        [
+            np.sort(
+                rng.choice(np.arange(100000, 150000000), SNPS_PER_CHROM, replace=False)
+            )
+            for _ in CHROMS
+        ]
+    )
+    alleles = np.array(list("ACGT"))
+    ref = rng.integers(4, size=len(pos))
+    alt = (ref + rng.integers(1, 4, size=len(pos))) % 4
+    freq = rng.uniform(0.05, 0.5, size=len(pos))
+
+    return chrom, pos, alleles[ref], alleles[alt], freq
+
+
+def _make_haplotypes(rng, sites):
+    _, _, ref, alt, freq = sites
+    return [np.where(rng.random(len(ref)) < freq, alt, ref) for _ in range(2)]
+
+
+def _transmit(rng, sites, haplotypes):
+    """ Transmit one haplotype from a parent, with crossovers. """
+    chrom = sites[0]
+    switch = rng.random(len(chrom)) < CROSSOVER_RATE
+    # the haplotype transmitted is chosen at random at the start of each chromosome
+    first = np.r_[True, chrom[1:] != chrom[:-1]]
+    switch[first] = rng.random(first.sum()) < 0.5
+    # crossovers are counted per chromosome
+    which = np.cumsum(switch) % 2
+    return np.where(which == 0, haplotypes[0], haplotypes[1])
+
+
+def _write_raw_data(rng, path, sites, haplotypes, male):
+    chrom, pos = sites[:2]
+    genotype = np.char.add(haplotypes[0], haplotypes[1])
+    if male:
+        x = chrom == "X"
+        genotype[x] = haplotypes[0][x]
+    genotype[rng.random(len(genotype)) < 0.01] = "--"
+
+    with open(path, "w") as f:
+        f.write("# This data file generated by 23andMe at: Thu Jan 01 00:00:00 2015\n")
+        f.write("# rsid\tchromosome\tposition\tgenotype\n")
+        pd.DataFrame(
+            {
+                "rsid": ["rs{}".format(i) for i in range(1, len(pos) + 1)],
+                "chrom": chrom,
+                "pos": pos,
+                "genotype": genotype,
+            }
+        ).to_csv(f, sep="\t", header=False, index=False)
+
+
+@override_settings(LINEAGE_RESOURCES_DIR=RESOURCES_DIR)
+class SharedDnaTestCase(SimpleTestCase):
+    """ Compare the shared DNA engine with `Lineage.find_shared_dna` on a family. """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        # resources are cached by the process, so they're loaded from the test's resources
+        cls.resources_patcher = mock.patch.multiple(
+            "lineage_app.resources", _resources=None, _genetic_map=None
+        )
+        cls.resources_patcher.start()
+
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.l = get_lineage(cls.tmpdir)
+
+        rng = np.random.default_rng(0)
+        sites = _make_sites(rng)
+
+        father = _make_haplotypes(rng, sites)
+        mother = _make_haplotypes(rng, sites)
+        unrelated = _make_haplotypes(rng, sites)
+        # the son's X is from the mother
+        son = [_transmit(rng, sites, mother), _transmit(rng, sites, father)]
+        daughter = [_transmit(rng, sites, mother), _transmit(rng, sites, father)]
+
+        cls.individuals = {}
+        cls.packed = {}
+        for name, haplotypes, male in [
+            ("father", father, True),
+            ("mother", mother, False),
+            ("son", son, True),
+            ("daughter", daughter, False),
+            ("unrelated", unrelated, True),
+        ]:
+            path = os.path.join(cls.tmpdir, name + ".txt")
+            _write_raw_data(rng, path, sites, haplotypes, male)
+
+            ind = cls.l.create_individual(name, path)
+            cls.individuals[name] = ind
+
+            genotypes_path = os.path.join(cls.tmpdir, name)
+            save_genotypes(
+                ind.snps,
+                genotypes_path,
+                cM=compute_genetic_positions(
+                    ind.snps["chrom"].values, ind.snps["pos"].values, get_genetic_map()
+                ),
+            )
+            cls.packed[name] = load_packed_genotypes(genotypes_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir, ignore_errors=True)
+        cls.resources_patcher.stop()
+        super().tearDownClass()
+
+    def assert_shared_dna_equal(self, expected, actual, check_exact=True):
+        for df1, df2 in zip(expected, actual):
+            pd.testing.assert_frame_equal(df1, df2, check_exact=check_exact)
+            self.assertEqual(df1.index.name, df2.index.name)
+
+    def compare(self, name1, name2, cM_threshold=0.75, snp_threshold=1100):
+        ind1 = self.individuals[name1]
+        ind2 = self.individuals[name2]
+
+        expected = self.l.find_shared_dna(
+            ind1,
+            ind2,
+            cM_threshold=cM_threshold,
+            snp_threshold=snp_threshold,
+            shared_genes=False,
+            save_output=False,
+        )
+
+        self.assert_shared_dna_equal(
+            expected,
+            find_shared_dna(
+                self.l,
+                ind1,
+                ind2,
+                cM_threshold=cM_threshold,
+                snp_threshold=snp_threshold,
+                shared_genes=False,
+                save_output=False,
+            ),
+        )
+
+        # genetic positions are precomputed, so cMs are summed in a different order
+        self.assert_shared_dna_equal(
+            expected,
+            find_packed_shared_dna(
+                self.l,
+                self.l.create_individual(name1),
+                self.l.create_individual(name2),
+                self.packed[name1],
+                self.packed[name2],
+                cM_threshold=cM_threshold,
+                snp_threshold=snp_threshold,
+                shared_genes=False,
+                save_output=False,
+            ),
+            check_exact=False,
+        )
+
+        return expected
+
+    def test_male_pair(self):
+        self.assertTrue(self.l._is_one_individual_male([self.individuals["father"]]))
+
+        one_chrom_shared_dna, two_chrom_shared_dna, _, _ = self.compare("father", "son")
+        self.assertTrue(len(one_chrom_shared_dna))
+        self.assertNotIn("X", set(two_chrom_shared_dna["chrom"]))
+
+    def test_one_x_chrom(self):
+        one_chrom_shared_dna, _, _, _ = self.compare("mother", "son")
+        self.assertIn("X", set(one_chrom_shared_dna["chrom"]))
+
+    def test_siblings(self):
+        _, two_chrom_shared_dna, _, _ = self.compare("son", "daughter")
+        self.assertTrue(len(two_chrom_shared_dna))
+
+    def test_unrelated(self):
+        self.compare("father", "unrelated")
+
+    def test_thresholds(self):
+        self.compare("father", "son", cM_threshold=3, snp_threshold=300)
+        self.compare("son", "daughter", cM_threshold=7, snp_threshold=700)
@@ -37,6 +37,11 @@ urlpatterns = [
     path("individuals/add/", views.add_individual, name="add_individual"),
     path("individuals/upload/<uuid:uuid>", views.upload_snps, name="upload_snps"),
     path("snps/download/<uuid:uuid>", views.download_snps, name="download_snps"),
+    path(
+        "snps/download/<uuid:uuid>/<int:build>",
+        views.download_snps,
+        name="download_snps_build",
+    ),
     path("snps/delete/<uuid:uuid>", views.delete_snps, name="delete_snps"),
     path(
         "discrepant-snps/download/<uuid:uuid>",
@@ -44,6 +49,11 @@ urlpatterns = [
         name="download_discrepant_snps",
     ),
     path("shared-dna-genes/", views.shared_dna_genes, name="shared_dna_genes"),
+    path(
+        "shared-dna-genes/all-pairs/",
+        views.shared_dna_genes_all_pairs,
+        name="shared_dna_genes_all_pairs",
+    ),
     path(
         "shared-dna-genes/delete/<uuid:uuid>",
         views.delete_shared_dna_genes,
@@ -90,6 +100,7 @@ urlpatterns = [
         views.download_discordant_snps,
         name="download_discordant_snps",
     ),
+    path("relatedness/", views.relatedness, name="relatedness"),
     path(
         "ajax/load-individual2/",
         views.load_individual2_dropdown,
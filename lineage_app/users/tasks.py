@@ -1,13 +1,15 @@
 import logging
-import os
-import shutil
 
 from celery import shared_task
 from celery_progress.backend import ProgressRecorder
-from django.conf import settings
 from django.contrib.auth import get_user_model
 
+from lineage_app.builds import delete_remapped_snps
+from lineage_app.cohort import delete_cohort
 from lineage_app.helpers import setup_oh_individual
+from lineage_app.memo import delete_memo
+from lineage_app.models import get_relative_user_dir, sendfile_storage
+from lineage_app.tasks import update_cohort
 
 User = get_user_model()
 
@@ -23,6 +25,7 @@ def setup_user(self, user_id):
     individual = user.individuals.create(name="Me", openhumans_individual=True)
     try:
         setup_oh_individual(individual.pk, progress_recorder)
+        update_cohort.delay(user.id)
     except Exception as err:
         logging.error(err)
         user.setup_complete = True
@@ -33,8 +36,12 @@ def setup_user(self, user_id):
 def delete_user(user_id):
     user = User.objects.get(id=user_id)
 
-    user_dir = os.path.join(settings.SENDFILE_ROOT, "users", str(user.uuid))
-    if os.path.exists(user_dir):
-        shutil.rmtree(user_dir)
+    for snps in user.snps.filter(generated_by_lineage=True):
+        delete_remapped_snps(snps.sha256)
+
+    delete_memo(user.uuid)
+    # also removes blobs only referenced by the user's files
+    sendfile_storage.delete(get_relative_user_dir(user.uuid))
+    delete_cohort(user.uuid)
 
     user.delete()
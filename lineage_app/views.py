@@ -1,3 +1,4 @@
+from itertools import combinations
 import logging
 import time
 
@@ -12,11 +13,35 @@ from django.urls import reverse
 from sendfile import sendfile
 from django_tables2 import RequestConfig
 
-from .forms import IndividualForm, SnpsForm, SharedDnaGenesForm, DiscordantSnpsForm
-from .helpers import get_all_individuals_context, shared_dna_genes_calc_exists
+from .builds import REMAPPED_BUILDS, get_cached_remapped_snps
+from .forms import (
+    AllPairsSharedDnaGenesForm,
+    IndividualForm,
+    SnpsForm,
+    SharedDnaGenesForm,
+    DiscordantSnpsForm,
+)
+from .helpers import (
+    get_all_individuals_context,
+    get_relatedness_context,
+    shared_dna_genes_calc_exists,
+)
 from .models import Individual, Snps, DiscrepantSnps, SharedDnaGenes, DiscordantSnps
-from .tasks import setup_snps, find_shared_dna_genes, find_discordant_snps
-from .tables import SharedDnaGenesTable, SharedDnaTable, DiscordantSnpsTable
+from .tasks import (
+    find_all_shared_dna_genes,
+    find_discordant_snps,
+    find_shared_dna_genes,
+    schedule_merge,
+    schedule_remap,
+    setup_snps,
+    update_cohort,
+)
+from .tables import (
+    SegmentsTableData,
+    SharedDnaGenesTable,
+    SharedDnaTable,
+    DiscordantSnpsTable,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -26,17 +51,38 @@ def robots(request):
 
 
 @login_required
-def download_snps(request, uuid):
+def download_snps(request, uuid, build=None):
     try:
         snps = request.user.snps.get(uuid=uuid)
     except Snps.DoesNotExist:
         raise Http404
 
+    if build is None or build == snps.build:
+        path = snps.file.path
+    elif snps.generated_by_lineage and build in REMAPPED_BUILDS:
+        # merged SNPs are remapped to other builds on demand, in a task
+        path = get_cached_remapped_snps(snps.get_sha256(), build)
+
+        if path is None:
+            transaction.on_commit(lambda: schedule_remap(snps, build))
+            messages.add_message(
+                request,
+                messages.INFO,
+                "SNPs are being prepared for download; please try again in a few "
+                "minutes.",
+            )
+            return redirect("individuals")
+    else:
+        path = None
+
+    if path is None:
+        raise Http404
+
     return sendfile(
         request,
-        snps.file.path,
+        path,
         attachment=True,
-        attachment_filename=snps.get_filename(),
+        attachment_filename=snps.get_filename(build=build),
     )
 
 
@@ -103,7 +149,14 @@ def delete_snps(request, uuid):
     if request.method == "POST":
         try:
             snps = request.user.snps.get(uuid=uuid)
+            individual = snps.individual
             snps.delete()
+
+            if individual.snps.filter(generated_by_lineage=False).exists():
+                # merge the remaining files
+                schedule_merge(individual)
+
+            update_cohort.delay(request.user.id)
         except Snps.DoesNotExist:
             raise Http404
 
@@ -116,6 +169,7 @@ def delete_individual(request, uuid):
         try:
             individual = request.user.individuals.get(pk=uuid)
             individual.delete()
+            update_cohort.delay(request.user.id)
         except Individual.DoesNotExist:
             raise Http404
 
@@ -184,6 +238,8 @@ def shared_dna_genes(request):
                 shared_dna_genes.user = request.user
                 shared_dna_genes.save()
 
+                # results for other thresholds of a compared pair are derived from its
+                # memoized runs by the task, without loading genotypes
                 transaction.on_commit(
                     lambda: find_shared_dna_genes.apply_async(
                         (shared_dna_genes.id,),
@@ -210,6 +266,7 @@ def shared_dna_genes(request):
         "pages/shared_dna_genes.html",
         {
             "form": form,
+            "all_pairs_form": AllPairsSharedDnaGenesForm(),
             "table": table,
             "finding_shared_dna_genes": request.user.shared_dna_genes.filter(
                 setup_complete=False
@@ -218,6 +275,53 @@ def shared_dna_genes(request):
     )
 
 
+@login_required
+def shared_dna_genes_all_pairs(request):
+    if request.method == "POST":
+        form = AllPairsSharedDnaGenesForm(request.POST)
+        if form.is_valid():
+            # individuals without SNPs can't be compared
+            individuals = [
+                individual
+                for individual in request.user.individuals.all().order_by("created_at")
+                if individual.get_canonical_snps()
+            ]
+            shared_dna_genes_ids = []
+
+            for individual1, individual2 in combinations(individuals, 2):
+                d = dict(
+                    form.cleaned_data, individual1=individual1, individual2=individual2
+                )
+                if shared_dna_genes_calc_exists(d):
+                    continue
+
+                shared_dna_genes = SharedDnaGenes(user=request.user, **d)
+                shared_dna_genes.save()
+                shared_dna_genes_ids.append(shared_dna_genes.id)
+
+            if shared_dna_genes_ids:
+                # each task compares a batch of pairs, loading each individual's SNPs once
+                # per batch; batches are sized to finish within the task time limit
+                size = settings.SHARED_DNA_BATCH_SIZE
+
+                def find_batches():
+                    for i in range(0, len(shared_dna_genes_ids), size):
+                        find_all_shared_dna_genes.delay(
+                            shared_dna_genes_ids[i : i + size]
+                        )
+
+                transaction.on_commit(find_batches)
+            else:
+                messages.add_message(
+                    request,
+                    messages.WARNING,
+                    "All pairs of individuals have already been calculated or are "
+                    "being calculated!",
+                )
+
+    return redirect("shared_dna_genes")
+
+
 @login_required
 def shared_dna_genes_details(request, uuid):
     try:
@@ -225,8 +329,10 @@ def shared_dna_genes_details(request, uuid):
     except SharedDnaGenes.DoesNotExist:
         raise Http404
 
-    if shared_dna_genes.shared_dna_one_chrom_pickle:
-        shared_dna_one_chrom = shared_dna_genes.get_shared_dna_one_chrom()
+    if shared_dna_genes.shared_dna_one_chrom_segments:
+        shared_dna_one_chrom = SegmentsTableData(
+            shared_dna_genes.shared_dna_one_chrom_segments.path
+        )
         shared_dna_one_chrom_table = SharedDnaTable(shared_dna_one_chrom, prefix="1-")
         RequestConfig(request, paginate={"per_page": 5}).configure(
             shared_dna_one_chrom_table
@@ -234,8 +340,10 @@ def shared_dna_genes_details(request, uuid):
     else:
         shared_dna_one_chrom_table = None
 
-    if shared_dna_genes.shared_dna_two_chrom_pickle:
-        shared_dna_two_chrom = shared_dna_genes.get_shared_dna_two_chrom()
+    if shared_dna_genes.shared_dna_two_chrom_segments:
+        shared_dna_two_chrom = SegmentsTableData(
+            shared_dna_genes.shared_dna_two_chrom_segments.path
+        )
         shared_dna_two_chrom_table = SharedDnaTable(shared_dna_two_chrom, prefix="2-")
         RequestConfig(request, paginate={"per_page": 5}).configure(
             shared_dna_two_chrom_table
@@ -261,6 +369,10 @@ def shared_dna_plot(request, uuid):
     except SharedDnaGenes.DoesNotExist:
         raise Http404
 
+    # pairs that can't share DNA aren't plotted
+    if not shared_dna_genes.shared_dna_plot_png:
+        raise Http404
+
     return sendfile(request, shared_dna_genes.shared_dna_plot_png.path)
 
 
@@ -405,6 +517,13 @@ def download_discordant_snps(request, uuid):
     )
 
 
+@login_required
+def relatedness(request):
+    return render(
+        request, "pages/relatedness.html", get_relatedness_context(request.user)
+    )
+
+
 @login_required
 def load_individual2_dropdown(request):
     uuid = request.GET.get("uuid")
@@ -0,0 +1,149 @@
+""" Workspaces for tasks, and publishing of task results.
+
+Tasks write their outputs in a workspace, then publish the outputs to `SENDFILE_ROOT`. By
+default, workspaces are made in `WORKSPACE_DIR`, on the same filesystem as `SENDFILE_ROOT`, so
+publishing an output is a rename. If `WORKSPACE_TMPFS_DIR` is set (e.g., to a RAM-backed tmpfs),
+workspaces are made there while its usage is within `WORKSPACE_TMPFS_QUOTA`; outputs are then
+copied next to their destination and renamed. Either way, a published file is never
+half-written.
+"""
+
+import errno
+import os
+import shutil
+import tempfile
+from uuid import uuid4
+
+from django.conf import settings
+
+
+def get_workspace_dir(size=0):
+    """ Get the directory to make a workspace in.
+
+    Parameters
+    ----------
+    size : int
+        estimated bytes written to the workspace
+
+    Returns
+    -------
+    str
+    """
+    tmpfs_dir = settings.WORKSPACE_TMPFS_DIR
+
+    if tmpfs_dir:
+        try:
+            usage = shutil.disk_usage(tmpfs_dir)
+            if (
+                usage.used + size <= settings.WORKSPACE_TMPFS_QUOTA
+                and usage.free >= size
+            ):
+                return tmpfs_dir
+        except OSError:
+            pass
+
+    os.makedirs(settings.WORKSPACE_DIR, exist_ok=True)
+    return settings.WORKSPACE_DIR
+
+
+def workspace(size=0):
+    """ Make a temporary workspace.
+
+    Parameters
+    ----------
+    size : int
+        estimated bytes written to the workspace
+
+    Returns
+    -------
+    tempfile.TemporaryDirectory
+        context manager that returns the path to the workspace and removes it on exit
+    """
+    return tempfile.TemporaryDirectory(dir=get_workspace_dir(size))
+
+
+def get_staged_path(workspace_dir, path):
+    """ Get the path in a workspace to write an output that's published to `path`. """
+    return os.path.join(workspace_dir, os.path.basename(path))
+
+
+def _replace(src, dst):
+    """ Rename `src` to `dst`, replacing any existing file or directory at `dst`. """
+    while True:
+        if not os.path.isdir(dst):
+            try:
+                os.replace(src, dst)
+                return
+            except OSError as err:
+                # a directory was published to `dst` in the meantime
+                if err.errno not in [errno.ENOTEMPTY, errno.EEXIST]:
+                    raise
+                continue
+
+        # a directory can't replace a directory with files, so the existing directory is
+        # renamed aside, and only removed once `src` is in place
+        old = "{}.{}.tmp".format(dst, uuid4().hex)
+        try:
+            os.rename(dst, old)
+        except FileNotFoundError:
+            # renamed aside by a concurrent publish
+            continue
+
+        try:
+            os.rename(src, dst)
+        except OSError as err:
+            if err.errno in [errno.ENOTEMPTY, errno.EEXIST]:
+                shutil.rmtree(old, ignore_errors=True)
+                continue
+
+            try:
+                os.rename(old, dst)
+            except OSError:
+                shutil.rmtree(old, ignore_errors=True)
+            raise
+
+        shutil.rmtree(old, ignore_errors=True)
+        return
+
+
+def publish(src, dst):
+    """ Publish a file or directory atomically, replacing any existing file at `dst`.
+
+    An existing directory at `dst` is replaced with two renames, so `dst` is briefly missing,
+    but is never partially written or partially removed.
+
+    Parameters
+    ----------
+    src : str
+        path to file or directory in a workspace
+    dst : str
+        destination path
+    """
+    try:
+        _replace(src, dst)
+        return
+    except OSError as err:
+        if err.errno != errno.EXDEV:
+            raise
+
+    # `src` is on another filesystem; copy it next to `dst` first
+    temp = "{}.{}.tmp".format(dst, uuid4().hex)
+
+    try:
+        if os.path.isdir(src):
+            shutil.copytree(src, temp)
+        else:
+            shutil.copy2(src, temp)
+
+        _replace(temp, dst)
+    except:
+        if os.path.isdir(temp):
+            shutil.rmtree(temp, ignore_errors=True)
+        elif os.path.exists(temp):
+            os.remove(temp)
+        raise
+
+    if os.path.isdir(src):
+        shutil.rmtree(src)
+    else:
+        os.remove(src)